@@ -0,0 +1,324 @@
+#!/usr/bin/env micropython
+
+# Micro-benchmarks of the drive kinematics hot paths
+#
+# Times the odometry pose update, the speed/degree math of _on_arc(), the
+# _turn() and turn_to_angle() decisions and the chassis unit conversions,
+# runs the same code on the brick (MicroPython) and on a dev box (CPython),
+# appends the results to a JSON history next to this file and flags
+# anything that got slower than the last few runs on the same interpreter
+# by more than the threshold. Every number is the best of several timings,
+# the baseline the median of those bests over the last runs. Nothing is
+# flagged until there are that many runs. A calibration loop that runs
+# none of the repo's code is timed with every run; when it is slower than
+# in the baseline runs, because the machine is busy, the baselines are
+# scaled down by as much. A case that looks slower is only flagged when it
+# is still slower in a few more runs made a little later. Only the first
+# run goes into the history.
+#
+# No motor is moved: MoveTank is swapped for a stand-in while the drive
+# calls are timed, so the numbers are the Python cost of each call without
+# the sysfs writes. Where ev3dev2 is not installed the Sim.py modules stand
+# in for it. The rates include the cost of the timing loop itself, taking
+# an empty loop off made the sub-microsecond cases mostly noise.
+#
+# Usage: micropython Benchmark.py [--quick] [--threshold 0.1] [--history file]
+#
+# Exits with 1 if there was a regression.
+
+import os
+import sys
+import time
+
+try:
+    import json
+except ImportError:
+    import ujson as json
+
+try:
+    import ev3dev2.motor
+except ImportError:
+    import Sim
+    sys.modules.update(Sim.modules())
+
+import Chassis
+import Odometry
+from Kinematics import PoseIntegrator, MODES
+from ev3dev2.motor import OUTPUT_B, OUTPUT_C
+from ev3dev2.wheel import EV3EducationSetTire
+
+try:
+    HISTORY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_history.json')
+except AttributeError:
+    # MicroPython without os.path
+    HISTORY_PATH = __file__.rsplit('/', 1)[0] + '/benchmark_history.json' if '/' in __file__ else 'benchmark_history.json'
+THRESHOLD = 0.25        # flag anything 25% slower than the baseline
+BASELINE_RUNS = 5       # the baseline is the median of this many earlier runs
+RETRIES = 3             # runs made again before anything is flagged
+RETRY_PAUSE = 1.0       # seconds between them
+REPEATS = 9
+METHOD = 'calibrated'   # how results are timed, history of other methods is not compared
+ITERATIONS = 20000
+
+try:
+    _ticks_us = time.ticks_us
+    _ticks_diff = time.ticks_diff
+
+    def _elapsed(start):
+        return _ticks_diff(_ticks_us(), start) / 1000000.0
+
+    def _start():
+        return _ticks_us()
+except AttributeError:
+    _timer = getattr(time, 'perf_counter', None) or time.time
+
+    def _elapsed(start):
+        return _timer() - start
+
+    def _start():
+        return _timer()
+
+
+class _NullTank:
+    """
+    Takes the place of MoveTank in Odometry while drive calls are timed
+    """
+    def on_for_degrees(self, left_speed, right_speed, degrees, brake=True, block=True):
+        pass
+
+    def on_for_rotations(self, left_speed, right_speed, rotations, brake=True, block=True):
+        pass
+
+
+class _NullMotor:
+    count_per_rot = 360
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+
+def _drive():
+    """
+    A MoveDifferential with the chassis geometry on stand-in motors
+    """
+    drive = Odometry.MoveDifferential(OUTPUT_B, OUTPUT_C, EV3EducationSetTire,
+                                      Chassis.Wheel_Well_diameter * 10, motor_class=_NullMotor)
+    drive.theta = 1.0
+    drive.pose_history.append(0.0, 0.0, 0.0, 1.0)
+    # turn_to_angle() wants odometry running
+    drive.odometry_thread_id = 1
+    return drive
+
+
+def _chassis():
+    """
+    A chassis whose motors are stand-ins, for its conversion lambdas
+    """
+    motor_class = Chassis.LargeMotor
+    tank_class = Chassis.MoveTank
+    Chassis.LargeMotor = _NullMotor
+    Chassis.MoveTank = _NullMotor
+    try:
+        return Chassis.chassis()
+    finally:
+        Chassis.LargeMotor = motor_class
+        Chassis.MoveTank = tank_class
+
+
+def _time(fn, iterations):
+    """
+    Best time of REPEATS runs of ``iterations`` calls of fn(i)
+    """
+    best = None
+    for repeat in range(REPEATS):
+        start = _start()
+        for i in range(iterations):
+            fn(i)
+        elapsed = _elapsed(start)
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def benchmarks(drive, chassis):
+    """
+    (name, fn(i), iterations divisor) of every benchmark
+    """
+    cases = []
+
+    for mode in MODES:
+        integrator = PoseIntegrator(0.5, 0.5, 111.7, mode)
+        cases.append(('integrator_update_' + mode, lambda i, update=integrator.update: update(3, 5), 1))
+
+    stepper = PoseIntegrator(0.5, 0.5, 111.7)
+    cases.append(('integrator_step', lambda i, step=stepper.step: step(i * 3, i * 5), 1))
+
+    cases.append(('on_arc', lambda i: drive._on_arc(50, 300, 500, True, False, i & 1), 4))
+    cases.append(('turn', lambda i: drive._turn(20, 90 - (i & 1) * 180, True, False), 4))
+    cases.append(('turn_to_angle', lambda i: drive.turn_to_angle(20, i % 360, True, False), 8))
+
+    cases.append(('rot_conversion', lambda i, f=chassis.rot_conversion: f(i), 1))
+    cases.append(('sp_conversion', lambda i, f=chassis.sp_conversion: f(i), 1))
+    cases.append(('degree_conversion', lambda i, f=chassis.degree_conversion: f(i), 1))
+    return cases
+
+
+def _calibration(i):
+    x = i * 3 + 1
+    return x * x % 7
+
+
+def calibrate(iterations=ITERATIONS):
+    """
+    Calls per second of a loop that runs none of the repo's code, how fast
+    the machine is right now
+    """
+    return iterations / max(_time(_calibration, iterations), 1e-9)
+
+
+def run(iterations=ITERATIONS, names=None):
+    """
+    Calls per second of every benchmark, or of the ones in ``names``
+    """
+    drive = _drive()
+    chassis = _chassis()
+    tank_class = Odometry.MoveTank
+    Odometry.MoveTank = _NullTank
+    try:
+        results = {}
+        for name, fn, divisor in benchmarks(drive, chassis):
+            if names is not None and name not in names:
+                continue
+            count = iterations // divisor
+            results[name] = count / max(_time(fn, count), 1e-9)
+        return results
+    finally:
+        Odometry.MoveTank = tank_class
+
+
+def machine():
+    """
+    What the numbers can be compared against, runs on other interpreters
+    or machines are not
+    """
+    implementation = sys.implementation.name
+    return '{} {} {}'.format(implementation, '.'.join(str(v) for v in sys.implementation.version[:3]),
+                             sys.platform)
+
+
+def load_history(path=HISTORY_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+def save_history(history, path=HISTORY_PATH):
+    with open(path, 'w') as f:
+        json.dump(history, f)
+
+
+def _median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def regressions(results, calibration, history, name, iterations, threshold=THRESHOLD,
+                window=BASELINE_RUNS, retime=None, retries=RETRIES):
+    """
+    (benchmark, now, baseline) for every result more than ``threshold``
+    slower than the median of the last ``window`` runs on the same machine
+    with as many iterations. The baselines are scaled down by how much
+    slower ``calibration`` (see calibrate()) is than in those runs.
+    Benchmarks with fewer earlier runs are not judged. While anything looks
+    slower, up to ``retries`` more runs are made with ``retime()``, which
+    returns ``(results, calibration)``, and a benchmark is only flagged
+    when it was slower in every one of them. ``now`` is its best rate over
+    those runs, ``results`` is left as it was.
+    """
+    entries = [entry for entry in history
+               if entry['machine'] == name and entry['iterations'] == iterations and
+               entry.get('method') == METHOD]
+    if len(entries) < window:
+        return []
+    entries = entries[-window:]
+    calibration_baseline = _median([entry['calibration'] for entry in entries])
+
+    baselines = {}
+    for key in results:
+        values = [entry['results'][key] for entry in entries if key in entry['results']]
+        if len(values) >= window:
+            baselines[key] = _median(values)
+
+    def judge(run_results, run_calibration):
+        # how much slower the machine is today, never taken as faster
+        machine = min(1.0, run_calibration / calibration_baseline)
+        slower = {}
+        for key in baselines:
+            baseline = baselines[key] * machine
+            if key in run_results and run_results[key] < baseline * (1.0 - threshold):
+                slower[key] = baseline
+        return slower
+
+    best = dict(results)
+    slower = judge(results, calibration)
+    for retry in range(retries if retime is not None else 0):
+        if not slower:
+            break
+        time.sleep(RETRY_PAUSE)
+        again, again_calibration = retime()
+        for key, value in again.items():
+            if value > best.get(key, 0):
+                best[key] = value
+        confirmed = judge(again, again_calibration)
+        slower = dict((key, confirmed[key]) for key in slower if key in confirmed)
+    return [(key, best[key], slower[key]) for key in sorted(slower)]
+
+
+def main(argv):
+    iterations = ITERATIONS
+    threshold = THRESHOLD
+    path = HISTORY_PATH
+    save = True
+
+    args = list(argv)
+    while args:
+        arg = args.pop(0)
+        if arg == '--quick':
+            iterations = ITERATIONS // 10
+        elif arg == '--threshold':
+            threshold = float(args.pop(0))
+        elif arg == '--history':
+            path = args.pop(0)
+        elif arg == '--no-save':
+            save = False
+        else:
+            print("usage: Benchmark.py [--quick] [--threshold 0.1] [--history file] [--no-save]")
+            return 2
+
+    name = machine()
+    calibration = calibrate(iterations)
+    results = run(iterations)
+    history = load_history(path)
+    slower = regressions(results, calibration, history, name, iterations, threshold,
+                         retime=lambda: (run(iterations), calibrate(iterations)))
+
+    print(name)
+    print("{:28} {:12.0f} /s".format('(calibration)', calibration))
+    for key in sorted(results):
+        print("{:28} {:12.0f} /s".format(key, results[key]))
+    for key, value, best in slower:
+        print("REGRESSION {}: {:.0f} /s, baseline {:.0f} /s ({:.0f}% slower)".format(
+            key, value, best, (1.0 - value / best) * 100))
+
+    if save:
+        history.append({'time': time.time(), 'machine': name, 'iterations': iterations, 'method': METHOD,
+                        'calibration': calibration, 'results': results})
+        save_history(history, path)
+
+    return 1 if slower else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+
+# Least-squares calibration of the chassis wheel constants
+#
+# Fits the effective wheel diameter and the wheel well (track) diameter from
+# many recorded moves and turns at once and writes them to the config file
+# Chassis.py loads at startup.
+#
+# The two ways the chassis drives have their own wheel:
+#
+#   --path move     chassis.move() / turn_clockwise() / run_plan(), the
+#                   sprocket, fits Sprocket_Wheel_Diameter
+#   --path drive    the MoveDifferential of chassis.drive and run_queue(),
+#                   the tire, fits Drive_Wheel_Diameter
+#
+# Both fit Wheel_Well_diameter, which both paths turn with.
+#
+# Each row is one move or turn:
+#
+#   kind,amount,right_ticks,left_ticks
+#   move,80,1731,1738
+#   turn,180,612,-605
+#
+# amount is how far the robot really went, measured on the floor, cm for a
+# move and degrees (counter clockwise positive) for a turn. The commanded
+# amount will not do: the ticks were worked out from it with the current
+# constants, so fitting against it only gives those constants back. The
+# ticks are the encoder deltas of the command, in chassis.position() order.
+#
+# The model, with d the wheel diameter and B the wheel well diameter:
+#
+#   (right + left) / 2 = 360 / (pi * d) * distance     for moves
+#   (right - left) / 2 = B / d * degrees               for turns
+#
+# Both are straight lines through the origin, fitted with one lstsq each.
+#
+# Usage: python3 Calibration.py runs.csv [...] --path move [-o chassis_config.json]
+
+import argparse
+import json
+import math
+import sys
+
+import numpy as np
+
+CONFIG_PATH = 'chassis_config.json'
+
+# config key of the wheel diameter each drive path uses
+DIAMETER_KEYS = {'move': 'Sprocket_Wheel_Diameter', 'drive': 'Drive_Wheel_Diameter'}
+
+# Two sided 95% Student t quantiles, normal beyond the table
+T_95 = (12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+        2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+        2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042)
+
+
+def t_95(dof):
+    if dof < 1:
+        return float('inf')
+    if dof <= len(T_95):
+        return T_95[dof - 1]
+    return 1.96
+
+
+def read_rows(path):
+    """
+    (kind, amount, right_ticks, left_ticks) rows of a calibration CSV
+    """
+    rows = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#') or line.startswith('kind'):
+                continue
+            kind, amount, right, left = [part.strip() for part in line.split(',')]
+            rows.append((kind, float(amount), int(right), int(left)))
+    return rows
+
+
+def rows_from_queue(timings, start_position, measured):
+    """
+    Calibration rows from chassis.run_queue() timings, for --path drive.
+    ``measured`` is how far the robot really went for each command (cm or
+    degrees counter clockwise), ``start_position`` is chassis.position()
+    before the queue ran.
+    """
+    if len(measured) != len(timings):
+        raise ValueError("{} measurements for {} commands".format(len(measured), len(timings)))
+
+    rows = []
+    previous = start_position
+    for timing, amount in zip(timings, measured):
+        command = timing['command']
+        position = timing['position']
+        right = position[0] - previous[0]
+        left = position[1] - previous[1]
+        previous = position
+
+        if command[0] in ('move', 'turn'):
+            rows.append((command[0], amount, right, left))
+    return rows
+
+
+def _fit_slope(x, y):
+    """
+    Slope of y = k * x, its standard error and the residual RMS
+    """
+    k, rss, rank, sv = np.linalg.lstsq(x[:, None], y, rcond=None)
+    k = float(k[0])
+    residual = y - k * x
+    dof = len(x) - 1
+    sigma_sq = float(residual @ residual) / dof if dof > 0 else float('inf')
+    se = math.sqrt(sigma_sq / float(x @ x)) if float(x @ x) > 0 else float('inf')
+    return k, se, math.sqrt(float(residual @ residual) / len(x)), dof
+
+
+def fit(rows, path='move'):
+    """
+    Fit the wheel diameter of drive ``path`` and the wheel well diameter
+    (both cm) with 95% confidence intervals
+    """
+    key = DIAMETER_KEYS[path]
+    kinds = np.array([r[0] for r in rows])
+    amount = np.array([r[1] for r in rows], dtype=float)
+    right = np.array([r[2] for r in rows], dtype=float)
+    left = np.array([r[3] for r in rows], dtype=float)
+
+    moves = kinds == 'move'
+    turns = kinds == 'turn'
+    if moves.sum() < 2 or turns.sum() < 2:
+        raise ValueError("need at least two moves and two turns, got {} and {}".format(moves.sum(), turns.sum()))
+
+    # ticks per cm of travel
+    a, a_se, move_rms, move_dof = _fit_slope(amount[moves], (right[moves] + left[moves]) / 2.0)
+    # wheel degrees per degree of chassis rotation
+    b, b_se, turn_rms, turn_dof = _fit_slope(amount[turns], (right[turns] - left[turns]) / 2.0)
+
+    diameter = 360.0 / (math.pi * a)
+    diameter_se = diameter * a_se / abs(a)
+    well = b * diameter
+    well_se = math.sqrt((diameter * b_se) ** 2 + (b * diameter_se) ** 2)
+
+    def interval(value, se, dof):
+        half = t_95(dof) * se
+        return [value - half, value + half]
+
+    return {
+        'path': path,
+        key: diameter,
+        'Wheel_Well_diameter': well,
+        'ci95': {
+            key: interval(diameter, diameter_se, move_dof),
+            'Wheel_Well_diameter': interval(well, well_se, min(move_dof, turn_dof)),
+        },
+        'residual_rms_ticks': {'move': move_rms, 'turn': turn_rms},
+        'samples': {'move': int(moves.sum()), 'turn': int(turns.sum())},
+    }
+
+
+def write_config(result, path=CONFIG_PATH):
+    """
+    Store the fitted constants, keeping what an earlier fit of the other
+    drive path wrote
+    """
+    try:
+        with open(path) as f:
+            config = json.load(f)
+    except (OSError, ValueError):
+        config = {}
+    if not isinstance(config, dict):
+        config = {}
+    # written by earlier versions and never read
+    config.pop('CONVERSION_TO_DEGREE', None)
+
+    key = DIAMETER_KEYS[result['path']]
+    config[key] = result[key]
+    config['Wheel_Well_diameter'] = result['Wheel_Well_diameter']
+    with open(path, 'w') as f:
+        json.dump(config, f, indent=4, sort_keys=True)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Fit chassis wheel constants from recorded runs")
+    parser.add_argument('runs', nargs='+', help="calibration CSV files")
+    parser.add_argument('--path', choices=sorted(DIAMETER_KEYS), required=True,
+                        help="drive path the runs were recorded with")
+    parser.add_argument('-o', '--output', default=CONFIG_PATH)
+    parser.add_argument('-n', '--dry-run', action='store_true', help="do not write the config")
+    args = parser.parse_args(argv)
+
+    rows = []
+    for path in args.runs:
+        rows.extend(read_rows(path))
+
+    result = fit(rows, args.path)
+    print("{} moves, {} turns".format(result['samples']['move'], result['samples']['turn']))
+    for name in (DIAMETER_KEYS[args.path], 'Wheel_Well_diameter'):
+        lo, hi = result['ci95'][name]
+        print("{:24} {:9.4f}   95% CI [{:.4f}, {:.4f}]".format(name, result[name], lo, hi))
+    print("residual rms: move {:.1f} ticks, turn {:.1f} ticks".format(
+        result['residual_rms_ticks']['move'], result['residual_rms_ticks']['turn']))
+
+    if not args.dry_run:
+        write_config(result, args.output)
+        print("wrote " + args.output)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
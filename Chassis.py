@@ -3,10 +3,16 @@
 # Just do a little loopy loops
 # Chad Lape
 
-from ev3dev2.motor import LargeMotor, OUTPUT_B, OUTPUT_C, MoveTank, SpeedPercent, MoveDifferential
-from ev3dev2.wheel import Wheel, EV3EducationSetTire
+from ev3dev2.motor import LargeMotor, OUTPUT_B, OUTPUT_C, MoveTank, SpeedPercent
+from Odometry import MoveDifferential
+from Latency import LatencyRecorder, SETUP, WRITE, OFF, SLEEP, CALL, wait_moving, from_environment
+from Sync import SyncPair
+from Mission import compile_mission, execute
+from ev3dev2.wheel import Wheel
 from time import sleep
 from math import pi
+import json
+import time
 
 
 
@@ -26,9 +32,39 @@ class sprocket(Wheel):
 # This is the distance between the two moments on the most inner point
 Wheel_Well_diameter = 10 + Sprocket_Wheel_Thickness*0.7826# in cm
 
-CONVERSION_TO_CM = Sprocket_Wheel_Diameter * pi
 CONVERSION_TO_DEGREE = 10.2
 
+# The drive object (MoveDifferential) runs on the education set tire
+Drive_Wheel_Diameter = 5.6 #In CM
+Drive_Wheel_Thickness = 2.8 #In CM
+
+# Constants fitted by Calibration.py replace the hand tuned ones above,
+# a config that cannot be read is ignored
+CONFIG_PATH = 'chassis_config.json'
+try:
+    with open(CONFIG_PATH) as config_file:
+        _config = json.load(config_file)
+except OSError:
+    _config = {}
+except ValueError as e:
+    print("ignoring {}: {}".format(CONFIG_PATH, e))
+    _config = {}
+if not isinstance(_config, dict):
+    _config = {}
+
+Sprocket_Wheel_Diameter = _config.get('Sprocket_Wheel_Diameter', Sprocket_Wheel_Diameter)
+Drive_Wheel_Diameter = _config.get('Drive_Wheel_Diameter', Drive_Wheel_Diameter)
+Wheel_Well_diameter = _config.get('Wheel_Well_diameter', Wheel_Well_diameter)
+
+# Tire of the drive object, with the fitted diameter
+class drive_tire(Wheel):
+    def __init__(self):
+        Wheel.__init__(self, Drive_Wheel_Diameter*10, Drive_Wheel_Thickness*10)
+
+CONVERSION_TO_CM = Sprocket_Wheel_Diameter * pi
+
+_clock = getattr(time, 'monotonic', None) or time.time
+
 class chassis:
 
 
@@ -44,6 +80,76 @@ class chassis:
         # theoretical number of rotations
         self.degree_conversion = lambda deg: self.rot_conversion((deg * pi * Wheel_Well_diameter) / 360) # Will convert from degrees into a distance
 
+        # Drive object shared by every move/turn, built on first use
+        self._drive = None
+
+        # Starts both tank motors together, see Sync.py
+        self._sync = None
+
+        # Per command timings of the last run_queue()
+        self.queue_timings = []
+
+        # Latency.LatencyRecorder, see enable_latency()
+        self.latency = None
+        if from_environment():
+            self.enable_latency(dump_at_exit=True)
+
+    # Building a MoveDifferential looks up both motors through sysfs, so
+    # only do it once and keep odometry running on the same object
+    @property
+    def drive(self):
+        if self._drive is None:
+            self._drive = MoveDifferential(Left_Motor_Port, Right_Motor_Port, drive_tire, Wheel_Well_diameter*10)
+            self._drive.latency = self.latency
+        return self._drive
+
+    # move() and turn_clockwise() start the tank motors through this, the
+    # start skew between them is in sync.skew_stats()
+    @property
+    def sync(self):
+        if self._sync is None:
+            self._sync = SyncPair(self.chassis.left_motor, self.chassis.right_motor)
+        return self._sync
+
+    # Work a Mission.py mission out with this chassis' wheel constants, the
+    # speed in percent as for move()
+    def compile_mission(self, mission, speed=15):
+        return compile_mission(mission, speed, CONVERSION_TO_CM*10, Wheel_Well_diameter*10)
+
+    # Drive a compiled mission on absolute targets, both motors started together
+    def run_plan(self, plan, brake=True):
+        execute(plan, self.sync, brake)
+        self.chassis.off(brake=False)
+
+    # Old name for the drive object
+    @property
+    def dif(self):
+        return self.drive
+
+
+    # Time the phases of every command from now on, the drive object's too
+    def enable_latency(self, recorder=None, dump_at_exit=False):
+        if recorder is None:
+            recorder = LatencyRecorder()
+        self.latency = recorder
+        if self._drive is not None:
+            self._drive.latency = recorder
+        if dump_at_exit:
+            recorder.dump_at_exit()
+        return recorder
+
+    # on_for_rotations on the tank with both motors started together, split
+    # into phases when latency is on
+    def _rotations(self, left_speed, right_speed, rotations, brake=True):
+        sync = self.sync
+        latency = self.latency
+        if latency is None:
+            sync.on_for_rotations(left_speed, right_speed, rotations, brake=brake)
+            return
+        latency.mark(SETUP)
+        sync.on_for_rotations(left_speed, right_speed, rotations, brake=brake, block=False)
+        latency.mark(WRITE)
+        wait_moving((sync.left_motor, sync.right_motor), latency)
 
     # Send move comand but backwards, just for ease if I use it
     def move_backwards(self, units=10, speed=15, backwards=True):
@@ -51,12 +157,22 @@ class chassis:
 
     # Move forward, units being in cm
     def move(self, units=10, speed=15, forwards=False):
-        
-        # Speed forward if forwards is ture or go back
-        speed = speed if forwards else (-speed)
-        self.chassis.on_for_rotations(SpeedPercent(speed), SpeedPercent(speed), self.rot_conversion(units),brake=True)
-        
-        self.chassis.off(brake=False)
+        latency = self.latency
+        if latency is not None:
+            latency.begin('move')
+
+        try:
+            # Speed forward if forwards is ture or go back
+            speed = speed if forwards else (-speed)
+            self._rotations(SpeedPercent(speed), SpeedPercent(speed), self.rot_conversion(units),brake=True)
+
+            self.chassis.off(brake=False)
+
+            if latency is not None:
+                latency.mark(OFF)
+        finally:
+            if latency is not None:
+                latency.end()
 
     def move_rel(self, units=10, speed=15, forwards=False):
 
@@ -69,28 +185,60 @@ class chassis:
         self.turn_clockwise(degrees, speed, not counter_clockwise)
 
     def turn_clockwise(self, degrees=180, speed=10, clockwise=True):
+        latency = self.latency
+        if latency is not None:
+            latency.begin('turn_clockwise')
 
-        speeds = SpeedPercent(-speed)
-        speedb = SpeedPercent(speed)
-        self.chassis.on_for_rotations(speedb, speeds, self.degree_conversion(degrees))
+        try:
+            speeds = SpeedPercent(-speed)
+            speedb = SpeedPercent(speed)
+            self._rotations(speedb, speeds, self.degree_conversion(degrees))
 
-        self.chassis.off(brake=False)
+            self.chassis.off(brake=False)
+
+            if latency is not None:
+                latency.mark(OFF)
+        finally:
+            if latency is not None:
+                latency.end()
 
     def move_dif(self, speed=15, units=10, backwards=False):
+        latency = self.latency
+        if latency is not None:
+            latency.begin('move_dif')
 
-        speed = -speed if backwards else speed
+        try:
+            speed = -speed if backwards else speed
 
-        self.dif = MoveDifferential(Left_Motor_Port, Right_Motor_Port, EV3EducationSetTire, Wheel_Well_diameter*10)
+            self.drive.on_for_distance(SpeedPercent(speed), units*10)
+            if latency is not None:
+                latency.mark(CALL)
 
-        self.dif.on_for_distance(SpeedPercent(speed), units*10)
+            sleep(0.3)
+            if latency is not None:
+                latency.mark(SLEEP)
 
-        sleep(0.3)
+            self.drive.off(brake=False)
 
-        self.dif.off(brake=False)
+            if latency is not None:
+                latency.mark(OFF)
+        finally:
+            if latency is not None:
+                latency.end()
 
     def turn_angle(self, angle=180):
-        self.turn = MoveDifferential(Left_Motor_Port, Right_Motor_Port, EV3EducationSetTire, Wheel_Well_diameter*10)
-        self.turn.turn_left(15, angle)        
+        latency = self.latency
+        if latency is not None:
+            latency.begin('turn_angle')
+
+        try:
+            self.drive.turn_left(15, angle)
+
+            if latency is not None:
+                latency.mark(CALL)
+        finally:
+            if latency is not None:
+                latency.end()
 
         
     def position(self):
@@ -98,9 +246,71 @@ class chassis:
         return [self.right.position, self.left.position]
 
     def odo_start(self):
-        self.dif.odometry_start()
+        self.drive.odometry_start()
     
     def odo_stop(self):
-        self.dif.odometry_stop()
-
-    
\ No newline at end of file
+        self.drive.odometry_stop()
+
+    # Queue of moves and turns run back to back
+    def _wait_settled(self, poll, start_timeout=0.1):
+        left = self.drive.left_motor
+        right = self.drive.right_motor
+
+        # Give the driver a moment to report the command started, a very
+        # short move can finish before we ever see it running
+        deadline = _clock() + start_timeout
+        while 'running' not in left.state and 'running' not in right.state:
+            if _clock() > deadline:
+                return
+            sleep(poll)
+
+        while 'running' in left.state or 'running' in right.state:
+            sleep(poll)
+
+    def run_queue(self, commands, poll=0.005):
+        """
+        Run a list of commands one after the other, each one starting as soon
+        as both motors report they stopped running instead of after a fixed
+        sleep. Commands are tuples:
+
+        - ('move', units, speed=15, backwards=False), like move_dif()
+        - ('turn', angle=180, speed=15), like turn_angle()
+
+        Returns the timings, also kept in queue_timings, one dict per command
+        with the time spent issuing it, the time until it settled and the
+        wheel positions after it.
+        """
+        drive = self.drive
+        timings = []
+
+        for command in commands:
+            kind = command[0]
+            start = _clock()
+
+            if kind == 'move':
+                units = command[1] if len(command) > 1 else 10
+                speed = command[2] if len(command) > 2 else 15
+                backwards = command[3] if len(command) > 3 else False
+                speed = -speed if backwards else speed
+                drive.on_for_distance(SpeedPercent(speed), units*10, brake=True, block=False)
+            elif kind == 'turn':
+                angle = command[1] if len(command) > 1 else 180
+                speed = command[2] if len(command) > 2 else 15
+                drive.turn_left(speed, angle, brake=True, block=False)
+            else:
+                raise ValueError("unknown command {}".format(command))
+
+            issued = _clock()
+            self._wait_settled(poll)
+            done = _clock()
+
+            timings.append({
+                'command': command,
+                'issue': issued - start,
+                'run': done - issued,
+                'position': self.position(),
+            })
+
+        drive.off(brake=False)
+        self.queue_timings = timings
+        return timings
@@ -0,0 +1,58 @@
+#!/usr/bin/env micropython
+
+# Startup and command latency of chassis drive objects
+#
+# Compares building a new MoveDifferential for every command, like
+# move_dif()/turn_angle() used to, with the shared chassis.drive object.
+# Each command is a 1 mm move so the numbers are mostly the Python and
+# sysfs overhead, not the motors.
+
+import time
+
+from ev3dev2.motor import SpeedPercent
+from ev3dev2.wheel import EV3EducationSetTire
+from Chassis import chassis, Left_Motor_Port, Right_Motor_Port, Wheel_Well_diameter
+from Odometry import MoveDifferential
+
+ROUNDS = 20
+
+try:
+    _ticks_us = time.ticks_us
+
+    def now():
+        return _ticks_us() / 1000000.0
+except AttributeError:
+    now = getattr(time, 'monotonic', None) or time.time
+
+
+def new_drive():
+    return MoveDifferential(Left_Motor_Port, Right_Motor_Port, EV3EducationSetTire, Wheel_Well_diameter*10)
+
+
+def timed(fn):
+    start = now()
+    for i in range(ROUNDS):
+        fn()
+    return (now() - start) / ROUNDS
+
+
+def per_command():
+    new_drive().on_for_distance(SpeedPercent(15), 1)
+
+
+c = chassis()
+
+start = now()
+c.drive
+first_access = now() - start
+
+results = (
+    ("construct MoveDifferential", timed(new_drive)),
+    ("reuse chassis.drive", timed(lambda: c.drive)),
+    ("command, new object each time", timed(per_command)),
+    ("command, shared chassis.drive", timed(lambda: c.drive.on_for_distance(SpeedPercent(15), 1))),
+)
+
+print("first chassis.drive access: {:.2f} ms".format(first_access * 1000))
+for name, seconds in results:
+    print("{:32} {:8.2f} ms".format(name, seconds * 1000))
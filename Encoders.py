@@ -0,0 +1,128 @@
+#!/usr/bin/env micropython
+
+# Paired encoder sampling for the odometry loop
+#
+# Reading motor.position through ev3dev2 goes through the generic attribute
+# code every time. Here both position attribute files are opened once and
+# read back to back, so a sample costs one syscall per wheel where pread is
+# available and the left and right counts are taken as close together in
+# time as Python allows.
+
+import os
+import time
+
+try:
+    _pread = os.pread
+except AttributeError:
+    _pread = None  # MicroPython, fall back to seek + read
+
+_clock = getattr(time, 'monotonic', None) or time.time
+
+
+class EncoderPair:
+    """
+    Keeps the left and right ``position`` attribute files open and samples
+    them as a pair.
+
+    read() returns ``(timestamp, left, right)``. The timestamp is the middle
+    of the window in which both files were read and the width of that window
+    is the skew between the two readings; the last, largest and mean skew
+    are kept and can be fetched with skew_stats().
+
+    A fake sysfs directory works just as well as the real one:
+
+    .. code:: python
+
+        pair = EncoderPair('/tmp/motor0/position', '/tmp/motor1/position')
+        t, left, right = pair.read()
+    """
+    def __init__(self, left_path, right_path, clock=_clock):
+        self.left_path = left_path
+        self.right_path = right_path
+        self.clock = clock
+
+        self.samples = 0
+        self.skew_last = 0.0
+        self.skew_max = 0.0
+        self.skew_total = 0.0
+
+        if _pread is not None:
+            self._left_fd = os.open(left_path, os.O_RDONLY)
+            self._right_fd = os.open(right_path, os.O_RDONLY)
+            self._left_file = None
+            self._right_file = None
+        else:
+            self._left_fd = None
+            self._right_fd = None
+            self._left_file = open(left_path, 'rb')
+            self._right_file = open(right_path, 'rb')
+
+    @classmethod
+    def from_motors(cls, left_motor, right_motor, clock=_clock):
+        """
+        Build a pair from two ev3dev2 motors using their sysfs directories
+        """
+        return cls(os.path.join(left_motor._path, 'position'),
+                   os.path.join(right_motor._path, 'position'),
+                   clock)
+
+    def read(self):
+        """
+        Sample both encoders back to back, returns ``(timestamp, left, right)``
+        """
+        clock = self.clock
+
+        if self._left_fd is not None:
+            left_fd = self._left_fd
+            right_fd = self._right_fd
+            start = clock()
+            left = _pread(left_fd, 16, 0)
+            right = _pread(right_fd, 16, 0)
+            end = clock()
+        else:
+            left_file = self._left_file
+            right_file = self._right_file
+            start = clock()
+            left_file.seek(0)
+            left = left_file.read(16)
+            right_file.seek(0)
+            right = right_file.read(16)
+            end = clock()
+
+        skew = end - start
+        self.samples += 1
+        self.skew_last = skew
+        self.skew_total += skew
+        if skew > self.skew_max:
+            self.skew_max = skew
+
+        return ((start + end) / 2.0, int(left), int(right))
+
+    def skew_stats(self):
+        """
+        Skew between the left and right readings in seconds
+        """
+        return {
+            'samples': self.samples,
+            'last': self.skew_last,
+            'max': self.skew_max,
+            'mean': self.skew_total / self.samples if self.samples else 0.0,
+        }
+
+    def reset_stats(self):
+        self.samples = 0
+        self.skew_last = 0.0
+        self.skew_max = 0.0
+        self.skew_total = 0.0
+
+    def close(self):
+        if self._left_fd is not None:
+            os.close(self._left_fd)
+            os.close(self._right_fd)
+            self._left_fd = None
+            self._right_fd = None
+        if self._left_file is not None:
+            self._left_file.close()
+            self._right_file.close()
+            self._left_file = None
+            self._right_file = None
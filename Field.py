@@ -1,10 +1,338 @@
 #! /usr/bin/env micropython
 
+import heapq
+import math
+from array import array
+
+# Cell values
+FREE = 0
+INFLATED = 1        # too close to an obstacle for the middle of the robot
+OBSTACLE = 2
+
+SQRT2 = math.sqrt(2)
+
+# 8-connected moves as (d_col, d_row, cost)
+MOVES = (
+    (1, 0, 1.0), (-1, 0, 1.0), (0, 1, 1.0), (0, -1, 1.0),
+    (1, 1, SQRT2), (1, -1, SQRT2), (-1, 1, SQRT2), (-1, -1, SQRT2),
+)
+
+
 class Field:
 
     # Constructors
-    def __init__(self):
-        self.width = 40         # Create Initial Width and Height conditions
-        self.height = 200
+    def __init__(self, width=40, height=200, resolution_mm=10, robot_radius_mm=0):
+        self.width = width          # Create Initial Width and Height conditions
+        self.height = height        # in cm, like the rest of the chassis code
+
+        self.resolution_mm = resolution_mm
+        self.robot_radius_mm = robot_radius_mm
+
+        self.cols = int(math.ceil(width * 10.0 / resolution_mm))
+        self.rows = int(math.ceil(height * 10.0 / resolution_mm))
+
+        # One byte per cell, row major, see FREE/INFLATED/OBSTACLE
+        self.grid = bytearray(self.cols * self.rows)
+
+        # A* scratch space, allocated once and reused by every plan(). A cell's
+        # g/parent entries are only valid if its stamp matches the current
+        # search, which saves clearing them between searches.
+        size = self.cols * self.rows
+        self._g = array('f', [0.0] * size)
+        self._parent = array('i', [-1] * size)
+        self._stamp = array('I', [0] * size)
+        self._closed = array('I', [0] * size)
+        self._search = 0
+
+        # Cells changed since the last take_dirty(), and the box around them
+        # as (col_lo, row_lo, col_hi, row_hi), so a replanner only has to
+        # look at what moved
+        self.dirty = []
+        self.dirty_box = None
+
+    # Coordinates
+    def cell(self, x_mm, y_mm):
+        """
+        (col, row) of the cell holding the point (x_mm, y_mm)
+        """
+        return (int(x_mm // self.resolution_mm), int(y_mm // self.resolution_mm))
+
+    def center(self, col, row):
+        """
+        (x_mm, y_mm) of the middle of a cell
+        """
+        return ((col + 0.5) * self.resolution_mm, (row + 0.5) * self.resolution_mm)
+
+    def in_bounds(self, col, row):
+        return 0 <= col < self.cols and 0 <= row < self.rows
+
+    def is_free(self, x_mm, y_mm):
+        col, row = self.cell(x_mm, y_mm)
+        return self.in_bounds(col, row) and self.grid[row * self.cols + col] == FREE
+
+    # Obstacles
+    def _fill_circle(self, x_mm, y_mm, radius_mm, value):
+        """
+        Raise every cell whose middle is within radius_mm of the point to at
+        least value, returns the indexes of the cells that changed
+        """
+        res = self.resolution_mm
+        cols = self.cols
+        grid = self.grid
+        changed = []
+
+        col_lo = max(0, int((x_mm - radius_mm) // res))
+        col_hi = min(cols - 1, int((x_mm + radius_mm) // res))
+        row_lo = max(0, int((y_mm - radius_mm) // res))
+        row_hi = min(self.rows - 1, int((y_mm + radius_mm) // res))
+        r_sq = radius_mm * radius_mm
+
+        # the cell the point falls in is always marked, even for radius 0
+        hit_col = int(x_mm // res)
+        hit_row = int(y_mm // res)
+
+        for row in range(row_lo, row_hi + 1):
+            dy = (row + 0.5) * res - y_mm
+            base = row * cols
+            for col in range(col_lo, col_hi + 1):
+                dx = (col + 0.5) * res - x_mm
+                if dx * dx + dy * dy <= r_sq or (row == hit_row and col == hit_col):
+                    index = base + col
+                    if grid[index] < value:
+                        grid[index] = value
+                        changed.append(index)
+        return changed
+
+    def _touch(self, changed):
+        """
+        Add changed cells to the dirty list and grow the dirty box
+        """
+        if not changed:
+            return changed
+        self.dirty.extend(changed)
+        cols = self.cols
+        if self.dirty_box is None:
+            first = changed[0]
+            self.dirty_box = [first % cols, first // cols, first % cols, first // cols]
+        box = self.dirty_box
+        for index in changed:
+            col = index % cols
+            row = index // cols
+            if col < box[0]:
+                box[0] = col
+            if row < box[1]:
+                box[1] = row
+            if col > box[2]:
+                box[2] = col
+            if row > box[3]:
+                box[3] = row
+        return changed
+
+    def take_dirty(self):
+        """
+        Cells changed since the last call, the dirty list is emptied
+        """
+        dirty = self.dirty
+        self.dirty = []
+        self.dirty_box = None
+        return dirty
+
+    def mark_obstacle(self, x_mm, y_mm, radius_mm=0):
+        """
+        Mark a round obstacle, cells within robot_radius_mm of it are marked
+        INFLATED so plans keep the robot clear. Returns the indexes of the
+        cells that changed.
+        """
+        changed = self._fill_circle(x_mm, y_mm, radius_mm, OBSTACLE)
+        if self.robot_radius_mm:
+            changed.extend(self._fill_circle(x_mm, y_mm, radius_mm + self.robot_radius_mm, INFLATED))
+        return self._touch(changed)
+
+    def sensor_hit(self, pose, range_mm, bearing=0.0, sensor_offset_mm=0.0):
+        """
+        World (x_mm, y_mm) of something a sensor saw ``range_mm`` away.
+
+        ``pose`` is ``(x_mm, y_mm, theta)`` as returned by odometry_pose(),
+        ``bearing`` is the sensor direction in radians relative to the robot
+        heading and ``sensor_offset_mm`` how far ahead of the wheel axle the
+        sensor sits. The EV3 IR sensor proximity reading is roughly 7 mm per
+        percent.
+        """
+        x_mm, y_mm, theta = pose
+        x_mm += sensor_offset_mm * math.cos(theta)
+        y_mm += sensor_offset_mm * math.sin(theta)
+        return (x_mm + range_mm * math.cos(theta + bearing),
+                y_mm + range_mm * math.sin(theta + bearing))
+
+    def mark_hits(self, points, radius_mm=0):
+        """
+        Mark a batch of world coordinate sensor hits as obstacles, returns the
+        indexes of the cells that changed
+        """
+        changed = []
+        for x_mm, y_mm in points:
+            changed.extend(self.mark_obstacle(x_mm, y_mm, radius_mm))
+        return changed
+
+    def mark_rect(self, x0_mm, y0_mm, x1_mm, y1_mm):
+        """
+        Mark a rectangular obstacle between two corners
+        """
+        res = self.resolution_mm
+        pad = self.robot_radius_mm
+        changed = []
+        for margin, value in ((pad, INFLATED), (0, OBSTACLE)):
+            col_lo = max(0, int((min(x0_mm, x1_mm) - margin) // res))
+            col_hi = min(self.cols - 1, int((max(x0_mm, x1_mm) + margin) // res))
+            row_lo = max(0, int((min(y0_mm, y1_mm) - margin) // res))
+            row_hi = min(self.rows - 1, int((max(y0_mm, y1_mm) + margin) // res))
+            for row in range(row_lo, row_hi + 1):
+                base = row * self.cols
+                for col in range(col_lo, col_hi + 1):
+                    if self.grid[base + col] < value:
+                        self.grid[base + col] = value
+                        changed.append(base + col)
+        return self._touch(changed)
+
+    def clear(self):
+        for i in range(len(self.grid)):
+            self.grid[i] = FREE
+        self.dirty = []
+        self.dirty_box = None
+
+    # Planning
+    def _heuristic(self, col, row, goal_col, goal_row):
+        # octile distance, exact on an empty 8-connected grid. Scaled up a
+        # hair so ties between equal length paths go to the cell nearer the
+        # goal, which keeps A* from flooding open areas.
+        dx = abs(col - goal_col)
+        dy = abs(row - goal_row)
+        return ((dx + dy) + (SQRT2 - 2) * min(dx, dy)) * 1.001
+
+    def line_of_sight(self, col0, row0, col1, row1):
+        """
+        True if every cell crossed by the straight line between two cells is
+        free
+        """
+        grid = self.grid
+        cols = self.cols
+        steps = max(abs(col1 - col0), abs(row1 - row0)) * 2
+        if not steps:
+            return grid[row0 * cols + col0] == FREE
+        for i in range(steps + 1):
+            col = int(col0 + 0.5 + (col1 - col0) * i / steps)
+            row = int(row0 + 0.5 + (row1 - row0) * i / steps)
+            if grid[row * cols + col] != FREE:
+                return False
+        return True
+
+    def plan_cells(self, start_cell, goal_cell):
+        """
+        A* from start_cell to goal_cell, returns the list of cells on the path
+        (both ends included) or None if the goal cannot be reached
+        """
+        cols = self.cols
+        grid = self.grid
+        g = self._g
+        parent = self._parent
+        stamp = self._stamp
+        closed = self._closed
+
+        self._search += 1
+        search = self._search
+
+        start_col, start_row = start_cell
+        goal_col, goal_row = goal_cell
+        if not (self.in_bounds(start_col, start_row) and self.in_bounds(goal_col, goal_row)):
+            return None
+
+        start = start_row * cols + start_col
+        goal = goal_row * cols + goal_col
+        if grid[goal] != FREE:
+            return None
+
+        g[start] = 0.0
+        parent[start] = -1
+        stamp[start] = search
+        heap = [(self._heuristic(start_col, start_row, goal_col, goal_row), start)]
+
+        while heap:
+            f, index = heapq.heappop(heap)
+            if closed[index] == search:
+                continue
+            closed[index] = search
+
+            if index == goal:
+                path = []
+                while index != -1:
+                    path.append((index % cols, index // cols))
+                    index = parent[index]
+                path.reverse()
+                return path
+
+            row = index // cols
+            col = index - row * cols
+            base_g = g[index]
+
+            for d_col, d_row, cost in MOVES:
+                n_col = col + d_col
+                n_row = row + d_row
+                if not (0 <= n_col < cols and 0 <= n_row < self.rows):
+                    continue
+                n_index = n_row * cols + n_col
+                if grid[n_index] != FREE or closed[n_index] == search:
+                    continue
+                # do not cut the corner of a blocked cell when moving diagonally
+                if d_col and d_row and (grid[row * cols + n_col] != FREE or grid[n_row * cols + col] != FREE):
+                    continue
+
+                n_g = base_g + cost
+                if stamp[n_index] != search or n_g < g[n_index]:
+                    stamp[n_index] = search
+                    g[n_index] = n_g
+                    parent[n_index] = index
+                    heapq.heappush(heap, (n_g + self._heuristic(n_col, n_row, goal_col, goal_row), n_index))
+
+        return None
+
+    def waypoints(self, cells, goal_mm=None):
+        """
+        Reduce a cell path to the corners that have to be driven to, as
+        (x_mm, y_mm) points, dropping the start cell. Cells that can see each
+        other in a straight line are joined.
+        """
+        if not cells:
+            return []
+
+        # Cells where the path changes direction, straight runs need no points
+        turns = [cells[0]]
+        for i in range(1, len(cells) - 1):
+            (c0, r0), (c1, r1), (c2, r2) = cells[i - 1], cells[i], cells[i + 1]
+            if (c1 - c0, r1 - r0) != (c2 - c1, r2 - r1):
+                turns.append(cells[i])
+        turns.append(cells[-1])
+
+        # Then skip every turn we can drive straight past
+        corners = []
+        anchor = turns[0]
+        for i in range(2, len(turns)):
+            if not self.line_of_sight(anchor[0], anchor[1], turns[i][0], turns[i][1]):
+                anchor = turns[i - 1]
+                corners.append(anchor)
+        corners.append(turns[-1])
+
+        points = [self.center(col, row) for (col, row) in corners]
+        if goal_mm is not None:
+            points[-1] = (float(goal_mm[0]), float(goal_mm[1]))
+        return points
 
-        self.grid = []          # Create initial grid bit
\ No newline at end of file
+    def plan(self, start_mm, goal_mm):
+        """
+        Waypoints in mm from start_mm to goal_mm around marked obstacles,
+        ready to be passed one by one to MoveDifferential.on_to_coordinates()
+        or all at once to follow_path(). None if there is no way through.
+        """
+        cells = self.plan_cells(self.cell(*start_mm), self.cell(*goal_mm))
+        if cells is None:
+            return None
+        return self.waypoints(cells, goal_mm)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+# Pre-rendered screen frames
+#
+# Drawing with ev3.Screen means importing PIL, drawing shape by shape and
+# converting the image on every start. FrameCache keeps what ended up in
+# the framebuffer as raw bytes the first time a frame is drawn, and shows
+# it later with a single write to the framebuffer device, without a Screen.
+#
+#   frames = FrameCache()
+#   frames.show('face-1', draw_face)   # draw_face() draws and updates the screen
+#
+# A cached frame is only used if it is as large as the framebuffer, so a
+# different display mode draws it again. Change the name when the drawing
+# changes.
+
+import os
+
+FB_DEVICE = '/dev/fb0'
+FB_SYSFS = '/sys/class/graphics/fb0'
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.frames')
+
+
+def frame_size(sysfs=FB_SYSFS):
+    """
+    Bytes of one screen: line length times the number of lines
+    """
+    with open(os.path.join(sysfs, 'stride')) as f:
+        stride = int(f.read())
+    with open(os.path.join(sysfs, 'virtual_size')) as f:
+        width, height = f.read().split(',')
+    return stride * int(height)
+
+
+class FrameCache:
+    def __init__(self, directory=CACHE_DIR, device=FB_DEVICE, sysfs=FB_SYSFS):
+        self.directory = directory
+        self.device = device
+        self.size = frame_size(sysfs)
+
+    def path(self, name):
+        return os.path.join(self.directory, name + '.fb')
+
+    def load(self, name):
+        """
+        The cached bytes of frame ``name``, or None
+        """
+        try:
+            with open(self.path(name), 'rb') as f:
+                frame = f.read()
+        except OSError:
+            return None
+        return frame if len(frame) == self.size else None
+
+    def save(self, name, frame):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(name)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(frame)
+        os.rename(path + '.tmp', path)
+
+    def blit(self, frame):
+        fd = os.open(self.device, os.O_WRONLY)
+        try:
+            os.write(fd, frame)
+        finally:
+            os.close(fd)
+
+    def capture(self):
+        with open(self.device, 'rb') as f:
+            return f.read(self.size)
+
+    def show(self, name, render):
+        """
+        Show frame ``name`` from the cache or have ``render()`` draw it and
+        cache the result. Returns True if the cached frame was used.
+        """
+        frame = self.load(name)
+        if frame is not None:
+            self.blit(frame)
+            return True
+        render()
+        self.save(name, self.capture())
+        return False
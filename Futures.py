@@ -0,0 +1,214 @@
+#!/usr/bin/env micropython
+
+# Completion futures for motor actions
+#
+# A motor action (a shot of the ev3rstorm ball launcher, a grabber move)
+# is submitted to a MotorMonitor, which writes the command and hands back a
+# MotorFuture straight away. One background thread watches every motor with
+# an action in flight and completes the futures when the motors stop, so
+# the caller keeps driving instead of polling the motor state itself.
+#
+# Actions on the same motor run one after another: an action submitted
+# while the motor is busy is started by the monitor when the one before it
+# finishes.
+#
+#   monitor = MotorMonitor()
+#   shot = monitor.submit(mm, lambda: mm.run_to_rel_pos(speed_sp=900, position_sp=-1080))
+#   shot.add_done_callback(lambda future: print(future.duration))
+#   ...
+#   shot.result(timeout=5)
+#
+# The monitor thread only runs while something is in flight. An action whose
+# command cannot be written finishes at once, result() raises the error and
+# the next action on the motor goes ahead.
+
+import _thread
+import time
+
+_clock = getattr(time, 'monotonic', None) or time.time
+
+POLL = 0.01
+
+
+class MotorFuture:
+    """
+    The outcome of one motor action.
+
+    ``submitted``, ``started`` and ``finished`` are clock readings of when
+    the action was asked for, when its command was written and when the
+    motor was seen to stop.
+    """
+    def __init__(self, motor, start, submitted):
+        self.motor = motor
+        self.start = start
+        self.submitted = submitted
+        self.started = None
+        self.finished = None
+        self.cancelled = False
+        # what start() raised, the action never ran
+        self.error = None
+        self.callbacks = []
+        # exceptions raised by callbacks, they do not stop the monitor
+        self.callback_errors = []
+        self._callbacks_lock = _thread.allocate_lock()
+        self._done = _thread.allocate_lock()
+        self._done.acquire()
+
+    def done(self):
+        return self.finished is not None
+
+    @property
+    def latency(self):
+        """
+        Seconds from submit() until the motor stopped, waiting for earlier
+        actions on the motor included
+        """
+        return None if self.finished is None else self.finished - self.submitted
+
+    @property
+    def duration(self):
+        """
+        Seconds from the command being written until the motor stopped
+        """
+        return None if self.finished is None else self.finished - self.started
+
+    def add_done_callback(self, fn):
+        """
+        Call ``fn(future)`` on the monitor thread when the action finishes,
+        or right away if it has. What a callback raises is kept in
+        ``callback_errors``.
+        """
+        with self._callbacks_lock:
+            if self.finished is None:
+                self.callbacks.append(fn)
+                return
+        self._call(fn)
+
+    def _call(self, fn):
+        try:
+            fn(self)
+        except Exception as e:
+            self.callback_errors.append(e)
+
+    def result(self, timeout=None):
+        """
+        Wait for the action to finish, returns its latency. Raises
+        OSError if ``timeout`` seconds pass first and what start() raised
+        if the command could not be written.
+        """
+        if self.finished is None:
+            if timeout is None:
+                self._done.acquire()
+            elif not self._done.acquire(True, timeout):
+                raise OSError("motor action did not finish in {} s".format(timeout))
+            self._done.release()
+        if self.error is not None:
+            raise self.error
+        return self.latency
+
+    def cancel(self):
+        """
+        Stop the motor, the future finishes on the next monitor pass
+        """
+        self.cancelled = True
+        if self.started is not None:
+            self.motor.stop()
+
+    def _finish(self, now, error=None):
+        with self._callbacks_lock:
+            if error is not None:
+                self.error = error
+            self.finished = now
+            callbacks = self.callbacks
+            self.callbacks = []
+        self._done.release()
+        for fn in callbacks:
+            self._call(fn)
+
+
+class MotorMonitor:
+    """
+    One thread that completes the futures of every motor action in flight
+    """
+    def __init__(self, poll=POLL, clock=_clock, sleep=time.sleep):
+        self.poll = poll
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = _thread.allocate_lock()
+        # motor -> futures, the first one running
+        self.queues = {}
+        self.running = False
+
+    def submit(self, motor, start):
+        """
+        Run ``start()``, which writes the motor command, now or once the
+        actions already submitted for ``motor`` are done
+        """
+        future = MotorFuture(motor, start, self.clock())
+        with self.lock:
+            queue = self.queues.get(motor)
+            if queue:
+                queue.append(future)
+                return future
+            error = self._start(future)
+            if error is None:
+                self.queues[motor] = [future]
+                if not self.running:
+                    self.running = True
+                    _thread.start_new_thread(self._monitor, ())
+        if error is not None:
+            future._finish(future.started, error)
+        return future
+
+    def _start(self, future):
+        """
+        Write the command of ``future``, returns what start() raised
+        """
+        if future.cancelled:
+            future.started = self.clock()
+            return None
+        try:
+            future.start()
+        except Exception as e:
+            future.started = self.clock()
+            return e
+        future.started = self.clock()
+        return None
+
+    def busy(self, motor):
+        with self.lock:
+            return bool(self.queues.get(motor))
+
+    def _monitor(self):
+        try:
+            while True:
+                self.sleep(self.poll)
+                finished = []
+                with self.lock:
+                    for motor in list(self.queues):
+                        queue = self.queues[motor]
+                        future = queue[0]
+                        if not future.cancelled and 'running' in motor.state:
+                            continue
+                        finished.append((future, self.clock(), None))
+                        queue.pop(0)
+                        # actions that cannot be started finish straight away
+                        while queue:
+                            error = self._start(queue[0])
+                            if error is None:
+                                break
+                            finished.append((queue.pop(0), self.clock(), error))
+                        if not queue:
+                            del self.queues[motor]
+                    idle = not self.queues
+                    if idle:
+                        self.running = False
+
+                for future, now, error in finished:
+                    future._finish(now, error)
+                if idle:
+                    return
+        finally:
+            # a later submit() starts a new monitor
+            with self.lock:
+                self.running = False
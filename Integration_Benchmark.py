@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+# Pose error against odometry sample rate for each integration mode
+#
+# Drives a simulated robot through arcs, straights and a spin with ramped
+# wheel speeds, samples whole encoder ticks at several rates and runs each
+# Kinematics mode over the samples. The reference pose comes from the same
+# wheel profile integrated at a very high rate without tick quantization.
+#
+# Usage: python3 Integration_Benchmark.py [rate_hz ...]
+
+import math
+import sys
+import time
+
+from Kinematics import PoseIntegrator, MODES, ARC
+
+WHEEL_CIRCUMFERENCE_MM = 56 * math.pi   # EV3EducationSetTire
+WHEEL_DISTANCE_MM = 111.7               # Chassis Wheel_Well_diameter in mm
+COUNT_PER_ROT = 360
+
+REFERENCE_HZ = 20000
+RATES_HZ = (20, 50, 100, 200, 500, 1000)
+
+# (duration_s, left_mm_per_s, right_mm_per_s) legs, speeds ramp linearly
+# from one leg to the next over RAMP_S
+MISSION = (
+    (1.5, 300.0, 300.0),    # straight
+    (2.5, 360.0, 170.0),    # arc right
+    (1.0, -150.0, 150.0),   # spin left
+    (2.5, 150.0, 340.0),    # arc left
+    (1.5, 250.0, 250.0),    # straight
+)
+RAMP_S = 0.15
+
+
+def wheel_position(t):
+    """
+    Left/right wheel travel in mm at time t, the speed profile integrated
+    exactly so every sample rate sees the same wheel motion
+    """
+    left_prev, right_prev = 0.0, 0.0
+    left_mm, right_mm = 0.0, 0.0
+    start = 0.0
+    for duration, left, right in MISSION:
+        dt = min(max(t - start, 0.0), duration)
+        ramp = min(dt, RAMP_S)
+        # ramp from the previous speed, then hold
+        k = ramp / RAMP_S
+        left_mm += left_prev * ramp + (left - left_prev) * k * ramp / 2.0 + left * (dt - ramp)
+        right_mm += right_prev * ramp + (right - right_prev) * k * ramp / 2.0 + right * (dt - ramp)
+        left_prev, right_prev = left, right
+        start += duration
+    return left_mm, right_mm
+
+
+def mission_duration():
+    return sum(leg[0] for leg in MISSION)
+
+
+def wheel_travel(rate_hz):
+    """
+    Cumulative left/right wheel travel in mm sampled at rate_hz
+    """
+    steps = int(round(mission_duration() * rate_hz))
+    left = []
+    right = []
+    for i in range(steps + 1):
+        left_mm, right_mm = wheel_position(float(i) / rate_hz)
+        left.append(left_mm)
+        right.append(right_mm)
+    return left, right
+
+
+def reference_pose():
+    left, right = wheel_travel(REFERENCE_HZ)
+    pose = PoseIntegrator(1.0, 1.0, WHEEL_DISTANCE_MM, ARC)
+    for i in range(1, len(left)):
+        pose.update(left[i] - left[i - 1], right[i] - right[i - 1])
+    return pose.x_mm, pose.y_mm, pose.theta
+
+
+def run(rate_hz, mode):
+    """
+    Final pose error (mm, degrees) and microseconds per update
+    """
+    mm_per_tick = WHEEL_CIRCUMFERENCE_MM / COUNT_PER_ROT
+    left, right = wheel_travel(rate_hz)
+    left_ticks = [int(mm / mm_per_tick) for mm in left]
+    right_ticks = [int(mm / mm_per_tick) for mm in right]
+
+    pose = PoseIntegrator.for_wheel(WHEEL_CIRCUMFERENCE_MM, COUNT_PER_ROT, COUNT_PER_ROT,
+                                    WHEEL_DISTANCE_MM, mode)
+    start = time.time()
+    for i in range(1, len(left_ticks)):
+        pose.update(left_ticks[i] - left_ticks[i - 1], right_ticks[i] - right_ticks[i - 1])
+    elapsed = time.time() - start
+
+    return pose, elapsed * 1e6 / max(1, len(left_ticks) - 1)
+
+
+def main(rates):
+    x_ref, y_ref, theta_ref = reference_pose()
+    print("reference pose x {:.1f} mm, y {:.1f} mm, theta {:.1f} deg".format(
+        x_ref, y_ref, math.degrees(theta_ref)))
+    print("{:>8} {:>10} {:>14} {:>14} {:>10}".format("rate_hz", "mode", "pos_err_mm", "head_err_deg", "us/update"))
+
+    for rate_hz in rates:
+        for mode in MODES:
+            pose, us = run(rate_hz, mode)
+            pos_err = math.sqrt((pose.x_mm - x_ref) ** 2 + (pose.y_mm - y_ref) ** 2)
+            head_err = math.degrees(math.atan2(math.sin(pose.theta - theta_ref), math.cos(pose.theta - theta_ref)))
+            print("{:>8} {:>10} {:>14.2f} {:>14.3f} {:>10.2f}".format(rate_hz, mode, pos_err, head_err, us))
+
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or RATES_HZ)
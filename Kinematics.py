@@ -0,0 +1,112 @@
+#!/usr/bin/env micropython
+
+# Differential drive pose integration
+#
+# Kept free of ev3dev2 so the same update runs in the odometry thread on the
+# brick and off-robot in benchmarks and tools.
+
+import math
+
+TWO_PI = 2 * math.pi
+
+# Integration modes
+EULER = 'euler'         # heading first, then step along the new heading
+MIDPOINT = 'midpoint'   # step along the heading half way through the turn
+ARC = 'arc'             # exact for a constant curvature step
+
+MODES = (EULER, MIDPOINT, ARC)
+
+
+class PoseIntegrator:
+    """
+    Accumulates a pose from left/right encoder tick deltas.
+
+    ``left_mm_per_tick`` and ``right_mm_per_tick`` are worked out once from the
+    wheel circumference and the motors' ``count_per_rot`` so update() does no
+    unit conversion beyond two multiplications.
+
+    EULER is the original odometry math: it updates theta and then moves the
+    full step along the new heading, which is only accurate when samples are
+    very close together. MIDPOINT moves along the average heading of the step
+    and ARC integrates the step as a circular arc, which is exact for the
+    arcs driven by on_arc_left()/on_arc_right() whatever the sample rate.
+    """
+    def __init__(self, left_mm_per_tick, right_mm_per_tick, wheel_distance_mm, mode=ARC,
+                 x_mm=0.0, y_mm=0.0, theta=0.0):
+        if mode not in MODES:
+            raise ValueError("mode {} is not one of {}".format(mode, MODES))
+
+        self.left_mm_per_tick = float(left_mm_per_tick)
+        self.right_mm_per_tick = float(right_mm_per_tick)
+        self.wheel_distance_mm = float(wheel_distance_mm)
+        self.mode = mode
+
+        self.x_mm = x_mm
+        self.y_mm = y_mm
+        self.theta = theta
+
+        # encoder counts of the last step()
+        self.left_previous = 0
+        self.right_previous = 0
+
+    @classmethod
+    def for_wheel(cls, circumference_mm, left_count_per_rot, right_count_per_rot, wheel_distance_mm, mode=ARC):
+        return cls(circumference_mm / left_count_per_rot,
+                   circumference_mm / right_count_per_rot,
+                   wheel_distance_mm, mode)
+
+    def reset(self, x_mm=0.0, y_mm=0.0, theta=0.0):
+        self.x_mm = x_mm
+        self.y_mm = y_mm
+        self.theta = theta
+        self.left_previous = 0
+        self.right_previous = 0
+
+    def step(self, left_position, right_position):
+        """
+        Advance the pose to absolute encoder counts, the way the odometry
+        thread handles every sample. Counts are taken relative to the last
+        step(), or to 0 after reset(). Returns False, leaving everything
+        alone, if neither wheel moved.
+        """
+        left_ticks = left_position - self.left_previous
+        right_ticks = right_position - self.right_previous
+        if not left_ticks and not right_ticks:
+            return False
+
+        self.left_previous = left_position
+        self.right_previous = right_position
+        self.update(left_ticks, right_ticks)
+        return True
+
+    def update(self, left_ticks, right_ticks):
+        """
+        Advance the pose by one sample worth of ticks
+        """
+        left_mm = left_ticks * self.left_mm_per_tick
+        right_mm = right_ticks * self.right_mm_per_tick
+
+        # distance traveled by the middle of the robot and change of heading
+        mm = (left_mm + right_mm) / 2.0
+        dtheta = (right_mm - left_mm) / self.wheel_distance_mm
+
+        theta = self.theta
+        mode = self.mode
+
+        if mode == ARC and (dtheta > 1e-9 or dtheta < -1e-9):
+            radius = mm / dtheta
+            self.x_mm += radius * (math.sin(theta + dtheta) - math.sin(theta))
+            self.y_mm -= radius * (math.cos(theta + dtheta) - math.cos(theta))
+        elif mode == EULER:
+            theta_after = theta + dtheta
+            self.x_mm += mm * math.cos(theta_after)
+            self.y_mm += mm * math.sin(theta_after)
+        else:
+            # MIDPOINT, and ARC when driving straight
+            heading = theta + dtheta / 2.0
+            self.x_mm += mm * math.cos(heading)
+            self.y_mm += mm * math.sin(heading)
+
+        # clip the rotation to plus or minus 360 degrees
+        theta += dtheta
+        self.theta = theta - float(int(theta / TWO_PI) * TWO_PI)
@@ -0,0 +1,265 @@
+#!/usr/bin/env micropython
+
+# Per-command latency histograms for MoveDifferential and chassis
+#
+# Every motion call is split into phases (Python setup, the sysfs command
+# writes, time until the wheels first move, time until they settle, off()
+# and sleeps) and the time spent in each phase goes into a log2 histogram
+# per command type. All storage is allocated up front, recording a command
+# is a few clock reads and array increments.
+#
+# Instrumentation is off unless asked for:
+#
+#   latency = LatencyRecorder()
+#   chassis.enable_latency(latency)     # or mdiff.latency = latency
+#   ...
+#   print(latency.report())
+#
+# or set EV3_LATENCY=1 in the environment to have every chassis record and
+# dump its histograms when the program exits.
+
+import os
+import sys
+import time
+from array import array
+
+try:
+    import atexit
+    _at_exit = atexit.register
+except ImportError:
+    _at_exit = getattr(sys, 'atexit', None)
+
+_clock = getattr(time, 'monotonic', None) or time.time
+
+# Phases of a command
+SETUP = 0           # Python work before the first sysfs write
+WRITE = 1           # setting speed/position and issuing the run command
+FIRST_MOTION = 2    # until the encoders first change
+SETTLE = 3          # until both motors stop running
+OFF = 4             # off() / stop
+SLEEP = 5           # fixed sleeps inside the command
+CALL = 6            # nested command calls, e.g. move_dif() calling on_for_distance()
+TOTAL = 7
+
+PHASES = ('setup', 'write', 'first_motion', 'settle', 'off', 'sleep', 'call', 'total')
+
+# Bucket b counts durations of 2**(b-1) to 2**b microseconds, the last one
+# everything above about 16 s
+BUCKETS = 25
+
+# MoveTank waits this long (ms) for the motors to report running
+WAIT_RUNNING_TIMEOUT = 100
+
+# Commands are nested at most this deep (chassis -> MoveDifferential)
+MAX_DEPTH = 4
+
+# Non-blocking MoveDifferential commands (run_queue()) are kept apart as
+# <command>_issue, they return as soon as the command is written
+KINDS = ('on_for_distance', 'on_arc', 'turn', 'on_for_distance_issue', 'on_arc_issue', 'turn_issue',
+         'move', 'turn_clockwise', 'move_dif', 'turn_angle')
+
+
+class LatencyRecorder:
+    """
+    Phase timestamps of the commands in flight and per command type
+    histograms of how long each phase took.
+
+    A command calls begin(kind), mark(phase) at the end of each phase and
+    end() when it returns. mark() charges the time since the previous mark
+    (or begin) to ``phase``. Both take an optional clock reading ``at`` for
+    a phase boundary that was passed earlier.
+    """
+    def __init__(self, kinds=KINDS, clock=_clock):
+        self.clock = clock
+        self.histograms = {}
+        self.totals = {}
+        self.counts = {}
+        for kind in kinds:
+            self._allocate(kind)
+
+        # one row of phase durations per nesting level
+        self.depth = 0
+        self.kind = [None] * MAX_DEPTH
+        self.started = array('d', [0.0] * MAX_DEPTH)
+        self.last = array('d', [0.0] * MAX_DEPTH)
+        self.durations = [array('d', [0.0] * len(PHASES)) for i in range(MAX_DEPTH)]
+        self.marked = array('I', [0] * MAX_DEPTH)
+        self.overflow = 0
+
+    def _allocate(self, kind):
+        self.histograms[kind] = array('I', [0] * (BUCKETS * len(PHASES)))
+        self.totals[kind] = array('d', [0.0] * len(PHASES))
+        self.counts[kind] = array('I', [0] * len(PHASES))
+
+    def begin(self, kind, at=None):
+        depth = self.depth
+        self.depth = depth + 1
+        if depth >= MAX_DEPTH:
+            self.overflow += 1
+            return
+        now = self.clock() if at is None else at
+        self.kind[depth] = kind
+        self.started[depth] = now
+        self.last[depth] = now
+        self.marked[depth] = 0
+        durations = self.durations[depth]
+        for i in range(len(durations)):
+            durations[i] = 0.0
+
+    def mark(self, phase, at=None):
+        depth = self.depth - 1
+        if depth < 0 or depth >= MAX_DEPTH:
+            return
+        now = self.clock() if at is None else at
+        self.durations[depth][phase] += now - self.last[depth]
+        self.marked[depth] |= 1 << phase
+        self.last[depth] = now
+
+    def end(self):
+        self.depth -= 1
+        depth = self.depth
+        if depth < 0:
+            self.depth = 0
+            return
+        if depth >= MAX_DEPTH:
+            return
+
+        now = self.clock()
+        durations = self.durations[depth]
+        durations[TOTAL] = now - self.started[depth]
+        marked = self.marked[depth] | (1 << TOTAL)
+
+        kind = self.kind[depth]
+        if kind not in self.histograms:
+            self._allocate(kind)
+        histogram = self.histograms[kind]
+        totals = self.totals[kind]
+        counts = self.counts[kind]
+
+        for phase in range(len(PHASES)):
+            if not marked & (1 << phase):
+                continue
+            seconds = durations[phase]
+            us = int(seconds * 1000000)
+            bucket = 0
+            while us and bucket < BUCKETS - 1:
+                us >>= 1
+                bucket += 1
+            histogram[phase * BUCKETS + bucket] += 1
+            totals[phase] += seconds
+            counts[phase] += 1
+
+    def reset(self):
+        for kind in self.histograms:
+            histogram = self.histograms[kind]
+            for i in range(len(histogram)):
+                histogram[i] = 0
+            for i in range(len(PHASES)):
+                self.totals[kind][i] = 0.0
+                self.counts[kind][i] = 0
+        self.depth = 0
+        self.overflow = 0
+
+    def percentile(self, kind, phase, p):
+        """
+        Upper bound in seconds of the bucket holding the p-th percentile
+        """
+        count = self.counts[kind][phase]
+        if not count:
+            return 0.0
+        histogram = self.histograms[kind]
+        wanted = count * p / 100.0
+        seen = 0
+        for bucket in range(BUCKETS):
+            seen += histogram[phase * BUCKETS + bucket]
+            if seen >= wanted:
+                return (1 << bucket) / 1000000.0
+        return (1 << (BUCKETS - 1)) / 1000000.0
+
+    def stats(self):
+        """
+        {kind: {phase: {count, mean, p50, p90, p99}}} in seconds, for the
+        phases that were seen
+        """
+        out = {}
+        for kind in self.histograms:
+            counts = self.counts[kind]
+            if not counts[TOTAL]:
+                continue
+            phases = {}
+            for phase in range(len(PHASES)):
+                if not counts[phase]:
+                    continue
+                phases[PHASES[phase]] = {
+                    'count': counts[phase],
+                    'mean': self.totals[kind][phase] / counts[phase],
+                    'p50': self.percentile(kind, phase, 50),
+                    'p90': self.percentile(kind, phase, 90),
+                    'p99': self.percentile(kind, phase, 99),
+                }
+            out[kind] = phases
+        return out
+
+    def report(self):
+        lines = ["{:22} {:13} {:>6} {:>10} {:>10} {:>10}".format("command", "phase", "count", "mean ms",
+                                                                 "p50 ms <=", "p90 ms <=")]
+        stats = self.stats()
+        for kind in sorted(stats):
+            for phase in PHASES:
+                if phase not in stats[kind]:
+                    continue
+                s = stats[kind][phase]
+                lines.append("{:22} {:13} {:6} {:10.2f} {:10.2f} {:10.2f}".format(
+                    kind, phase, s['count'], s['mean'] * 1000, s['p50'] * 1000, s['p90'] * 1000))
+        return "\n".join(lines)
+
+    def dump(self, path=None):
+        """
+        Write the report to ``path``, or print it
+        """
+        if path is None:
+            print(self.report())
+            return
+        with open(path, 'w') as f:
+            f.write(self.report() + "\n")
+
+    def dump_at_exit(self, path=None):
+        if _at_exit is not None:
+            _at_exit(lambda: self.dump(path))
+
+
+def from_environment():
+    """
+    True if EV3_LATENCY asks for every chassis to be instrumented
+    """
+    getenv = getattr(os, 'getenv', None)
+    return bool(getenv and getenv('EV3_LATENCY') not in (None, '', '0'))
+
+
+def wait_moving(motors, latency, poll=0.001):
+    """
+    Wait for a command just written to ``motors`` to run its course,
+    charging the time until an encoder first moves to FIRST_MOTION and the
+    rest to SETTLE, like MoveTank's block=True waits. As there, each motor
+    is first given WAIT_RUNNING_TIMEOUT ms to report running, a command
+    that has not started yet is not taken for one that finished.
+    """
+    start = [motor.position for motor in motors]
+    for motor in motors:
+        motor.wait_until('running', timeout=WAIT_RUNNING_TIMEOUT)
+    while True:
+        running = False
+        for i in range(len(motors)):
+            if motors[i].position != start[i]:
+                latency.mark(FIRST_MOTION)
+                for motor in motors:
+                    motor.wait_until_not_moving()
+                latency.mark(SETTLE)
+                return
+            if 'running' in motors[i].state:
+                running = True
+        if not running:
+            # finished (or never started) without moving
+            latency.mark(SETTLE)
+            return
+        time.sleep(poll)
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+
+# Drift statistics for the subtask logs
+#
+# Subtask1.py and Subtask1 B.py append one run per execution to
+# subtask1.log / subtask1b.log:
+#
+#   ----------------------
+#   NEW
+#   --------------------
+#   [a, b] --> [c, d]
+#   DIF: [x, y]
+#   ...
+#   --------------------
+#   END
+#   --------------------
+#
+# where every pair is [right, left] encoder degrees, as returned by
+# chassis.position(). Each DIF is one segment of the run.
+#
+# The files are read in large chunks, the numbers are pulled out with one
+# regex pass per chunk and every statistic is computed on NumPy arrays, so
+# thousands of runs take seconds.
+#
+# Usage: python3 Log_Analyzer.py [--per-run] [--turn-deg N] subtask1.log ...
+
+import argparse
+import math
+import re
+import sys
+
+import numpy as np
+
+# EV3EducationSetTire and the chassis wheel well (Wheel_Well_diameter * 10)
+WHEEL_CIRCUMFERENCE_MM = 56 * math.pi
+WHEEL_DISTANCE_MM = (10 + 1.5 * 0.7826) * 10
+
+CHUNK_SIZE = 64 * 1024 * 1024
+
+DIF_RE = re.compile(rb'DIF: \[(-?\d+), (-?\d+)\]')
+NEW_RE = re.compile(rb'^NEW$', re.M)
+
+
+def read_segments(path, chunk_size=CHUNK_SIZE):
+    """
+    Stream a log and return ``(run, right, left, skipped)``: arrays with one
+    entry per DIF line, ``run`` numbering the NEW blocks of the file from 0,
+    and the number of DIF lines before the first NEW, which belong to no run
+    and are left out
+    """
+    runs = []
+    rights = []
+    lefts = []
+    run_offset = -1
+    skipped = 0
+    tail = b''
+
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            data = tail + chunk
+            if chunk:
+                # Only parse up to the last complete line, keep the rest
+                cut = data.rfind(b'\n') + 1
+                data, tail = data[:cut], data[cut:]
+            else:
+                tail = b''
+            if not data:
+                break
+
+            new_pos = np.array([m.start() for m in NEW_RE.finditer(data)], dtype=np.int64)
+            matches = list(DIF_RE.finditer(data))
+            if matches:
+                dif_pos = np.array([m.start() for m in matches], dtype=np.int64)
+                values = np.array([m.groups() for m in matches], dtype=np.int64)
+                run = run_offset + np.searchsorted(new_pos, dif_pos)
+                keep = run >= 0
+                skipped += int(len(run) - np.count_nonzero(keep))
+                runs.append(run[keep])
+                rights.append(values[keep, 0])
+                lefts.append(values[keep, 1])
+            run_offset += len(new_pos)
+
+            if not chunk:
+                break
+
+    if not runs:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty, skipped
+    return np.concatenate(runs), np.concatenate(rights), np.concatenate(lefts), skipped
+
+
+def default_turn(path):
+    """
+    Turn each segment is meant to make: subtask 1B pairs every move with a
+    180 degree turn_angle(), subtask 1 only drives straight
+    """
+    return 180.0 if '1b' in path.lower() else 0.0
+
+
+def segment_stats(right, left, turn_deg, circumference_mm, wheel_distance_mm):
+    """
+    Per segment arrays of tick asymmetry, distance driven and heading error.
+
+    The ticks the intended turn accounts for are taken off both wheels
+    before the asymmetry is worked out, so it measures the straight part of
+    the segment.
+    """
+    mm_per_tick = circumference_mm / 360.0
+    right_mm = right * mm_per_tick
+    left_mm = left * mm_per_tick
+
+    turn_ticks = math.radians(turn_deg) * (wheel_distance_mm / 2.0) / mm_per_tick
+    right_straight = np.abs(right - turn_ticks)
+    left_straight = np.abs(left + turn_ticks)
+    mean = (right_straight + left_straight) / 2.0
+    asymmetry = np.where(mean > 0, (left_straight - right_straight) / np.maximum(mean, 1e-9), 0.0)
+
+    distance_m = np.abs(right_mm + left_mm) / 2000.0
+    heading_deg = np.degrees((right_mm - left_mm) / wheel_distance_mm)
+    turn_error = heading_deg - turn_deg
+
+    return asymmetry, distance_m, turn_error
+
+
+def outliers(values, limit=3.5):
+    """
+    Robust z-score outliers (median / MAD)
+    """
+    if not len(values):
+        return np.zeros(0, dtype=bool)
+    median = np.median(values)
+    mad = np.median(np.abs(values - median))
+    if mad == 0:
+        return values != median
+    return np.abs(0.6745 * (values - median) / mad) > limit
+
+
+def per_run(run, values):
+    """
+    Mean and count of values for every run id, in one bincount each
+    """
+    count = np.bincount(run)
+    return np.bincount(run, weights=values) / np.maximum(count, 1), count
+
+
+def analyze(path, turn_deg=None, circumference_mm=WHEEL_CIRCUMFERENCE_MM, wheel_distance_mm=WHEEL_DISTANCE_MM):
+    if turn_deg is None:
+        turn_deg = default_turn(path)
+
+    run, right, left, skipped = read_segments(path)
+    asymmetry, distance_m, turn_error = segment_stats(right, left, turn_deg,
+                                                       circumference_mm, wheel_distance_mm)
+    outlier = outliers(turn_error)
+
+    result = {
+        'path': path,
+        'turn_deg': turn_deg,
+        'segments': len(run),
+        'skipped': skipped,
+        'runs': 0,
+        'asymmetry_pct': float(np.mean(asymmetry) * 100) if len(run) else 0.0,
+        'drift_deg_per_m': float(np.sum(turn_error) / np.sum(distance_m)) if np.sum(distance_m) else 0.0,
+        'turn_error_deg': float(np.mean(turn_error)) if len(run) else 0.0,
+        'turn_error_std': float(np.std(turn_error)) if len(run) else 0.0,
+        'outliers': int(np.sum(outlier)),
+        'per_run': [],
+    }
+
+    if len(run):
+        run_asym, count = per_run(run, asymmetry)
+        run_error, count = per_run(run, turn_error)
+        run_distance = np.bincount(run, weights=distance_m)
+        run_turn_error = np.bincount(run, weights=turn_error)
+        run_outliers = np.bincount(run, weights=outlier.astype(float))
+        present = np.nonzero(count)[0]
+        result['runs'] = len(present)
+
+        for r in present:
+            result['per_run'].append({
+                'run': int(r),
+                'segments': int(count[r]),
+                'asymmetry_pct': float(run_asym[r] * 100),
+                'drift_deg_per_m': float(run_turn_error[r] / run_distance[r]) if run_distance[r] else 0.0,
+                'turn_error_deg': float(run_error[r]),
+                'outliers': int(run_outliers[r]),
+            })
+
+    return result
+
+
+ROW = "{:<28} {:>6} {:>8} {:>10} {:>12} {:>12} {:>10} {:>9}"
+
+
+def print_table(results, show_runs):
+    print(ROW.format("log", "runs", "segments", "asym %", "drift deg/m", "turn err deg", "turn std", "outliers"))
+    for result in results:
+        if result['skipped']:
+            print("{}: {} DIF lines before the first NEW skipped".format(result['path'], result['skipped']),
+                  file=sys.stderr)
+        print(ROW.format(result['path'][-28:], result['runs'], result['segments'],
+                         "%.2f" % result['asymmetry_pct'], "%.2f" % result['drift_deg_per_m'],
+                         "%.2f" % result['turn_error_deg'], "%.2f" % result['turn_error_std'],
+                         result['outliers']))
+        if show_runs:
+            for run in result['per_run']:
+                print(ROW.format("  run %d" % run['run'], "", run['segments'],
+                                 "%.2f" % run['asymmetry_pct'], "%.2f" % run['drift_deg_per_m'],
+                                 "%.2f" % run['turn_error_deg'], "", run['outliers']))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Drift statistics for subtask logs")
+    parser.add_argument('logs', nargs='+')
+    parser.add_argument('--per-run', action='store_true', help="print a row for every run")
+    parser.add_argument('--turn-deg', type=float, default=None,
+                        help="intended turn per segment (default 180 for 1b logs, 0 otherwise)")
+    parser.add_argument('--circumference-mm', type=float, default=WHEEL_CIRCUMFERENCE_MM)
+    parser.add_argument('--wheel-distance-mm', type=float, default=WHEEL_DISTANCE_MM)
+    args = parser.parse_args(argv)
+
+    results = [analyze(path, args.turn_deg, args.circumference_mm, args.wheel_distance_mm) for path in args.logs]
+    print_table(results, args.per_run)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
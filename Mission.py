@@ -0,0 +1,158 @@
+#!/usr/bin/env micropython
+
+# Precompiled missions
+#
+# chassis.move() and MoveDifferential work out rotations, degrees and arc
+# speeds for every call and then drive relative to wherever the wheels
+# ended up, so the rounding of each move stays in the next one.
+# compile_mission() works a whole mission out before the robot moves: one
+# absolute left and right encoder target and speed per step, kept in
+# arrays. Targets are rounded from the running wheel travel, so rounding
+# never adds up however long the mission. execute() then only has to write
+# the next targets and start both motors together with run-to-abs-pos:
+#
+#   plan = compile_mission([('distance', 300), ('turn', 90), ('arc_left', 200, 150)], speed=20)
+#   execute(plan, SyncPair(tank.left_motor, tank.right_motor))
+#
+# Commands are those of Monte_Carlo.py, with an optional speed in percent
+# at the end: ('distance', mm), ('turn', degrees clockwise),
+# ('arc_right', radius_mm, mm) and ('arc_left', radius_mm, mm).
+
+import math
+from array import array
+
+from Sync import RUN_TO_ABS_POS
+
+# EV3EducationSetTire and the chassis wheel well, as in Replay.py
+WHEEL_CIRCUMFERENCE_MM = 56 * math.pi
+WHEEL_DISTANCE_MM = (10 + 1.5 * 0.7826) * 10
+COUNT_PER_ROT = 360
+MAX_SPEED = 1050        # LargeMotor, native units at 100%
+
+SPEED = 20              # percent
+
+
+def wheel_travel(command, wheel_distance_mm):
+    """
+    (left_mm, right_mm) of one command, the way MoveDifferential drives it
+    """
+    kind = command[0]
+    if kind == 'distance':
+        return (float(command[1]), float(command[1]))
+    if kind == 'turn':
+        distance_mm = abs(command[1]) / 360.0 * wheel_distance_mm * math.pi
+        if command[1] > 0:
+            return (distance_mm, -distance_mm)
+        return (-distance_mm, distance_mm)
+    if kind in ('arc_right', 'arc_left'):
+        radius_mm, distance_mm = float(command[1]), float(command[2])
+        if radius_mm < wheel_distance_mm / 2:
+            raise ValueError("radius_mm {} is less than min_circle_radius_mm {}".format(
+                radius_mm, wheel_distance_mm / 2))
+        outer = distance_mm * (radius_mm + wheel_distance_mm / 2) / radius_mm
+        inner = distance_mm * (radius_mm - wheel_distance_mm / 2) / radius_mm
+        if kind == 'arc_right':
+            return (outer, inner)
+        return (inner, outer)
+    raise ValueError("unknown command {}".format(command))
+
+
+# Position of the speed in each kind of command
+_SPEED_INDEX = {'distance': 2, 'turn': 2, 'arc_right': 3, 'arc_left': 3}
+
+
+class Plan:
+    """
+    A compiled mission: per step the absolute left and right encoder
+    targets (counts from where the mission starts) and the speeds in
+    native units that bring both wheels there at the same time
+    """
+    def __init__(self, steps):
+        self.left = array('i', [0] * steps)
+        self.right = array('i', [0] * steps)
+        self.left_speed = array('h', [0] * steps)
+        self.right_speed = array('h', [0] * steps)
+
+    def __len__(self):
+        return len(self.left)
+
+
+def compile_mission(mission, speed=SPEED, circumference_mm=WHEEL_CIRCUMFERENCE_MM,
+                    wheel_distance_mm=WHEEL_DISTANCE_MM, count_per_rot=COUNT_PER_ROT, max_speed=MAX_SPEED):
+    """
+    Compile a list of commands into a Plan. ``speed`` (percent) is used
+    for commands that do not give their own; the wheel with more to travel
+    runs at it and the other one slower in proportion, as MoveTank does.
+    Raises ValueError for a step that has to move at 0%.
+    """
+    plan = Plan(len(mission))
+    counts_per_mm = count_per_rot / circumference_mm
+    left_mm = 0.0
+    right_mm = 0.0
+
+    for i in range(len(mission)):
+        command = mission[i]
+        left_step, right_step = wheel_travel(command, wheel_distance_mm)
+        index = _SPEED_INDEX[command[0]]
+        percent = command[index] if len(command) > index else speed
+        native = abs(percent) * max_speed / 100.0
+
+        left_mm += left_step
+        right_mm += right_step
+        plan.left[i] = int(round(left_mm * counts_per_mm))
+        plan.right[i] = int(round(right_mm * counts_per_mm))
+
+        # the wheel with the longer way runs at full speed
+        longest = max(abs(left_step), abs(right_step))
+        if longest and int(round(native)) < 1:
+            # a wheel at speed_sp 0 never gets there and execute() would wait forever
+            raise ValueError("step {} {} has to move at speed {}%".format(i, command, percent))
+        if longest:
+            left_speed = native * abs(left_step) / longest
+            right_speed = native * abs(right_step) / longest
+        else:
+            left_speed = right_speed = 0.0
+        plan.left_speed[i] = int(round(left_speed)) if not left_step or left_speed >= 1 else 1
+        plan.right_speed[i] = int(round(right_speed)) if not right_step or right_speed >= 1 else 1
+
+    return plan
+
+
+def execute(plan, pair, brake=True, start=0, stop=None):
+    """
+    Drive steps ``start`` to ``stop`` of ``plan`` on the motors of a
+    Sync.SyncPair, each one as soon as the one before settled. Targets are
+    taken relative to the wheel positions when the call is made for step 0,
+    or to where step ``start`` - 1 ended for a later start.
+    """
+    left_motor = pair.left_motor
+    right_motor = pair.right_motor
+    left_targets = plan.left
+    right_targets = plan.right
+    left_speeds = plan.left_speed
+    right_speeds = plan.right_speed
+    stop = len(plan) if stop is None else stop
+
+    left_base = left_motor.position
+    right_base = right_motor.position
+    if start:
+        left_base -= left_targets[start - 1]
+        right_base -= right_targets[start - 1]
+
+    left_motor._set_brake(brake)
+    right_motor._set_brake(brake)
+    left_speed = None
+    right_speed = None
+
+    for i in range(start, stop):
+        # speed_sp only changes between commands
+        if left_speeds[i] != left_speed:
+            left_speed = left_speeds[i]
+            left_motor.speed_sp = left_speed
+        if right_speeds[i] != right_speed:
+            right_speed = right_speeds[i]
+            right_motor.speed_sp = right_speed
+        left_motor.position_sp = left_base + left_targets[i]
+        right_motor.position_sp = right_base + right_targets[i]
+        pair.start(RUN_TO_ABS_POS)
+        pair.wait()
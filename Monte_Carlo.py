@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+
+# Monte Carlo pose error of a planned mission
+#
+# A mission is the list of drive commands MoveDifferential will be given:
+#
+#   ('distance', mm)                on_for_distance()
+#   ('turn', degrees)               _turn(), positive is clockwise
+#   ('arc_right', radius_mm, mm)    on_arc_right()
+#   ('arc_left', radius_mm, mm)     on_arc_left()
+#
+# Every sample gets its own wheel diameter and wheel distance errors and
+# fresh slip and stopping noise on every stretch of the mission. Its true
+# pose is integrated next to the pose odometry would report from the same
+# encoder ticks, all samples at once as NumPy arrays, and the samples are
+# split over a process pool. The spread of the final poses gives the
+# covariance and error ellipses, and rank_routes() orders alternative routes
+# by how far off the robot is predicted to end up.
+#
+# Usage: python3 Monte_Carlo.py mission.json [more.json ...] [-n 20000]
+#
+# where a mission file is a JSON list of commands, e.g.
+# [["distance", 500], ["turn", -90], ["arc_left", 200, 300]]
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import sys
+
+import numpy as np
+
+from Mission import wheel_travel
+
+# EV3EducationSetTire and the chassis wheel well, as in Log_Analyzer.py
+WHEEL_CIRCUMFERENCE_MM = 56 * math.pi
+WHEEL_DISTANCE_MM = (10 + 1.5 * 0.7826) * 10
+COUNT_PER_ROT = 360
+
+# chi-square quantiles with 2 degrees of freedom, for the ellipses
+CONFIDENCE_SCALE = {0.5: 1.386, 0.9: 4.605, 0.95: 5.991, 0.99: 9.210}
+
+# Below this many samples a pool costs more than it saves
+POOL_MIN_SAMPLES = 20000
+
+
+class NoiseModel:
+    """
+    Sources of error, all as standard deviations.
+
+    ``wheel_scale`` and ``track_scale`` are relative errors of each wheel's
+    effective diameter and of the wheel distance, drawn once per sample (a
+    badly calibrated robot). ``slip`` is the relative error of the travel of
+    each wheel over every ``segment_mm`` of straight driving and
+    ``turn_slip`` the same while turning on the spot, where the tires scrub.
+    ``ticks`` is how far from its target a motor stops.
+    """
+    def __init__(self, wheel_scale=0.003, track_scale=0.01, slip=0.01, turn_slip=0.02, ticks=1.0,
+                 segment_mm=50.0):
+        self.wheel_scale = wheel_scale
+        self.track_scale = track_scale
+        self.slip = slip
+        self.turn_slip = turn_slip
+        self.ticks = ticks
+        self.segment_mm = segment_mm
+
+
+def mission_from_waypoints(waypoints, start=(0.0, 0.0, 90.0)):
+    """
+    The turns and drives on_to_coordinates() makes to visit ``waypoints``
+    from ``start`` (x_mm, y_mm, heading in degrees), e.g. for the output of
+    Field.plan() or a Tour.plan_order() route
+    """
+    x, y, heading = float(start[0]), float(start[1]), float(start[2])
+    mission = []
+    for (tx, ty) in waypoints:
+        target = math.degrees(math.atan2(ty - y, tx - x))
+        delta = (target - heading + 180.0) % 360.0 - 180.0
+        if delta:
+            # turn_to_angle() turns left for a positive delta, _turn() counts
+            # clockwise as positive
+            mission.append(('turn', -delta))
+        mission.append(('distance', math.hypot(tx - x, ty - y)))
+        x, y, heading = tx, ty, target
+    return mission
+
+
+def _arc(x, y, theta, left_mm, right_mm, track_mm):
+    """
+    Advance arrays of poses along constant curvature steps, the vector form
+    of Kinematics.ARC
+    """
+    mm = (left_mm + right_mm) / 2.0
+    dtheta = (right_mm - left_mm) / track_mm
+    half = dtheta / 2.0
+    # chord length over arc length, np.sinc(x) is sin(pi x) / (pi x)
+    chord = mm * np.sinc(half / np.pi)
+    heading = theta + half
+    return x + chord * np.cos(heading), y + chord * np.sin(heading), theta + dtheta
+
+
+def simulate(mission, samples, noise=None, seed=0, start=(0.0, 0.0, 90.0),
+             circumference_mm=WHEEL_CIRCUMFERENCE_MM, wheel_distance_mm=WHEEL_DISTANCE_MM):
+    """
+    Propagate ``samples`` trajectories through the mission in one process.
+
+    Returns ``(true, odometry, growth)``: the true and odometry final poses
+    as (samples, 3) arrays of x_mm, y_mm, theta, and for every command the
+    RMS position error of odometry against the truth after it.
+    """
+    noise = noise or NoiseModel()
+    rng = np.random.default_rng(seed)
+    mm_per_tick = circumference_mm / COUNT_PER_ROT
+
+    left_scale = 1.0 + rng.normal(0.0, noise.wheel_scale, samples)
+    right_scale = 1.0 + rng.normal(0.0, noise.wheel_scale, samples)
+    track = wheel_distance_mm * (1.0 + rng.normal(0.0, noise.track_scale, samples))
+
+    x0, y0, theta0 = float(start[0]), float(start[1]), math.radians(start[2])
+    tx = np.full(samples, x0)
+    ty = np.full(samples, y0)
+    ttheta = np.full(samples, theta0)
+    ox = tx.copy()
+    oy = ty.copy()
+    otheta = ttheta.copy()
+
+    growth = []
+    for command in mission:
+        left_mm, right_mm = wheel_travel(command, wheel_distance_mm)
+        slip = noise.turn_slip if command[0] == 'turn' else noise.slip
+        longest = max(abs(left_mm), abs(right_mm))
+        segments = max(1, int(math.ceil(longest / noise.segment_mm)))
+
+        # where the motors actually stop, in ticks
+        left_ticks = left_mm / mm_per_tick + rng.normal(0.0, noise.ticks, samples)
+        right_ticks = right_mm / mm_per_tick + rng.normal(0.0, noise.ticks, samples)
+
+        # odometry only sees the ticks, and the ticks of a command lie on
+        # one arc
+        ox, oy, otheta = _arc(ox, oy, otheta, left_ticks * mm_per_tick, right_ticks * mm_per_tick,
+                              wheel_distance_mm)
+
+        # the floor sees the real wheels, slipping a little differently on
+        # every segment
+        left_step = left_ticks * (mm_per_tick / segments) * left_scale
+        right_step = right_ticks * (mm_per_tick / segments) * right_scale
+        left_slip = 1.0 + rng.normal(0.0, slip, (segments, samples))
+        right_slip = 1.0 + rng.normal(0.0, slip, (segments, samples))
+        for segment in range(segments):
+            tx, ty, ttheta = _arc(tx, ty, ttheta, left_step * left_slip[segment],
+                                  right_step * right_slip[segment], track)
+
+        growth.append(float(np.sqrt(np.mean((tx - ox) ** 2 + (ty - oy) ** 2))))
+
+    true = np.column_stack((tx, ty, ttheta))
+    odometry = np.column_stack((ox, oy, otheta))
+    return true, odometry, growth
+
+
+def _simulate_job(job):
+    return simulate(*job)
+
+
+def _wrap(angle):
+    return (angle + np.pi) % (2 * np.pi) - np.pi
+
+
+def ellipse(cov_xy, confidence=0.95):
+    """
+    (semi_major_mm, semi_minor_mm, angle_degrees) of the ``confidence``
+    error ellipse of a 2x2 position covariance
+    """
+    scale = CONFIDENCE_SCALE[confidence]
+    values, vectors = np.linalg.eigh(cov_xy)
+    major = vectors[:, 1]
+    return (float(np.sqrt(scale * max(values[1], 0.0))),
+            float(np.sqrt(scale * max(values[0], 0.0))),
+            float(np.degrees(np.arctan2(major[1], major[0]))))
+
+
+def evaluate(mission, samples=20000, noise=None, seed=0, processes=None, start=(0.0, 0.0, 90.0),
+             circumference_mm=WHEEL_CIRCUMFERENCE_MM, wheel_distance_mm=WHEEL_DISTANCE_MM):
+    """
+    Monte Carlo pose error of a mission, split over ``processes`` worker
+    processes (all cores by default, 1 runs in this process).
+
+    The result has the covariance of the odometry error (true pose minus
+    the pose odometry reports) and of the drift from the plan (true pose
+    minus the planned end pose), each with its 95% error ellipse, and the
+    RMS odometry position error after every command.
+    """
+    noise = noise or NoiseModel()
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if samples < POOL_MIN_SAMPLES:
+        processes = 1
+
+    # independent, reproducible streams for each worker
+    seeds = np.random.SeedSequence(seed).spawn(processes)
+    counts = [samples // processes + (1 if i < samples % processes else 0) for i in range(processes)]
+    jobs = [(mission, count, noise, child, start, circumference_mm, wheel_distance_mm)
+            for count, child in zip(counts, seeds) if count]
+
+    if len(jobs) == 1:
+        parts = [_simulate_job(jobs[0])]
+    else:
+        with multiprocessing.Pool(len(jobs)) as pool:
+            parts = pool.map(_simulate_job, jobs)
+
+    true = np.concatenate([part[0] for part in parts])
+    odometry = np.concatenate([part[1] for part in parts])
+    weights = np.array([len(part[0]) for part in parts], dtype=float)
+    growth = np.sqrt(np.average(np.array([part[2] for part in parts]) ** 2, axis=0, weights=weights))
+
+    # the pose with no noise at all
+    planned = simulate(mission, 1, NoiseModel(0, 0, 0, 0, 0, noise.segment_mm), 0, start,
+                       circumference_mm, wheel_distance_mm)[0][0]
+
+    result = {'samples': len(true), 'processes': len(jobs), 'planned': [float(v) for v in planned],
+              'growth_rms_mm': [float(v) for v in growth]}
+    for name, reference in (('odometry', odometry), ('plan', planned[None, :])):
+        error = true - reference
+        error[:, 2] = _wrap(error[:, 2])
+        cov = np.cov(error, rowvar=False)
+        major, minor, angle = ellipse(cov[:2, :2])
+        result[name] = {
+            'mean': [float(v) for v in error.mean(axis=0)],
+            'cov': cov.tolist(),
+            'rms_mm': float(np.sqrt(np.mean(error[:, 0] ** 2 + error[:, 1] ** 2))),
+            'heading_std_deg': float(np.degrees(np.sqrt(cov[2, 2]))),
+            'ellipse95': {'major_mm': major, 'minor_mm': minor, 'angle_deg': angle},
+        }
+    return result
+
+
+def rank_routes(missions, key='plan', **kwargs):
+    """
+    Evaluate alternative missions and return ``(index, result)`` pairs from
+    the one predicted to end up closest to where it was meant to, ranked by
+    the RMS position error of ``key`` ('plan' or 'odometry')
+    """
+    results = [(i, evaluate(mission, **kwargs)) for i, mission in enumerate(missions)]
+    results.sort(key=lambda item: item[1][key]['rms_mm'])
+    return results
+
+
+def print_result(name, result):
+    print("{}: {} samples on {} processes, planned end ({:.0f}, {:.0f}) mm at {:.1f} deg".format(
+        name, result['samples'], result['processes'], result['planned'][0], result['planned'][1],
+        math.degrees(result['planned'][2])))
+    for key, label in (('odometry', "odometry error"), ('plan', "drift from plan")):
+        part = result[key]
+        e = part['ellipse95']
+        print("  {:16} rms {:7.1f} mm  heading std {:5.2f} deg  95% ellipse {:.1f} x {:.1f} mm at {:.0f} deg".format(
+            label, part['rms_mm'], part['heading_std_deg'], e['major_mm'], e['minor_mm'], e['angle_deg']))
+    print("  odometry rms after each command: " +
+          " ".join("%.1f" % value for value in result['growth_rms_mm']))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Monte Carlo pose error of missions")
+    parser.add_argument('missions', nargs='+', help="JSON files with a list of commands")
+    parser.add_argument('-n', '--samples', type=int, default=20000)
+    parser.add_argument('-p', '--processes', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--slip', type=float, default=NoiseModel().slip)
+    parser.add_argument('--turn-slip', type=float, default=NoiseModel().turn_slip)
+    parser.add_argument('--wheel-scale', type=float, default=NoiseModel().wheel_scale)
+    parser.add_argument('--track-scale', type=float, default=NoiseModel().track_scale)
+    args = parser.parse_args(argv)
+
+    noise = NoiseModel(wheel_scale=args.wheel_scale, track_scale=args.track_scale,
+                       slip=args.slip, turn_slip=args.turn_slip)
+    missions = []
+    for path in args.missions:
+        with open(path) as f:
+            missions.append([tuple(command) for command in json.load(f)])
+
+    ranked = rank_routes(missions, samples=args.samples, noise=noise, seed=args.seed, processes=args.processes)
+    for i, result in ranked:
+        print_result(args.missions[i], result)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -1,5 +1,25 @@
 
-from ev3dev2.motor import MoveTank
+import _thread
+import logging
+import math
+import time
+
+from ev3dev2.motor import MoveTank, LargeMotor
+from Encoders import EncoderPair
+from Scheduler import RateScheduler
+from PoseHistory import PoseRing
+from Kinematics import PoseIntegrator, ARC
+from Pursuit import PurePursuit
+from Latency import SETUP, WRITE, wait_moving
+
+log = logging.getLogger(__name__)
+
+# follow_path() gives up when the way left along the path has not gone down
+# by STALL_MM in STALL_TIME seconds
+STALL_TIME = 3.0
+STALL_MM = 5.0
+
+
 class MoveDifferential(MoveTank):
     """
     MoveDifferential is a child of MoveTank that adds the following capabilities:
@@ -71,6 +91,9 @@ class MoveDifferential(MoveTank):
         # Use odometry to rotate in place to 90 degrees
         mdiff.turn_to_angle(SpeedRPM(40), 90)
 
+        # Use odometry to drive through several points without stopping
+        mdiff.follow_path([(300, 0), (300, 300), (0, 0)], SpeedRPM(40), 150)
+
         # Disable odometry
         mdiff.odometry_stop()
     """
@@ -80,7 +103,8 @@ class MoveDifferential(MoveTank):
                  wheel_class,
                  wheel_distance_mm,
                  desc=None,
-                 motor_class=LargeMotor):
+                 motor_class=LargeMotor,
+                 pose_history_size=512):
 
         MoveTank.__init__(self, left_motor_port, right_motor_port, desc, motor_class)
         self.wheel = wheel_class()
@@ -97,15 +121,51 @@ class MoveDifferential(MoveTank):
         self.odometry_thread_run = False
         self.odometry_thread_id = None
         self.theta = 0.0
+        self.encoders = None
+        self.odometry_scheduler = None
+        self.odometry_done = _thread.allocate_lock()
+
+        # Timestamped poses written by the odometry thread, read with
+        # odometry_pose() / odometry_pose_at()
+        self.pose_history = PoseRing(pose_history_size)
+        self.odometry_integrator = None
+        self.path_stats = None
+
+        # Latency.LatencyRecorder timing the phases of every command, or None
+        self.latency = None
+
+    def _tank(self, command, left_speed, right_speed, amount, brake, block):
+        """
+        Issue a MoveTank command. When latency is being recorded the wait
+        for a blocking command is done here, so the time until the wheels
+        move and until they settle can be told apart, and the command begun
+        by the caller is ended.
+        """
+        latency = self.latency
+        if latency is None:
+            command(self, left_speed, right_speed, amount, brake, block)
+            return
+
+        try:
+            latency.mark(SETUP)
+            command(self, left_speed, right_speed, amount, brake, False)
+            latency.mark(WRITE)
+            if block:
+                wait_moving((self.left_motor, self.right_motor), latency)
+        finally:
+            latency.end()
 
     def on_for_distance(self, speed, distance_mm, brake=True, block=True):
         """
         Drive distance_mm
         """
+        if self.latency is not None:
+            self.latency.begin('on_for_distance' if block else 'on_for_distance_issue')
+
         rotations = distance_mm / self.wheel.circumference_mm
         log.debug("%s: on_for_rotations distance_mm %s, rotations %s, speed %s" % (self, distance_mm, rotations, speed))
 
-        MoveTank.on_for_rotations(self, speed, speed, rotations, brake, block)
+        self._tank(MoveTank.on_for_rotations, speed, speed, rotations, brake, block)
 
     def _on_arc(self, speed, radius_mm, distance_mm, brake, block, arc_right):
         """
@@ -116,6 +176,9 @@ class MoveDifferential(MoveTank):
             raise ValueError("{}: radius_mm {} is less than min_circle_radius_mm {}".format(
                 self, radius_mm, self.min_circle_radius_mm))
 
+        if self.latency is not None:
+            self.latency.begin('on_arc' if block else 'on_arc_issue')
+
         # The circle formed at the halfway point between the two wheels is the
         # circle that must have a radius of radius_mm
         circle_outer_mm = 2 * math.pi * (radius_mm + (self.wheel_distance_mm / 2))
@@ -156,7 +219,7 @@ class MoveDifferential(MoveTank):
             % (self, "right" if arc_right else "left", circle_middle_percentage, circle_outer_final_mm,
                outer_wheel_rotations, outer_wheel_degrees))
 
-        MoveTank.on_for_degrees(self, left_speed, right_speed, outer_wheel_degrees, brake, block)
+        self._tank(MoveTank.on_for_degrees, left_speed, right_speed, outer_wheel_degrees, brake, block)
 
     def on_arc_right(self, speed, radius_mm, distance_mm, brake=True, block=True):
         """
@@ -175,6 +238,8 @@ class MoveDifferential(MoveTank):
         Rotate in place 'degrees'. Both wheels must turn at the same speed for us
         to rotate in place.
         """
+        if self.latency is not None:
+            self.latency.begin('turn' if block else 'turn_issue')
 
         # The distance each wheel needs to travel
         distance_mm = (abs(degrees) / 360) * self.circumference_mm
@@ -187,12 +252,12 @@ class MoveDifferential(MoveTank):
 
         # If degrees is positive rotate clockwise
         if degrees > 0:
-            MoveTank.on_for_rotations(self, speed, speed * -1, rotations, brake, block)
+            self._tank(MoveTank.on_for_rotations, speed, speed * -1, rotations, brake, block)
 
         # If degrees is negative rotate counter-clockwise
         else:
             rotations = distance_mm / self.wheel.circumference_mm
-            MoveTank.on_for_rotations(self, speed * -1, speed, rotations, brake, block)
+            self._tank(MoveTank.on_for_rotations, speed * -1, speed, rotations, brake, block)
 
     def turn_right(self, speed, degrees, brake=True, block=True):
         """
@@ -209,76 +274,136 @@ class MoveDifferential(MoveTank):
     def odometry_coordinates_log(self):
         log.debug("%s: odometry angle %s at (%d, %d)" % (self, math.degrees(self.theta), self.x_pos_mm, self.y_pos_mm))
 
-    def odometry_start(self, theta_degrees_start=90.0, x_pos_start=0.0, y_pos_start=0.0, sleep_time=0.005):  # 5ms
+    def odometry_start(self, theta_degrees_start=90.0, x_pos_start=0.0, y_pos_start=0.0, sleep_time=0.005,  # 5ms
+                       integration=ARC, recorder=None):
         """
         Ported from:
         http://seattlerobotics.org/encoder/200610/Article3/IMU%20Odometry,%20by%20David%20Anderson.htm
 
         A thread is started that will run until the user calls odometry_stop()
         which will set odometry_thread_run to False
-        """
-        def _odometry_monitor():
-            left_previous = 0
-            right_previous = 0
-            self.theta = math.radians(theta_degrees_start)  # robot heading
-            self.x_pos_mm = x_pos_start  # robot X position in mm
-            self.y_pos_mm = y_pos_start  # robot Y position in mm
-            TWO_PI = 2 * math.pi
-
-            while self.odometry_thread_run:
-
-                # sample the left and right encoder counts as close together
-                # in time as possible
-                left_current = self.left_motor.position
-                right_current = self.right_motor.position
-
-                # determine how many ticks since our last sampling
-                left_ticks = left_current - left_previous
-                right_ticks = right_current - right_previous
-
-                # Have we moved?
-                if not left_ticks and not right_ticks:
-                    if sleep_time:
-                        time.sleep(sleep_time)
-                    continue
-
-                # log.debug("%s: left_ticks %s (from %s to %s)" %
-                #     (self, left_ticks, left_previous, left_current))
-                # log.debug("%s: right_ticks %s (from %s to %s)" %
-                #     (self, right_ticks, right_previous, right_current))
-
-                # update _previous for next time
-                left_previous = left_current
-                right_previous = right_current
-
-                # rotations = distance_mm/self.wheel.circumference_mm
-                left_rotations = float(left_ticks / self.left_motor.count_per_rot)
-                right_rotations = float(right_ticks / self.right_motor.count_per_rot)
 
-                # convert longs to floats and ticks to mm
-                left_mm = float(left_rotations * self.wheel.circumference_mm)
-                right_mm = float(right_rotations * self.wheel.circumference_mm)
+        The loop is paced on a fixed grid of ``sleep_time`` seconds rather than
+        sleeping ``sleep_time`` after every pass, see odometry_rate_stats()
+        for how closely it kept up.
 
-                # calculate distance we have traveled since last sampling
-                mm = (left_mm + right_mm) / 2.0
+        ``integration`` picks how each sample is folded into the pose, see
+        Kinematics.PoseIntegrator. The default ARC mode is exact for arcs and
+        stays accurate at much lower sample rates than the original EULER.
 
-                # accumulate total rotation around our center
-                self.theta += (right_mm - left_mm) / self.wheel_distance_mm
+        ``recorder`` is an optional Telemetry.TelemetryRecorder that gets
+        every sample, moving or not. It is flushed when odometry stops.
 
-                # and clip the rotation to plus or minus 360 degrees
-                self.theta -= float(int(self.theta / TWO_PI) * TWO_PI)
+        Does nothing if odometry is already running.
+        """
+        if self.odometry_thread_run:
+            log.warning("%s: odometry_start() called while odometry is running, ignored" % self)
+            return
+
+        encoders = EncoderPair.from_motors(self.left_motor, self.right_motor)
+        self.encoders = encoders
+        scheduler = RateScheduler(sleep_time)
+        self.odometry_scheduler = scheduler
+        history = self.pose_history
+        history.clear()
+
+        # ticks to mm factors are fixed for the run, work them out once
+        integrator = PoseIntegrator.for_wheel(self.wheel.circumference_mm,
+                                              self.left_motor.count_per_rot,
+                                              self.right_motor.count_per_rot,
+                                              self.wheel_distance_mm,
+                                              integration)
+        self.odometry_integrator = integrator
 
-                # now calculate and accumulate our position in mm
-                self.x_pos_mm += mm * math.cos(self.theta)
-                self.y_pos_mm += mm * math.sin(self.theta)
+        def _odometry_monitor():
+            try:
+                self.theta = math.radians(theta_degrees_start)  # robot heading
+                self.x_pos_mm = x_pos_start  # robot X position in mm
+                self.y_pos_mm = y_pos_start  # robot Y position in mm
+                integrator.reset(self.x_pos_mm, self.y_pos_mm, self.theta)
+                scheduler.start()
+                history.append(encoders.clock(), self.x_pos_mm, self.y_pos_mm, self.theta)
+
+                # Time of the latest sample that saw no movement, the pose is
+                # re-stamped with it once we move again so pose_at() does not
+                # interpolate across the time spent standing still
+                idle_time = None
+
+                while self.odometry_thread_run:
+
+                    # sample the left and right encoder counts as close together
+                    # in time as possible
+                    sample_time, left_current, right_current = encoders.read()
+
+                    # accumulate our position in mm and rotation around our center,
+                    # unless we have not moved since the last sample. Replay.py runs
+                    # recordings through the same step().
+                    if not integrator.step(left_current, right_current):
+                        if recorder is not None:
+                            recorder.append(sample_time, left_current, right_current,
+                                            self.x_pos_mm, self.y_pos_mm, self.theta)
+                        idle_time = sample_time
+                        scheduler.wait()
+                        continue
+
+                    if idle_time is not None:
+                        history.append(idle_time, self.x_pos_mm, self.y_pos_mm, self.theta)
+                        idle_time = None
+
+                    self.theta = integrator.theta
+                    self.x_pos_mm = integrator.x_mm
+                    self.y_pos_mm = integrator.y_mm
+
+                    history.append(sample_time, self.x_pos_mm, self.y_pos_mm, self.theta)
+
+                    if recorder is not None:
+                        recorder.append(sample_time, left_current, right_current,
+                                        self.x_pos_mm, self.y_pos_mm, self.theta)
+
+                    scheduler.wait()
+            finally:
+                # also when a read or a step raised, so odometry_stop() does not
+                # wait forever and odometry can be started again
+                self.odometry_thread_run = False
+                try:
+                    encoders.close()
+                    if recorder is not None:
+                        recorder.flush()
+                finally:
+                    self.odometry_thread_id = None
+                    self.odometry_done.release()
+
+        self.odometry_done.acquire()
+        self.odometry_thread_run = True
+        self.odometry_thread_id = _thread.start_new_thread(_odometry_monitor, ())
 
-                if sleep_time:
-                    time.sleep(sleep_time)
+    def odometry_pose(self):
+        """
+        Consistent ``(x_mm, y_mm, theta)`` snapshot of the latest pose
+        """
+        pose = self.pose_history.snapshot()
+        if pose is None:
+            return (self.x_pos_mm, self.y_pos_mm, self.theta)
+        return pose[1:]
 
-            self.odometry_thread_id = None
+    def odometry_pose_at(self, timestamp):
+        """
+        ``(x_mm, y_mm, theta)`` where the robot was at ``timestamp``, taken on
+        the same clock as ``self.encoders.clock``. None if that is older than
+        the history kept.
+        """
+        pose = self.pose_history.pose_at(timestamp)
+        if pose is None:
+            return None
+        return pose[1:]
 
-        self.odometry_thread_run = True
-        self.odometry_thread_id = _thread.start_new_thread(_odometry_monitor, ())
+    def odometry_encoder_skew(self):
+        """
+        Skew between the paired left/right encoder reads of the odometry loop
+        """
+        if self.encoders is None:
+            return None
+        return self.encoders.skew_stats()
 
     def odometry_stop(self):
         """
@@ -288,8 +413,18 @@ class MoveDifferential(MoveTank):
         if self.odometry_thread_id:
             self.odometry_thread_run = False
 
-            while self.odometry_thread_id:
-                pass
+            # Block until the thread releases the lock on its way out
+            self.odometry_done.acquire()
+            self.odometry_done.release()
+
+    def odometry_rate_stats(self):
+        """
+        Achieved rate, jitter percentiles, overruns and skipped samples of the
+        odometry loop
+        """
+        if self.odometry_scheduler is None:
+            return None
+        return self.odometry_scheduler.stats()
 
     def turn_to_angle(self, speed, angle_target_degrees, brake=True, block=True):
         """
@@ -301,7 +436,8 @@ class MoveDifferential(MoveTank):
         if angle_target_degrees < 0:
             angle_target_degrees += 360
 
-        angle_current_degrees = math.degrees(self.theta)
+        x_pos_mm, y_pos_mm, theta = self.odometry_pose()
+        angle_current_degrees = math.degrees(theta)
 
         if angle_current_degrees < 0:
             angle_current_degrees += 360
@@ -340,12 +476,90 @@ class MoveDifferential(MoveTank):
         self.off(brake='hold')
 
         # rotate in place so we are pointed straight at our target
-        x_delta = x_target_mm - self.x_pos_mm
-        y_delta = y_target_mm - self.y_pos_mm
+        x_pos_mm, y_pos_mm, theta = self.odometry_pose()
+        x_delta = x_target_mm - x_pos_mm
+        y_delta = y_target_mm - y_pos_mm
         angle_target_radians = math.atan2(y_delta, x_delta)
         angle_target_degrees = math.degrees(angle_target_radians)
         self.turn_to_angle(speed, angle_target_degrees, brake=True, block=True)
 
         # drive in a straight line to the target coordinates
-        distance_mm = math.sqrt(pow(self.x_pos_mm - x_target_mm, 2) + pow(self.y_pos_mm - y_target_mm, 2))
+        x_pos_mm, y_pos_mm, theta = self.odometry_pose()
+        distance_mm = math.sqrt(pow(x_pos_mm - x_target_mm, 2) + pow(y_pos_mm - y_target_mm, 2))
         self.on_for_distance(speed, distance_mm, brake, block)
+
+    def follow_path(self, waypoints, speed, lookahead_mm, tolerance_mm=10, brake=True, period=0.02,
+                    timeout=None, stall_time=STALL_TIME, stall_mm=STALL_MM):
+        """
+        Drive through ``waypoints`` (list of ``(x_mm, y_mm)``) without stopping
+        at each one, steering toward a point ``lookahead_mm`` ahead on the path
+        (pure pursuit). Wheel speeds are updated every ``period`` seconds from
+        the live odometry pose.
+
+        Gives up after ``timeout`` seconds, or when the way left along the
+        path has not gone down by ``stall_mm`` for ``stall_time`` seconds
+        (stalled wheels, or a path the robot keeps circling). The motors are
+        stopped however the call ends.
+
+        Returns a dict with the mission time, the cross-track error and the
+        outcome ('done', 'stalled' or 'timeout'), which is also kept in
+        ``self.path_stats``.
+        """
+        assert self.odometry_thread_id, "odometry_start() must be called to track robot coordinates"
+
+        pursuit = PurePursuit(waypoints, lookahead_mm, self.wheel_distance_mm, tolerance_mm)
+        scheduler = RateScheduler(period)
+        clock = scheduler.clock
+
+        x_pos_mm, y_pos_mm, theta = self.odometry_pose()
+        pursuit.start(x_pos_mm, y_pos_mm)
+        started = clock()
+        scheduler.start()
+
+        # the least way left so far and when it last went down by stall_mm
+        best = pursuit.remaining(x_pos_mm, y_pos_mm)
+        progressed = started
+        outcome = 'done'
+
+        last = None
+        try:
+            while True:
+                x_pos_mm, y_pos_mm, theta = self.odometry_pose()
+                factors = pursuit.step(x_pos_mm, y_pos_mm, theta)
+                if factors is None:
+                    break
+
+                now = clock()
+                remaining = pursuit.remaining(x_pos_mm, y_pos_mm)
+                if remaining <= best - stall_mm:
+                    best = remaining
+                    progressed = now
+                elif now - progressed > stall_time:
+                    outcome = 'stalled'
+                    break
+                if timeout is not None and now - started > timeout:
+                    outcome = 'timeout'
+                    break
+
+                # Only write new speeds when they changed enough to matter, each
+                # on() is several sysfs writes per motor
+                if last is None or abs(factors[0] - last[0]) > 0.01 or abs(factors[1] - last[1]) > 0.01:
+                    self.on(speed * factors[0], speed * factors[1])
+                    last = factors
+
+                scheduler.wait()
+        finally:
+            self.off(brake=brake)
+
+        self.path_stats = {
+            'outcome': outcome,
+            'mission_time': clock() - started,
+            'cross_track_max_mm': pursuit.cross_track_max,
+            'cross_track_rms_mm': pursuit.cross_track_rms(),
+            'control_hz': scheduler.stats()['achieved_hz'],
+        }
+        if outcome != 'done':
+            log.warning("%s: follow_path gave up, %s with %.0f mm to go" % (self, outcome, best))
+        log.debug("%s: follow_path %s" % (self, self.path_stats))
+        self.odometry_coordinates_log()
+        return self.path_stats
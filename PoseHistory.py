@@ -0,0 +1,148 @@
+#!/usr/bin/env micropython
+
+# Timestamped pose history for the odometry thread
+#
+# The ring is preallocated once, the writer only stores floats into arrays
+# and bumps a sequence counter, so appending never allocates and never
+# takes a lock. Readers check the counter before and after they copy and
+# retry if the writer got in the way (a seqlock).
+
+import math
+from array import array
+
+TWO_PI = 2 * math.pi
+
+
+class PoseRing:
+    """
+    Fixed-size ring of ``(timestamp, x_mm, y_mm, theta)`` poses.
+
+    There is exactly one writer, the odometry thread, which calls append().
+    Any number of readers may call snapshot(), pose_at() or poses() at the
+    same time and always get a pose that was written as a whole.
+    """
+    def __init__(self, size=512):
+        self.size = size
+        self.t = array('d', [0.0] * size)
+        self.x = array('d', [0.0] * size)
+        self.y = array('d', [0.0] * size)
+        self.theta = array('d', [0.0] * size)
+
+        # Number of poses ever written, the newest lives at (count - 1) % size
+        self.count = 0
+
+        # Odd while the writer is in the middle of an append
+        self.seq = 0
+
+    def clear(self):
+        self.seq += 1
+        self.count = 0
+        self.seq += 1
+
+    def append(self, timestamp, x_mm, y_mm, theta):
+        index = self.count % self.size
+        self.seq += 1
+        self.t[index] = timestamp
+        self.x[index] = x_mm
+        self.y[index] = y_mm
+        self.theta[index] = theta
+        self.count += 1
+        self.seq += 1
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+    def snapshot(self):
+        """
+        Newest pose as ``(timestamp, x_mm, y_mm, theta)`` or None if empty
+        """
+        while True:
+            seq = self.seq
+            if seq & 1:
+                continue
+            count = self.count
+            if not count:
+                return None
+            index = (count - 1) % self.size
+            pose = (self.t[index], self.x[index], self.y[index], self.theta[index])
+            if self.seq == seq:
+                return pose
+
+    def pose_at(self, timestamp):
+        """
+        Pose at ``timestamp`` interpolated between the two poses around it.
+
+        Returns None if ``timestamp`` is older than the oldest pose still in
+        the ring. A ``timestamp`` newer than the newest pose returns the
+        newest pose, the robot is not extrapolated forward.
+        """
+        while True:
+            seq = self.seq
+            if seq & 1:
+                continue
+            pose = self._pose_at(timestamp)
+            if self.seq == seq:
+                return pose
+
+    def _pose_at(self, timestamp):
+        size = self.size
+        count = self.count
+        stored = min(count, size)
+        if not stored:
+            return None
+
+        first = count - stored
+        t = self.t
+
+        oldest = first % size
+        if timestamp < t[oldest]:
+            return None
+
+        newest = (count - 1) % size
+        if timestamp >= t[newest]:
+            return (t[newest], self.x[newest], self.y[newest], self.theta[newest])
+
+        # Binary search for the last pose at or before timestamp
+        lo = 0
+        hi = stored - 1
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if t[(first + mid) % size] <= timestamp:
+                lo = mid
+            else:
+                hi = mid
+
+        a = (first + lo) % size
+        b = (first + hi) % size
+        span = t[b] - t[a]
+        frac = (timestamp - t[a]) / span if span > 0 else 0.0
+
+        # Interpolate theta along the short way round
+        dtheta = self.theta[b] - self.theta[a]
+        if dtheta > math.pi:
+            dtheta -= TWO_PI
+        elif dtheta < -math.pi:
+            dtheta += TWO_PI
+
+        return (timestamp,
+                self.x[a] + (self.x[b] - self.x[a]) * frac,
+                self.y[a] + (self.y[b] - self.y[a]) * frac,
+                self.theta[a] + dtheta * frac)
+
+    def poses(self):
+        """
+        Copy of every pose in the ring, oldest first
+        """
+        while True:
+            seq = self.seq
+            if seq & 1:
+                continue
+            count = self.count
+            size = self.size
+            stored = min(count, size)
+            out = []
+            for i in range(count - stored, count):
+                index = i % size
+                out.append((self.t[index], self.x[index], self.y[index], self.theta[index]))
+            if self.seq == seq:
+                return out
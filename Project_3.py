@@ -11,6 +11,8 @@ from ev3dev2.sensor.lego import TouchSensor
 import ev3dev2.motor
 # Import sound
 from ev3dev2.sound import Sound
+# Stops the motor straight from the sensor loop
+from Triggers import TriggerEngine
 
 
 # Create instances of the Sensor and Motor
@@ -21,13 +23,19 @@ sound_play = Sound()
 speed_value = ev3dev2.motor.SpeedPercent(-1.8)# Speed set at 10%
 
 
+# Stop the Motor as soon as the touch sensor is pressed, checked every 2 ms
+engine = TriggerEngine(period=0.002)
+engine.when(touch, 'is_pressed', '==', 1, stop=[motor], name='touch_limit')
+
 # Start Motor at Speed
 motor.on(speed_value)
-# Wait for touch sensor
-touch.wait_for_pressed()
-# Stop Motor and Play sound
-motor.off()
+# Wait for touch sensor, stop anyway if it never comes
+if not engine.run(timeout=60):
+    motor.off()
+engine.close()
+# Play sound
 sound_play.beep()
+print(engine.latency.report())
 
 # Reset Motor Position
 motor.on_for_degrees(10, 200)
@@ -0,0 +1,156 @@
+#!/usr/bin/env micropython
+
+# Pure pursuit path following
+#
+# Steers toward a point a fixed distance ahead along the path, so the robot
+# rolls through waypoints instead of stopping and pivoting at each one.
+
+import math
+
+
+class PurePursuit:
+    """
+    Follow the polyline through ``waypoints`` (list of ``(x_mm, y_mm)``)
+    starting from the robot's current position.
+
+    step() takes the current pose and returns ``(left, right)`` wheel speed
+    factors in the range -1..1, or None once the last waypoint is within
+    ``tolerance_mm``. The cross-track error, the distance from the robot to
+    the path segment it is on, is tracked while following.
+    """
+    def __init__(self, waypoints, lookahead_mm, wheel_distance_mm, tolerance_mm=10.0):
+        if not waypoints:
+            raise ValueError("waypoints is empty")
+        if lookahead_mm <= 0:
+            raise ValueError("lookahead_mm {} must be positive".format(lookahead_mm))
+
+        self.waypoints = [(float(x), float(y)) for (x, y) in waypoints]
+        self.lookahead_mm = float(lookahead_mm)
+        self.half_track = wheel_distance_mm / 2.0
+        self.tolerance_mm = float(tolerance_mm)
+
+        self.path = None
+        self.segment = 0
+
+        self.cross_track_max = 0.0
+        self.cross_track_sum_sq = 0.0
+        self.steps = 0
+
+    def start(self, x_mm, y_mm):
+        """
+        Begin the path at the robot's position
+        """
+        self.path = [(x_mm, y_mm)] + self.waypoints
+        self.segment = 0
+
+    def _closest(self, x_mm, y_mm, segment):
+        """
+        Closest point on ``segment`` to the robot as ``(t, distance)`` where t
+        runs from 0 to 1 along the segment
+        """
+        (ax, ay), (bx, by) = self.path[segment], self.path[segment + 1]
+        dx = bx - ax
+        dy = by - ay
+        length_sq = dx * dx + dy * dy
+        if length_sq == 0:
+            t = 1.0
+        else:
+            t = ((x_mm - ax) * dx + (y_mm - ay) * dy) / length_sq
+            t = min(1.0, max(0.0, t))
+        px = ax + t * dx
+        py = ay + t * dy
+        return t, math.sqrt((x_mm - px) ** 2 + (y_mm - py) ** 2)
+
+    def _lookahead_point(self, x_mm, y_mm):
+        """
+        First point on the remaining path ``lookahead_mm`` from the robot, or
+        the final waypoint if the path ends sooner
+        """
+        path = self.path
+        r_sq = self.lookahead_mm * self.lookahead_mm
+
+        for segment in range(self.segment, len(path) - 1):
+            (ax, ay), (bx, by) = path[segment], path[segment + 1]
+            dx = bx - ax
+            dy = by - ay
+            fx = ax - x_mm
+            fy = ay - y_mm
+
+            # Solve |a + t*d - robot| = lookahead for t, keep the far root
+            a = dx * dx + dy * dy
+            if a == 0:
+                continue
+            b = 2 * (fx * dx + fy * dy)
+            c = fx * fx + fy * fy - r_sq
+            disc = b * b - 4 * a * c
+            if disc < 0:
+                continue
+            t = (-b + math.sqrt(disc)) / (2 * a)
+            if 0.0 <= t <= 1.0:
+                return (ax + t * dx, ay + t * dy)
+
+        return path[-1]
+
+    def step(self, x_mm, y_mm, theta):
+        path = self.path
+        last = len(path) - 2
+
+        # Move on to the next segment once we are past the end of this one,
+        # or closer to the next one after cutting a corner
+        while True:
+            t, distance = self._closest(x_mm, y_mm, self.segment)
+            if self.segment == last:
+                break
+            if t < 1.0 and distance <= self._closest(x_mm, y_mm, self.segment + 1)[1]:
+                break
+            self.segment += 1
+
+        self.steps += 1
+        self.cross_track_sum_sq += distance * distance
+        if distance > self.cross_track_max:
+            self.cross_track_max = distance
+
+        gx, gy = path[-1]
+        if self.segment == last and math.sqrt((gx - x_mm) ** 2 + (gy - y_mm) ** 2) <= self.tolerance_mm:
+            return None
+
+        tx, ty = self._lookahead_point(x_mm, y_mm)
+        dx = tx - x_mm
+        dy = ty - y_mm
+        distance = math.sqrt(dx * dx + dy * dy)
+        if distance == 0:
+            return None
+
+        # Angle from our heading to the goal point, and the curvature of the
+        # arc that reaches it
+        alpha = math.atan2(dy, dx) - theta
+        curvature = 2.0 * math.sin(alpha) / distance
+
+        left = 1.0 - curvature * self.half_track
+        right = 1.0 + curvature * self.half_track
+
+        # Goal point behind us, turn toward it on the spot
+        if math.cos(alpha) < 0:
+            left, right = (1.0, -1.0) if math.sin(alpha) < 0 else (-1.0, 1.0)
+
+        scale = max(abs(left), abs(right))
+        return (left / scale, right / scale)
+
+    def remaining(self, x_mm, y_mm):
+        """
+        Distance along the path from the point on it closest to the robot to
+        the final waypoint, it only goes down while the robot makes progress
+        """
+        path = self.path
+        t, distance = self._closest(x_mm, y_mm, self.segment)
+        (ax, ay), (bx, by) = path[self.segment], path[self.segment + 1]
+        total = (1.0 - t) * math.sqrt((bx - ax) ** 2 + (by - ay) ** 2)
+        for segment in range(self.segment + 1, len(path) - 1):
+            (ax, ay), (bx, by) = path[segment], path[segment + 1]
+            total += math.sqrt((bx - ax) ** 2 + (by - ay) ** 2)
+        return total
+
+    def cross_track_rms(self):
+        if not self.steps:
+            return 0.0
+        return math.sqrt(self.cross_track_sum_sq / self.steps)
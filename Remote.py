@@ -0,0 +1,235 @@
+#!/usr/bin/env micropython
+
+# IR remote input dispatcher
+#
+# RemoteControl.process() reads one sysfs value file per remote channel
+# and the caller then sleeps a fixed time. RemoteDispatcher reads all four
+# channels of the IR sensor with a single bin_data read per cycle, calls
+# the handlers of buttons that changed, and adapts its polling: every
+# INTERVAL_FAST seconds while a button is down or has just changed, backing
+# off to INTERVAL_SLOW when the remote has been left alone.
+#
+# Handlers that take time (anything that waits on a motor) can be marked
+# background so they run on a worker thread instead of stalling input.
+# What a background handler raises is kept in handler_errors, the worker
+# goes on with the next event.
+#
+# The time from the cycle that saw a change to the handler returning (the
+# motor command written) is recorded, for background handlers too, plus how
+# long the change could have sat unseen since the previous read, see
+# stats().
+
+import _thread
+import time
+from array import array
+
+_clock = getattr(time, 'monotonic', None) or time.time
+
+INTERVAL_FAST = 0.01
+INTERVAL_SLOW = 0.1     # the most a first press after a pause can wait to be seen
+IDLE_AFTER = 3.0        # seconds without a change before polling slows down
+
+# Buttons held for each remote code, as in ev3dev RemoteControl
+BUTTONS = (
+    (),
+    ('red_up',),
+    ('red_down',),
+    ('blue_up',),
+    ('blue_down',),
+    ('red_up', 'blue_up'),
+    ('red_up', 'blue_down'),
+    ('red_down', 'blue_up'),
+    ('red_down', 'blue_down'),
+    ('beacon',),
+    ('red_up', 'red_down'),
+    ('blue_up', 'blue_down'),
+)
+
+CHANNELS = 4
+
+
+def _percentile(values, count, p):
+    if not count:
+        return 0.0
+    ordered = sorted(values[:count])
+    return ordered[min(count - 1, int(count * p / 100.0))]
+
+
+class RemoteDispatcher:
+    """
+    Poll an IR sensor in IR-REMOTE mode and call ``handler(state)`` when a
+    button is pressed (True) or released (False).
+
+    .. code:: python
+
+        remote = RemoteDispatcher(ir)
+        remote.on(1, 'red_up', roll_left_forward)
+        remote.on(2, 'red_up', shoot_up, background=True)
+        remote.run(lambda: ts.is_pressed)
+        print(remote.stats())
+    """
+    def __init__(self, ir, fast=INTERVAL_FAST, slow=INTERVAL_SLOW, idle_after=IDLE_AFTER,
+                 latency_window=128, clock=_clock, sleep=time.sleep):
+        self.ir = ir
+        self.fast = fast
+        self.slow = slow
+        self.idle_after = idle_after
+        self.clock = clock
+        self.sleep = sleep
+
+        ir.mode = 'IR-REMOTE'
+
+        # handlers[channel][button] -> (handler, background)
+        self.handlers = [{} for i in range(CHANNELS)]
+        self.codes = bytearray(CHANNELS)
+        self.interval = fast
+
+        self.cycles = 0
+        self.events = 0
+        self.last_read = None
+        self.last_change = clock()
+
+        # most recent latencies in seconds, in preallocated rings
+        self.dispatch = array('f', [0.0] * latency_window)
+        self.sample_delay = array('f', [0.0] * latency_window)
+        self.latency_count = 0
+        self._latency_lock = _thread.allocate_lock()
+
+        # background handler calls waiting for the worker
+        self._pending = []
+        self._pending_lock = _thread.allocate_lock()
+        self._wake = _thread.allocate_lock()
+        self._wake.acquire()
+        self._worker = False
+        # (handler, state, exception) of background handlers that raised
+        self.handler_errors = []
+
+    def on(self, channel, button, handler, background=False):
+        """
+        Call ``handler(state)`` when ``button`` ('red_up', 'red_down',
+        'blue_up', 'blue_down' or 'beacon') on ``channel`` (1-4) changes
+        """
+        self.handlers[channel - 1][button] = (handler, background)
+        if background and not self._worker:
+            self._worker = True
+            _thread.start_new_thread(self._work, ())
+
+    def read(self):
+        """
+        Remote codes of all four channels, in one read
+        """
+        return self.ir.bin_data('BBBB')
+
+    def poll(self):
+        """
+        One cycle: read every channel once and dispatch what changed.
+        Returns True if any button changed.
+        """
+        previous_read = self.last_read
+        codes = self.read()
+        now = self.clock()
+        self.last_read = now
+        self.cycles += 1
+
+        changed = False
+        for channel in range(CHANNELS):
+            code = codes[channel]
+            old = self.codes[channel]
+            if code == old:
+                continue
+            changed = True
+            self.codes[channel] = code
+            handlers = self.handlers[channel]
+            if not handlers:
+                continue
+
+            before = BUTTONS[old] if old < len(BUTTONS) else ()
+            after = BUTTONS[code] if code < len(BUTTONS) else ()
+            for button in before:
+                if button not in after:
+                    self._dispatch(handlers.get(button), False, now, previous_read)
+            for button in after:
+                if button not in before:
+                    self._dispatch(handlers.get(button), True, now, previous_read)
+
+        if changed:
+            self.last_change = now
+        return changed
+
+    def _dispatch(self, entry, state, seen, previous_read):
+        if entry is None:
+            return
+        handler, background = entry
+        self.events += 1
+        if background:
+            with self._pending_lock:
+                self._pending.append((handler, state, seen, previous_read))
+            if self._wake.locked():
+                self._wake.release()
+            return
+
+        handler(state)
+        self._record(seen, previous_read)
+
+    def _record(self, seen, previous_read):
+        done = self.clock()
+        with self._latency_lock:
+            i = self.latency_count % len(self.dispatch)
+            self.dispatch[i] = done - seen
+            self.sample_delay[i] = seen - previous_read if previous_read is not None else 0.0
+            self.latency_count += 1
+
+    def _work(self):
+        while True:
+            self._wake.acquire()
+            while True:
+                with self._pending_lock:
+                    if not self._pending:
+                        break
+                    handler, state, seen, previous_read = self._pending.pop(0)
+                try:
+                    handler(state)
+                except Exception as e:
+                    self.handler_errors.append((handler, state, e))
+                self._record(seen, previous_read)
+
+    def next_interval(self):
+        """
+        Fast while a button is held or just changed, then doubling up to
+        the slow interval once the remote is left alone
+        """
+        if any(self.codes) or self.clock() - self.last_change < self.idle_after:
+            self.interval = self.fast
+        else:
+            self.interval = min(self.interval * 2, self.slow)
+        return self.interval
+
+    def run(self, stop):
+        """
+        Dispatch until ``stop()`` returns true
+        """
+        while not stop():
+            self.poll()
+            self.sleep(self.next_interval())
+
+    def stats(self):
+        """
+        Cycles, events and input to motor latency in seconds: ``dispatch``
+        from the read that saw a change to its handler returning and
+        ``sample`` the time since the read before, the most a change can
+        have waited to be seen. Background handlers count from the same
+        read, so their ``dispatch`` includes the wait for the worker.
+        """
+        with self._latency_lock:
+            count = min(self.latency_count, len(self.dispatch))
+            dispatch = self.dispatch[:count]
+            sample_delay = self.sample_delay[:count]
+        return {
+            'cycles': self.cycles,
+            'events': self.events,
+            'interval': self.interval,
+            'dispatch_p50': _percentile(dispatch, count, 50),
+            'dispatch_max': max(dispatch) if count else 0.0,
+            'sample_p50': _percentile(sample_delay, count, 50),
+            'sample_max': max(sample_delay) if count else 0.0,
+        }
@@ -0,0 +1,257 @@
+#! /usr/bin/env micropython
+
+# Incremental replanning on a Field (D* Lite)
+#
+# D* Lite searches from the goal back to the robot and keeps its search
+# tree between plans. When cells change only the costs around them are
+# recomputed and the repair spreads out from there, instead of planning the
+# whole field again every time a sensor sees something new.
+#
+# Koenig and Likhachev, "D* Lite", AAAI 2002
+
+import heapq
+from array import array
+
+from Field import FREE, MOVES
+
+INF = float('inf')
+
+# Move costs in tenths of a cell. Keeping every cost and key an integer means
+# equal keys compare equal, with floats the rounding in km could end a
+# search one tie too early and leave a stale route behind.
+STRAIGHT = 10
+DIAGONAL = 14
+MOVE_COSTS = tuple((d_col, d_row, DIAGONAL if d_col and d_row else STRAIGHT) for (d_col, d_row, cost) in MOVES)
+
+
+class DStarLite:
+    """
+    Keep a route from the robot to ``goal_mm`` across ``field`` up to date.
+
+    .. code:: python
+
+        field = Field(robot_radius_mm=60)
+        route = DStarLite(field, (200, 100), (200, 1900))
+        waypoints = route.plan()
+
+        # while driving
+        route.move_to(*mdiff.odometry_pose()[:2])
+        hit = field.sensor_hit(mdiff.odometry_pose(), ir.proximity * 7)
+        waypoints = route.add_hits([hit])
+    """
+    def __init__(self, field, start_mm, goal_mm):
+        self.field = field
+        self.goal_mm = (float(goal_mm[0]), float(goal_mm[1]))
+
+        size = field.cols * field.rows
+        self.g = array('d', [INF] * size)
+        self.rhs = array('d', [INF] * size)
+
+        # open list, entries are (k1, k2, cell) and are stale unless they match
+        # open_key[cell]
+        self.heap = []
+        self.open_key = {}
+        self.km = 0
+
+        self.expanded = 0
+
+        self.goal = self._index(*field.cell(*goal_mm))
+        self.start = self._index(*field.cell(*start_mm))
+        self.last = self.start
+
+        self.rhs[self.goal] = 0
+        self._push(self.goal)
+
+        # Changes made before we existed are already part of the grid
+        field.take_dirty()
+
+    def _index(self, col, row):
+        return row * self.field.cols + col
+
+    def _h(self, a, b):
+        cols = self.field.cols
+        dx = abs(a % cols - b % cols)
+        dy = abs(a // cols - b // cols)
+        return STRAIGHT * (dx + dy) + (DIAGONAL - 2 * STRAIGHT) * min(dx, dy)
+
+    def _key(self, u):
+        m = min(self.g[u], self.rhs[u])
+        return (m + self._h(self.start, u) + self.km, m)
+
+    def _push(self, u):
+        key = self._key(u)
+        self.open_key[u] = key
+        heapq.heappush(self.heap, (key[0], key[1], u))
+
+    def _neighbours(self, u):
+        """
+        (cell, cost) of every cell reachable in one move from u, following
+        the same rules as Field.plan_cells(): only free cells are entered,
+        but the robot's own cell can be left even when a hit inflated it
+        """
+        field = self.field
+        grid = field.grid
+        cols = field.cols
+        rows = field.rows
+        row = u // cols
+        col = u - row * cols
+        out = []
+
+        if grid[u] != FREE and u != self.start:
+            return out
+
+        for d_col, d_row, cost in MOVE_COSTS:
+            n_col = col + d_col
+            n_row = row + d_row
+            if not (0 <= n_col < cols and 0 <= n_row < rows):
+                continue
+            v = n_row * cols + n_col
+            if grid[v] != FREE:
+                continue
+            if d_col and d_row and (grid[row * cols + n_col] != FREE or grid[n_row * cols + col] != FREE):
+                continue
+            out.append((v, cost))
+        return out
+
+    def _around(self, u):
+        """
+        u and its 8 neighbours whatever their state, the cells whose edges
+        change when u does
+        """
+        field = self.field
+        cols = field.cols
+        row = u // cols
+        col = u - row * cols
+        out = [u]
+        for d_col, d_row, cost in MOVES:
+            n_col = col + d_col
+            n_row = row + d_row
+            if 0 <= n_col < cols and 0 <= n_row < field.rows:
+                out.append(n_row * cols + n_col)
+        return out
+
+    def _update_vertex(self, u):
+        if u != self.goal:
+            best = INF
+            g = self.g
+            for v, cost in self._neighbours(u):
+                value = cost + g[v]
+                if value < best:
+                    best = value
+            self.rhs[u] = best
+
+        self.open_key.pop(u, None)
+        if self.g[u] != self.rhs[u]:
+            self._push(u)
+
+    def _compute(self):
+        heap = self.heap
+        open_key = self.open_key
+        g = self.g
+        rhs = self.rhs
+
+        while heap:
+            k1, k2, u = heap[0]
+            if open_key.get(u) != (k1, k2):
+                heapq.heappop(heap)
+                continue
+
+            start_key = self._key(self.start)
+            if (k1, k2) >= start_key and rhs[self.start] == g[self.start]:
+                break
+
+            heapq.heappop(heap)
+            self.expanded += 1
+            new_key = self._key(u)
+
+            if (k1, k2) < new_key:
+                self._push(u)
+            elif g[u] > rhs[u]:
+                g[u] = rhs[u]
+                del open_key[u]
+                for v in self._around(u)[1:]:
+                    self._update_vertex(v)
+            else:
+                g[u] = INF
+                for v in self._around(u):
+                    self._update_vertex(v)
+
+    def _cells(self):
+        """
+        Cells from the robot to the goal down the cost gradient, None if
+        the goal cannot be reached
+        """
+        u = self.start
+        if self.g[u] == INF:
+            return None
+
+        cols = self.field.cols
+        cells = [(u % cols, u // cols)]
+        limit = len(self.g)
+        while u != self.goal and len(cells) <= limit:
+            best = None
+            best_value = INF
+            for v, cost in self._neighbours(u):
+                value = cost + self.g[v]
+                if value < best_value:
+                    best = v
+                    best_value = value
+            if best is None:
+                return None
+            u = best
+            cells.append((u % cols, u // cols))
+        return cells
+
+    def path(self):
+        cells = self._cells()
+        if cells is None:
+            return None
+        return self.field.waypoints(cells, self.goal_mm)
+
+    def plan(self):
+        """
+        Plan (or finish planning) and return the waypoints in mm
+        """
+        self._compute()
+        return self.path()
+
+    def move_to(self, x_mm, y_mm):
+        """
+        Tell the planner where the robot is now
+        """
+        start = self._index(*self.field.cell(x_mm, y_mm))
+        if start != self.start:
+            old = self.start
+            self.km += self._h(self.last, start)
+            self.last = start
+            self.start = start
+            # a blocked cell only has moves out of it while the robot is on it
+            grid = self.field.grid
+            for u in (old, start):
+                if grid[u] != FREE:
+                    self._update_vertex(u)
+
+    def update(self):
+        """
+        Repair the route after cells of the field changed, returns the new
+        waypoints
+        """
+        dirty = self.field.take_dirty()
+        seen = set()
+        for u in dirty:
+            for v in self._around(u):
+                if v not in seen:
+                    seen.add(v)
+                    self._update_vertex(v)
+        return self.plan()
+
+    def add_hits(self, points, radius_mm=0, pose=None):
+        """
+        Mark sensor hits given in world coordinates (see Field.sensor_hit())
+        and return the repaired waypoints. If ``pose`` from odometry_pose()
+        is given the route is repaired from there.
+        """
+        if pose is not None:
+            self.move_to(pose[0], pose[1])
+        self.field.mark_hits(points, radius_mm)
+        return self.update()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+
+# Offline odometry replay
+#
+# Feeds recorded encoder streams back through the same
+# PoseIntegrator.step() the odometry thread runs, so a change to the
+# integration, the clipping of theta or the wheel constants can be checked
+# against hours of recorded driving in seconds:
+#
+#   python3 Replay.py run.bin                        replay, compare with the
+#                                                    poses the robot recorded
+#   python3 Replay.py run.bin --write-golden run.golden.csv
+#   python3 Replay.py run.bin --golden run.golden.csv
+#
+# Recordings are Telemetry.py files or CSV files with time,left,right
+# columns. --batch replays a whole recording at once with NumPy; it matches
+# the step by step replay to rounding, except that theta is clipped on the
+# accumulated heading and so can be a full turn apart from it once the robot
+# has turned back past zero. Comparisons treat headings a full turn apart
+# as equal.
+
+import argparse
+import math
+import sys
+
+from Kinematics import PoseIntegrator, ARC, EULER, MIDPOINT, MODES, TWO_PI
+import Telemetry
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# EV3EducationSetTire and the chassis wheel well, as in Log_Analyzer.py
+WHEEL_CIRCUMFERENCE_MM = 56 * math.pi
+WHEEL_DISTANCE_MM = (10 + 1.5 * 0.7826) * 10
+COUNT_PER_ROT = 360
+
+# odometry_start() defaults, x_mm, y_mm, degrees
+START = (0.0, 0.0, 90.0)
+
+GOLDEN_HEADER = 'time,x_mm,y_mm,theta'
+
+
+def load(path):
+    """
+    ``(times, lefts, rights, recorded)`` of a recording, ``recorded`` being
+    the (x_mm, y_mm, theta) poses the robot worked out or None if the file
+    does not have them
+    """
+    if not path.endswith('.csv'):
+        records = Telemetry.read(path)
+        return ([r[0] for r in records], [r[1] for r in records], [r[2] for r in records],
+                [(r[3], r[4], r[5]) for r in records])
+
+    times = []
+    lefts = []
+    rights = []
+    recorded = []
+    with open(path) as f:
+        columns = f.readline().strip().split(',')
+        index = dict((name, i) for (i, name) in enumerate(columns))
+        has_pose = all(name in index for name in ('x_mm', 'y_mm', 'theta'))
+        for line in f:
+            if not line.strip():
+                continue
+            values = line.split(',')
+            times.append(float(values[index['time']]))
+            lefts.append(int(values[index['left']]))
+            rights.append(int(values[index['right']]))
+            if has_pose:
+                recorded.append((float(values[index['x_mm']]), float(values[index['y_mm']]),
+                                 float(values[index['theta']])))
+    return times, lefts, rights, recorded if recorded else None
+
+
+def _integrator(mode, start, circumference_mm, wheel_distance_mm, count_per_rot):
+    integrator = PoseIntegrator.for_wheel(circumference_mm, count_per_rot, count_per_rot, wheel_distance_mm, mode)
+    integrator.reset(start[0], start[1], math.radians(start[2]))
+    return integrator
+
+
+def replay(times, lefts, rights, mode=ARC, start=START, circumference_mm=WHEEL_CIRCUMFERENCE_MM,
+           wheel_distance_mm=WHEEL_DISTANCE_MM, count_per_rot=COUNT_PER_ROT):
+    """
+    Step by step replay, one ``(time, x_mm, y_mm, theta)`` pose per sample.
+    Counts are absolute, like the ones the odometry thread reads, and the
+    first sample is taken relative to 0 as it is on the robot.
+    """
+    integrator = _integrator(mode, start, circumference_mm, wheel_distance_mm, count_per_rot)
+    step = integrator.step
+    poses = []
+    append = poses.append
+    for t, left, right in zip(times, lefts, rights):
+        step(left, right)
+        append((t, integrator.x_mm, integrator.y_mm, integrator.theta))
+    return poses
+
+
+def replay_batch(times, lefts, rights, mode=ARC, start=START, circumference_mm=WHEEL_CIRCUMFERENCE_MM,
+                 wheel_distance_mm=WHEEL_DISTANCE_MM, count_per_rot=COUNT_PER_ROT):
+    """
+    The whole recording at once, returns an (n, 4) array of time, x_mm,
+    y_mm, theta
+    """
+    if mode not in MODES:
+        raise ValueError("mode {} is not one of {}".format(mode, MODES))
+    mm_per_tick = circumference_mm / count_per_rot
+
+    left_mm = np.diff(np.asarray(lefts, dtype=np.int64), prepend=0) * mm_per_tick
+    right_mm = np.diff(np.asarray(rights, dtype=np.int64), prepend=0) * mm_per_tick
+    mm = (left_mm + right_mm) / 2.0
+    dtheta = (right_mm - left_mm) / wheel_distance_mm
+
+    theta_after = math.radians(start[2]) + np.cumsum(dtheta)
+    theta_before = theta_after - dtheta
+    if mode == EULER:
+        heading = theta_after
+        distance = mm
+    elif mode == MIDPOINT:
+        heading = theta_before + dtheta / 2.0
+        distance = mm
+    else:
+        # chord of the arc, np.sinc(x) is sin(pi x) / (pi x)
+        heading = theta_before + dtheta / 2.0
+        distance = mm * np.sinc(dtheta / (2.0 * np.pi))
+
+    poses = np.empty((len(mm), 4))
+    poses[:, 0] = times
+    poses[:, 1] = start[0] + np.cumsum(distance * np.cos(heading))
+    poses[:, 2] = start[1] + np.cumsum(distance * np.sin(heading))
+    # the legacy clip to plus or minus 360 degrees
+    poses[:, 3] = np.fmod(theta_after, TWO_PI)
+    return poses
+
+
+def _heading_error(a, b):
+    error = math.fmod(a - b, TWO_PI)
+    if error > math.pi:
+        error -= TWO_PI
+    elif error < -math.pi:
+        error += TWO_PI
+    return abs(error)
+
+
+def compare(poses, reference, tolerance_mm=0.01, tolerance_rad=1e-5):
+    """
+    Compare replayed poses with reference (x_mm, y_mm, theta) poses, sample
+    by sample. ``poses`` may also carry a leading time column, as replay()
+    output does.
+    """
+    result = {
+        'samples': len(poses),
+        'reference_samples': len(reference),
+        'max_position_mm': 0.0,
+        'max_heading_rad': 0.0,
+        'first_failure': None,
+    }
+
+    count = min(len(poses), len(reference))
+    if np is not None and count:
+        ours = np.asarray(poses, dtype=float)[:count, -3:]
+        theirs = np.asarray(reference, dtype=float)[:count, -3:]
+        position = np.hypot(ours[:, 0] - theirs[:, 0], ours[:, 1] - theirs[:, 1])
+        heading = np.abs((ours[:, 2] - theirs[:, 2] + np.pi) % TWO_PI - np.pi)
+        failed = np.nonzero((position > tolerance_mm) | (heading > tolerance_rad))[0]
+        result['max_position_mm'] = float(position.max())
+        result['max_heading_rad'] = float(heading.max())
+        result['first_failure'] = int(failed[0]) if len(failed) else None
+        count = 0
+
+    for i in range(count):
+        pose = poses[i]
+        x, y, theta = pose[-3], pose[-2], pose[-1]
+        ref = reference[i]
+        position = math.hypot(x - ref[-3], y - ref[-2])
+        heading = _heading_error(theta, ref[-1])
+        if position > result['max_position_mm']:
+            result['max_position_mm'] = position
+        if heading > result['max_heading_rad']:
+            result['max_heading_rad'] = heading
+        if result['first_failure'] is None and (position > tolerance_mm or heading > tolerance_rad):
+            result['first_failure'] = i
+
+    result['ok'] = (result['first_failure'] is None and len(poses) == len(reference))
+    return result
+
+
+def write_golden(path, poses):
+    with open(path, 'w') as f:
+        f.write(GOLDEN_HEADER + '\n')
+        for t, x, y, theta in poses:
+            f.write('%.6f,%.9f,%.9f,%.12f\n' % (t, x, y, theta))
+
+
+def read_golden(path):
+    poses = []
+    with open(path) as f:
+        if f.readline().strip() != GOLDEN_HEADER:
+            raise ValueError("{} is not a golden pose file".format(path))
+        for line in f:
+            if line.strip():
+                poses.append(tuple(float(value) for value in line.split(',')))
+    return poses
+
+
+def _report(label, result):
+    print("{}: {} over {} samples, max position error {:.6f} mm, max heading error {:.3g} rad{}".format(
+        label, "ok" if result['ok'] else "MISMATCH", result['samples'], result['max_position_mm'],
+        result['max_heading_rad'],
+        "" if result['first_failure'] is None else ", first at sample {}".format(result['first_failure'])))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Replay recorded encoder counts through the odometry math")
+    parser.add_argument('recording', help="Telemetry .bin or CSV with time,left,right columns")
+    parser.add_argument('--mode', choices=MODES, default=ARC)
+    parser.add_argument('--batch', action='store_true', help="replay with NumPy in one go")
+    parser.add_argument('--start', type=float, nargs=3, default=START, metavar=('X_MM', 'Y_MM', 'DEG'))
+    parser.add_argument('--circumference-mm', type=float, default=WHEEL_CIRCUMFERENCE_MM)
+    parser.add_argument('--wheel-distance-mm', type=float, default=WHEEL_DISTANCE_MM)
+    parser.add_argument('--golden', help="compare with this golden file")
+    parser.add_argument('--write-golden', help="save the replayed poses as a golden file")
+    parser.add_argument('--tolerance-mm', type=float, default=0.01)
+    parser.add_argument('--tolerance-rad', type=float, default=1e-5)
+    args = parser.parse_args(argv)
+
+    times, lefts, rights, recorded = load(args.recording)
+    replay_function = replay_batch if args.batch else replay
+    poses = replay_function(times, lefts, rights, args.mode, tuple(args.start),
+                            args.circumference_mm, args.wheel_distance_mm)
+
+    if len(poses):
+        t, x, y, theta = poses[-1]
+        print("{} samples, final pose ({:.1f}, {:.1f}) mm at {:.2f} deg".format(
+            len(poses), x, y, math.degrees(theta)))
+
+    failed = False
+    if recorded is not None:
+        # the robot stores poses as 32 bit floats
+        result = compare(poses, recorded, max(args.tolerance_mm, 0.01), max(args.tolerance_rad, 1e-5))
+        _report("recorded", result)
+    if args.golden:
+        result = compare(poses, read_golden(args.golden), args.tolerance_mm, args.tolerance_rad)
+        _report("golden", result)
+        failed = not result['ok']
+    if args.write_golden:
+        write_golden(args.write_golden, poses)
+        print("wrote " + args.write_golden)
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,106 @@
+#!/usr/bin/env micropython
+
+# Fixed-rate scheduling for sampling loops
+#
+# Sleeping a flat amount after each pass lets the real rate drift with the
+# cost of the pass. RateScheduler instead sleeps until the next deadline on
+# a fixed grid, so the period holds as long as a pass fits inside it, and
+# counts what happens when it does not.
+
+import time
+from array import array
+
+_clock = getattr(time, 'monotonic', None) or time.time
+
+
+class RateScheduler:
+    """
+    Keep a loop on a fixed ``period`` (seconds) and record how well it did.
+
+    Call start() once before the loop and wait() at the end of every pass.
+
+    - overruns: passes that were still running when their deadline came
+    - skipped: whole periods lost because a pass ran long, the deadline grid
+      moves forward past them instead of trying to catch up
+    - jitter: how late each wakeup was relative to its deadline, the last
+      ``jitter_window`` values are kept in a preallocated array
+
+    A period of 0 runs the loop flat out but still counts passes.
+    """
+    def __init__(self, period, jitter_window=256, clock=_clock, sleep=time.sleep):
+        self.period = float(period or 0.0)
+        self.clock = clock
+        self.sleep = sleep
+        self.jitter = array('f', [0.0] * jitter_window)
+        self.start()
+
+    def start(self):
+        self.started = self.clock()
+        self.deadline = self.started + self.period
+        self.last_wake = self.started
+        self.ticks = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.jitter_count = 0
+
+    def wait(self):
+        """
+        Sleep until the next deadline
+        """
+        period = self.period
+        self.ticks += 1
+
+        if not period:
+            return
+
+        now = self.clock()
+        deadline = self.deadline
+
+        if now < deadline:
+            self.sleep(deadline - now)
+            now = self.clock()
+        else:
+            self.overruns += 1
+
+        self.last_wake = now
+        late = now - deadline
+        jitter = self.jitter
+        jitter[self.jitter_count % len(jitter)] = late
+        self.jitter_count += 1
+
+        # Drop the deadlines we already missed rather than running a burst
+        # of back to back passes to catch up
+        if late >= period:
+            missed = int(late / period)
+            self.skipped += missed
+            deadline += missed * period
+
+        self.deadline = deadline + period
+
+    def percentile(self, p):
+        """
+        Jitter percentile (0-100) over the recorded window, in seconds
+        """
+        count = min(self.jitter_count, len(self.jitter))
+        if not count:
+            return 0.0
+        values = sorted(self.jitter[:count])
+        index = int(round((p / 100.0) * (count - 1)))
+        return values[index]
+
+    def stats(self):
+        # A paced loop is measured up to its last wakeup so that reading the
+        # stats after the loop stopped does not dilute the rate
+        end = self.last_wake if self.period else self.clock()
+        elapsed = end - self.started
+        return {
+            'target_hz': 1.0 / self.period if self.period else 0.0,
+            'achieved_hz': self.ticks / elapsed if elapsed > 0 else 0.0,
+            'ticks': self.ticks,
+            'overruns': self.overruns,
+            'skipped': self.skipped,
+            'jitter_p50': self.percentile(50),
+            'jitter_p90': self.percentile(90),
+            'jitter_p99': self.percentile(99),
+            'jitter_max': self.percentile(100),
+        }
@@ -0,0 +1,1139 @@
+#!/usr/bin/env python3
+
+# Simulated ev3dev2 motors and sensors on a virtual clock
+#
+# install() puts fake ev3dev2.motor / wheel / sensor / sound / console /
+# button modules in sys.modules and swaps time.sleep() and the clocks for a
+# virtual clock, so Chassis.py, Odometry.MoveDifferential and the mission
+# scripts run unchanged on a dev box or in CI:
+#
+#   python3 Sim.py "Subtask1 B.py"
+#
+# Time only moves when every thread of the mission is sleeping (or blocked
+# on a lock), and then jumps straight to the next wake up while the motors
+# are stepped in 1 ms increments. A mission that takes a minute on the
+# floor runs in well under a second and the same script gives the same
+# encoder counts every run.
+#
+# Motors are modelled as speed controllers with a limited acceleration
+# (ramp_up_sp / ramp_down_sp when set) that settle exactly on position
+# targets. Their position is also written to a sysfs style position file so
+# Encoders.EncoderPair reads them the same way it reads the real ones.
+#
+# install() has to run before anything imports ev3dev2 or captures
+# time.sleep, which is what running a script through this file does.
+
+import math
+import os
+import runpy
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import types
+import _thread
+
+# The real clock and threading primitives, before install() replaces them
+_real_sleep = time.sleep
+_real_perf_counter = time.perf_counter
+_real_allocate_lock = _thread.allocate_lock
+_real_start_new_thread = _thread.start_new_thread
+_real_threading_start = threading._start_new_thread
+
+# How long a sleeping thread waits for a busy (never sleeping) thread before
+# moving time on anyway, in real seconds
+WATCHDOG = 0.05
+
+OUTPUT_A = 'outA'
+OUTPUT_B = 'outB'
+OUTPUT_C = 'outC'
+OUTPUT_D = 'outD'
+
+INPUT_1 = 'in1'
+INPUT_2 = 'in2'
+INPUT_3 = 'in3'
+INPUT_4 = 'in4'
+
+# The world install() set up, used by the simulated devices
+world = None
+
+
+class SimTimeout(Exception):
+    """
+    Raised in a waiting thread when virtual time passes the world limit
+    """
+    pass
+
+
+class VirtualClock:
+    """
+    Discrete event clock shared by every simulated thread.
+
+    ``running`` counts the threads that are not sleeping. Once it drops to
+    zero the clock steps the devices up to the earliest wake up (or until a
+    wait_for() condition comes true) and wakes whoever is due.
+    """
+    def __init__(self, step=0.001, limit=3600.0):
+        self.now = 0.0
+        self.step = step
+        self.limit = limit
+        self.running = 1            # the thread that created the clock
+        self.waiters = []           # [wake time, predicate or None, fine]
+        self.devices = []
+        self.steps = 0
+        self._cond = threading.Condition(_real_allocate_lock())
+
+    def time(self):
+        return self.now
+
+    def _due(self, waiter):
+        return self.now >= waiter[0] or (waiter[1] is not None and waiter[1]())
+
+    def _advance(self):
+        """
+        Step every device up to the next wake up, called with the lock held
+        and no thread able to run.
+
+        Stretches where every device reports (with _horizon()) that it keeps
+        a constant speed are crossed in one step, unless a waiter asked for
+        fine steps because its condition depends on time rather than on the
+        motors.
+        """
+        waiters = self.waiters
+        target = min(waiter[0] for waiter in waiters)
+        if target > self.limit:
+            target = self.limit
+        predicates = [waiter[1] for waiter in waiters if waiter[1] is not None]
+        fine = any(waiter[2] for waiter in waiters)
+        devices = self.devices
+        step = self.step
+
+        while self.now < target:
+            dt = step
+            if not fine:
+                horizon = min([device._horizon() for device in devices] or [float('inf')])
+                if horizon > step:
+                    dt = step * int(min(horizon, target - self.now) / step) or step
+            if dt >= target - self.now:
+                dt = target - self.now
+                self.now = target
+            else:
+                self.now += dt
+            for device in devices:
+                device._step(dt)
+            self.steps += 1
+            if predicates and any(predicate() for predicate in predicates):
+                break
+
+        for device in devices:
+            device._sync()
+        self._cond.notify_all()
+
+    def _wait(self, wake, predicate=None, fine=False):
+        waiter = [wake, predicate, fine]
+        cond = self._cond
+        with cond:
+            self.waiters.append(waiter)
+            self.running -= 1
+            try:
+                while not self._due(waiter):
+                    if self.now >= self.limit:
+                        raise SimTimeout("virtual time limit of {} s reached".format(self.limit))
+                    if self.running <= 0 and not any(self._due(w) for w in self.waiters):
+                        self._advance()
+                    elif not cond.wait(WATCHDOG):
+                        # somebody is busy without ever sleeping, do not let
+                        # that stop the clock
+                        if not any(self._due(w) for w in self.waiters):
+                            self._advance()
+            finally:
+                for i in range(len(self.waiters)):
+                    if self.waiters[i] is waiter:
+                        del self.waiters[i]
+                        break
+                self.running += 1
+
+    def sleep(self, seconds):
+        if seconds <= 0:
+            _real_sleep(0)
+            return
+        self._wait(self.now + seconds)
+
+    def wait_for(self, predicate, timeout=None, fine=False):
+        """
+        Sleep until predicate() is true, checked after every device step.
+        Pass fine=True if it depends on the time and not only on the
+        motors. Returns False if timeout (virtual seconds) ran out first.
+        """
+        if predicate():
+            return True
+        wake = float('inf') if timeout is None else self.now + timeout
+        self._wait(wake, predicate, fine)
+        return predicate()
+
+    # Thread bookkeeping
+    def started(self):
+        with self._cond:
+            self.running += 1
+
+    def stopped(self):
+        with self._cond:
+            self.running -= 1
+            self._cond.notify_all()
+
+    def start_new_thread(self, function, args, kwargs=None):
+        """
+        _thread.start_new_thread() that counts the thread as running
+        """
+        clock = self
+
+        def run(*a, **kw):
+            try:
+                return function(*a, **kw)
+            finally:
+                clock.stopped()
+
+        self.started()
+        try:
+            if kwargs:
+                return _real_start_new_thread(run, args, kwargs)
+            return _real_start_new_thread(run, args)
+        except Exception:
+            self.stopped()
+            raise
+
+    def _threading_start(self, function, args):
+        clock = self
+
+        def run(*a):
+            try:
+                return function(*a)
+            finally:
+                clock.stopped()
+
+        self.started()
+        try:
+            return _real_threading_start(run, args)
+        except Exception:
+            self.stopped()
+            raise
+
+
+class SimLock:
+    """
+    _thread lock that tells the clock while its owner is blocked on it, so
+    time can move on for the thread that will release it
+    """
+    def __init__(self, clock):
+        self.clock = clock
+        self._lock = _real_allocate_lock()
+
+    def acquire(self, waitflag=1, timeout=-1):
+        if self._lock.acquire(False):
+            return True
+        if not waitflag:
+            return False
+        clock = self.clock
+        with clock._cond:
+            clock.running -= 1
+            clock._cond.notify_all()
+        try:
+            return self._lock.acquire(True, timeout)
+        finally:
+            clock.started()
+
+    acquire_lock = acquire
+
+    def release(self):
+        self._lock.release()
+
+    release_lock = release
+
+    def locked(self):
+        return self._lock.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
+class World:
+    """
+    Everything the simulated devices share: the clock, one state per motor
+    port, sensor scripts and a log of sounds.
+    """
+    def __init__(self, step=0.001, limit=3600.0):
+        self.clock = VirtualClock(step, limit)
+        self.motors = {}
+        self.sensor_scripts = {}
+        self.sounds = []
+        self.directory = tempfile.mkdtemp(prefix='ev3sim-')
+
+    def motor(self, port, max_speed, count_per_rot):
+        state = self.motors.get(port)
+        if state is None:
+            state = MotorState(port, max_speed, count_per_rot, os.path.join(self.directory, port))
+            self.motors[port] = state
+            self.clock.devices.append(state)
+        return state
+
+    def script_sensor(self, port, attribute, function):
+        """
+        Make ``attribute`` of the sensor on ``port`` follow ``function(t)``,
+        t being virtual seconds
+        """
+        self.sensor_scripts[(port, attribute)] = function
+
+    def sensor_value(self, port, attribute, default):
+        function = self.sensor_scripts.get((port, attribute))
+        if function is None:
+            return default
+        return function(self.clock.now)
+
+    def positions(self):
+        return dict((port, state.position) for (port, state) in self.motors.items())
+
+    def close(self):
+        for state in self.motors.values():
+            state.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class MotorState:
+    """
+    Physical state of the motor on one port, shared by every object opened
+    on it
+    """
+    DEFAULT_ACCELERATION = 10000.0      # deg/s^2, about 0.1 s to full speed
+
+    def __init__(self, port, max_speed, count_per_rot, path):
+        self.port = port
+        self.max_speed = max_speed
+        self.count_per_rot = count_per_rot
+        self.path = path
+
+        self.pos = 0.0          # ticks
+        self.speed = 0.0        # ticks/s
+        self.mode = None        # 'forever', 'timed', 'position' or None
+        self.target = 0.0
+        self.end_time = 0.0
+        self.speed_sp = 0
+        self.stop_action = 'coast'
+        self.ramp_up_sp = 0
+        self.ramp_down_sp = 0
+        self.holding = False
+        self.elapsed = 0.0
+
+        os.mkdir(path)
+        self._fd = os.open(os.path.join(path, 'position'), os.O_RDWR | os.O_CREAT, 0o644)
+        self._written = None
+        self._sync()
+
+    @property
+    def position(self):
+        return int(round(self.pos))
+
+    @property
+    def state(self):
+        if self.mode is not None:
+            return ['running']
+        if self.holding:
+            return ['holding']
+        return []
+
+    def _acceleration(self, ramp_ms):
+        if ramp_ms > 0:
+            return self.max_speed / (ramp_ms / 1000.0)
+        return self.DEFAULT_ACCELERATION
+
+    def run(self, mode, target=0.0, end_time=0.0):
+        self.mode = mode
+        self.target = target
+        self.end_time = end_time
+        self.holding = False
+
+    def stop(self):
+        self.mode = None
+        self.speed = 0.0
+        self.holding = self.stop_action == 'hold'
+
+    def _horizon(self):
+        """
+        Seconds the motor will keep its current speed for
+        """
+        mode = self.mode
+        if mode is None:
+            return float('inf')
+        speed_sp = max(-self.max_speed, min(self.max_speed, float(self.speed_sp)))
+        if mode == 'position':
+            remaining = self.target - self.pos
+            if not remaining or self.speed != (speed_sp if remaining > 0 else -speed_sp) or not speed_sp:
+                return 0.0
+            braking = speed_sp * speed_sp / (2.0 * self._acceleration(self.ramp_down_sp))
+            return (abs(remaining) - braking - 1.0) / abs(speed_sp)
+        if self.speed != speed_sp:
+            return 0.0
+        if mode == 'timed':
+            return self.end_time - self.elapsed
+        return float('inf')
+
+    def _step(self, dt):
+        self.elapsed += dt
+        mode = self.mode
+        if mode is None:
+            return
+
+        speed_sp = max(-self.max_speed, min(self.max_speed, float(self.speed_sp)))
+        if mode == 'position':
+            remaining = self.target - self.pos
+            direction = 1.0 if remaining > 0 else -1.0
+            # as fast as asked, but slow enough to stop on the target
+            braking = math.sqrt(2.0 * self._acceleration(self.ramp_down_sp) * abs(remaining))
+            wanted = direction * min(abs(speed_sp), braking)
+        elif mode == 'timed' and self.elapsed >= self.end_time:
+            self.stop()
+            return
+        else:
+            wanted = speed_sp
+
+        speeding_up = abs(wanted) > abs(self.speed) and wanted * self.speed >= 0
+        limit = self._acceleration(self.ramp_up_sp if speeding_up else self.ramp_down_sp) * dt
+        change = wanted - self.speed
+        if change > limit:
+            self.speed += limit
+        elif change < -limit:
+            self.speed -= limit
+        else:
+            self.speed = wanted
+
+        moved = self.speed * dt
+        if mode == 'position':
+            remaining = self.target - self.pos
+            if abs(remaining) <= max(abs(moved), 0.5) or (speed_sp == 0 and remaining):
+                self.pos = self.target
+                self.stop()
+                return
+        self.pos += moved
+
+    def _sync(self):
+        position = self.position
+        if position != self._written:
+            os.pwrite(self._fd, b'%-15d\n' % position, 0)
+            self._written = position
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def _world():
+    if world is None:
+        raise RuntimeError("Sim.install() has not been called")
+    return world
+
+
+# ev3dev2.motor
+
+class SpeedValue:
+    """
+    A speed in some unit, scaled with * like the ev3dev2 ones
+    """
+    def __init__(self, value):
+        self.value = value
+
+    def __mul__(self, other):
+        return self.__class__(self.value * other)
+
+    __rmul__ = __mul__
+
+    def __neg__(self):
+        return self.__class__(-self.value)
+
+    def __lt__(self, other):
+        return self.value < other.value
+
+    def __eq__(self, other):
+        return isinstance(other, SpeedValue) and self.__class__ is other.__class__ and self.value == other.value
+
+    def __repr__(self):
+        return "{}({})".format(self.__class__.__name__, self.value)
+
+
+class SpeedPercent(SpeedValue):
+    def __init__(self, percent):
+        if not -100 <= percent <= 100:
+            raise ValueError("{} is an invalid percentage, must be between -100 and 100 (inclusive)".format(percent))
+        SpeedValue.__init__(self, percent)
+        self.percent = percent
+
+    def to_native_units(self, motor):
+        return self.percent / 100.0 * motor.max_speed
+
+
+class SpeedNativeUnits(SpeedValue):
+    def to_native_units(self, motor=None):
+        return self.value
+
+
+class SpeedRPS(SpeedValue):
+    def to_native_units(self, motor):
+        return self.value * motor.count_per_rot
+
+
+class SpeedRPM(SpeedValue):
+    def to_native_units(self, motor):
+        return self.value / 60.0 * motor.count_per_rot
+
+
+class SpeedDPS(SpeedValue):
+    def to_native_units(self, motor):
+        return self.value / 360.0 * motor.count_per_rot
+
+
+class SpeedDPM(SpeedValue):
+    def to_native_units(self, motor):
+        return self.value / 60.0 / 360.0 * motor.count_per_rot
+
+
+def speed_to_speedvalue(speed, label=None):
+    if isinstance(speed, SpeedValue):
+        return speed
+    return SpeedPercent(speed)
+
+
+class Motor:
+    """
+    The parts of ev3dev2.motor.Motor the repo uses, backed by a MotorState
+    """
+    SYSTEM_CLASS_NAME = 'tacho-motor'
+    MAX_SPEED = 1050
+    COUNT_PER_ROT = 360
+
+    STOP_ACTION_COAST = 'coast'
+    STOP_ACTION_BRAKE = 'brake'
+    STOP_ACTION_HOLD = 'hold'
+
+    COMMAND_RUN_FOREVER = 'run-forever'
+    COMMAND_RUN_TO_ABS_POS = 'run-to-abs-pos'
+    COMMAND_RUN_TO_REL_POS = 'run-to-rel-pos'
+    COMMAND_RUN_TIMED = 'run-timed'
+    COMMAND_STOP = 'stop'
+    COMMAND_RESET = 'reset'
+
+    STATE_RUNNING = 'running'
+    STATE_HOLDING = 'holding'
+    STATE_STALLED = 'stalled'
+
+    def __init__(self, address=None, name_pattern=None, name_exact=False, **kwargs):
+        if address is None:
+            address = OUTPUT_A
+        self._state = _world().motor(address, self.MAX_SPEED, self.COUNT_PER_ROT)
+        self.address = address
+        self.kwargs = kwargs
+        self._path = self._state.path
+        self.position_sp = 0
+        self.time_sp = 0
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+    def __str__(self):
+        return "{}({})".format(self.__class__.__name__, self.address)
+
+    # Attributes
+    @property
+    def max_speed(self):
+        return self._state.max_speed
+
+    @property
+    def count_per_rot(self):
+        return self._state.count_per_rot
+
+    @property
+    def position(self):
+        return self._state.position
+
+    @position.setter
+    def position(self, value):
+        self._state.pos = float(value)
+        self._state._sync()
+
+    @property
+    def speed(self):
+        return int(round(self._state.speed))
+
+    @property
+    def state(self):
+        return self._state.state
+
+    @property
+    def is_running(self):
+        return 'running' in self.state
+
+    @property
+    def is_holding(self):
+        return 'holding' in self.state
+
+    @property
+    def is_stalled(self):
+        return False
+
+    @property
+    def speed_sp(self):
+        return self._state.speed_sp
+
+    @speed_sp.setter
+    def speed_sp(self, value):
+        self._state.speed_sp = int(value)
+
+    @property
+    def stop_action(self):
+        return self._state.stop_action
+
+    @stop_action.setter
+    def stop_action(self, value):
+        self._state.stop_action = value
+
+    @property
+    def ramp_up_sp(self):
+        return self._state.ramp_up_sp
+
+    @ramp_up_sp.setter
+    def ramp_up_sp(self, value):
+        self._state.ramp_up_sp = int(value)
+
+    @property
+    def ramp_down_sp(self):
+        return self._state.ramp_down_sp
+
+    @ramp_down_sp.setter
+    def ramp_down_sp(self, value):
+        self._state.ramp_down_sp = int(value)
+
+    @property
+    def command(self):
+        raise AttributeError("command is write only")
+
+    @command.setter
+    def command(self, value):
+        state = self._state
+        if value == self.COMMAND_RUN_FOREVER:
+            state.run('forever')
+        elif value == self.COMMAND_RUN_TO_REL_POS:
+            state.run('position', state.pos + self.position_sp)
+        elif value == self.COMMAND_RUN_TO_ABS_POS:
+            state.run('position', float(self.position_sp))
+        elif value == self.COMMAND_RUN_TIMED:
+            state.run('timed', end_time=state.elapsed + self.time_sp / 1000.0)
+        elif value == self.COMMAND_STOP:
+            state.stop()
+        elif value == self.COMMAND_RESET:
+            state.stop()
+            state.holding = False
+            state.pos = 0.0
+            state.speed_sp = 0
+            state.stop_action = self.STOP_ACTION_COAST
+            state._sync()
+        else:
+            raise ValueError("unknown command {}".format(value))
+
+    def _set_attributes(self, kwargs):
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+    # Commands
+    def run_forever(self, **kwargs):
+        self._set_attributes(kwargs)
+        self.command = self.COMMAND_RUN_FOREVER
+
+    def run_to_abs_pos(self, **kwargs):
+        self._set_attributes(kwargs)
+        self.command = self.COMMAND_RUN_TO_ABS_POS
+
+    def run_to_rel_pos(self, **kwargs):
+        self._set_attributes(kwargs)
+        self.command = self.COMMAND_RUN_TO_REL_POS
+
+    def run_timed(self, **kwargs):
+        self._set_attributes(kwargs)
+        self.command = self.COMMAND_RUN_TIMED
+
+    def stop(self, **kwargs):
+        self._set_attributes(kwargs)
+        self.command = self.COMMAND_STOP
+
+    def reset(self, **kwargs):
+        self._set_attributes(kwargs)
+        self.command = self.COMMAND_RESET
+
+    # Waiting
+    def wait(self, cond, timeout=None):
+        """
+        Wait until cond(state) is true, timeout in milliseconds
+        """
+        clock = _world().clock
+        return clock.wait_for(lambda: cond(self.state), None if timeout is None else timeout / 1000.0)
+
+    def wait_until_not_moving(self, timeout=None):
+        return self.wait(lambda state: self.STATE_RUNNING not in state or self.STATE_STALLED in state, timeout)
+
+    def wait_until(self, s, timeout=None):
+        return self.wait(lambda state: s in state, timeout)
+
+    def wait_while(self, s, timeout=None):
+        return self.wait(lambda state: s not in state, timeout)
+
+    # ev3dev2 helpers
+    def _speed_native_units(self, speed, label=None):
+        return speed_to_speedvalue(speed, label).to_native_units(self)
+
+    def _set_rel_position_degrees_and_speed_sp(self, degrees, speed):
+        degrees = degrees if speed >= 0 else -degrees
+        speed = abs(speed)
+        self.position_sp = int(round((degrees * self.count_per_rot) / 360))
+        self.speed_sp = int(round(speed))
+
+    def _set_brake(self, brake):
+        self.stop_action = self.STOP_ACTION_HOLD if brake else self.STOP_ACTION_COAST
+
+    def _block(self):
+        self.wait_until('running', timeout=WAIT_RUNNING_TIMEOUT)
+        self.wait_until_not_moving()
+
+    def on_for_rotations(self, speed, rotations, brake=True, block=True):
+        self.on_for_degrees(speed, rotations * 360, brake, block)
+
+    def on_for_degrees(self, speed, degrees, brake=True, block=True):
+        speed_sp = self._speed_native_units(speed)
+        self._set_rel_position_degrees_and_speed_sp(degrees, speed_sp)
+        self._set_brake(brake)
+        self.run_to_rel_pos()
+        if block:
+            self._block()
+
+    def on_to_position(self, speed, position, brake=True, block=True):
+        self.speed_sp = int(round(self._speed_native_units(speed)))
+        self.position_sp = position
+        self._set_brake(brake)
+        self.run_to_abs_pos()
+        if block:
+            self._block()
+
+    def on_for_seconds(self, speed, seconds, brake=True, block=True):
+        self.speed_sp = int(round(self._speed_native_units(speed)))
+        self.time_sp = int(seconds * 1000)
+        self._set_brake(brake)
+        self.run_timed()
+        if block:
+            self._block()
+
+    def on(self, speed, brake=True, block=False):
+        self.speed_sp = int(round(self._speed_native_units(speed)))
+        self._set_brake(brake)
+        self.run_forever()
+        if block:
+            self._block()
+
+    def off(self, brake=True):
+        self._set_brake(brake)
+        self.stop()
+
+    @property
+    def rotations(self):
+        return float(self.position) / self.count_per_rot
+
+    @property
+    def degrees(self):
+        return self.rotations * 360
+
+
+WAIT_RUNNING_TIMEOUT = 100
+
+
+class LargeMotor(Motor):
+    MAX_SPEED = 1050
+
+
+class MediumMotor(Motor):
+    MAX_SPEED = 1560
+
+
+class MoveTank:
+    """
+    The parts of ev3dev2.motor.MoveTank the repo uses
+    """
+    def __init__(self, left_motor_port, right_motor_port, desc=None, motor_class=LargeMotor):
+        self.left_motor = motor_class(left_motor_port)
+        self.right_motor = motor_class(right_motor_port)
+        self.motors = {left_motor_port: self.left_motor, right_motor_port: self.right_motor}
+        self.desc = desc
+
+    def __str__(self):
+        return self.desc if self.desc else self.__class__.__name__
+
+    def _unpack_speeds_to_native_units(self, left_speed, right_speed):
+        return (self.left_motor._speed_native_units(left_speed, "left_speed"),
+                self.right_motor._speed_native_units(right_speed, "right_speed"))
+
+    def _block(self):
+        self.left_motor.wait_until('running', timeout=WAIT_RUNNING_TIMEOUT)
+        self.right_motor.wait_until('running', timeout=WAIT_RUNNING_TIMEOUT)
+        self.left_motor.wait_until_not_moving()
+        self.right_motor.wait_until_not_moving()
+
+    def on_for_degrees(self, left_speed, right_speed, degrees, brake=True, block=True):
+        left_native, right_native = self._unpack_speeds_to_native_units(left_speed, right_speed)
+
+        # the faster wheel turns `degrees`, the slower one proportionally less
+        if degrees == 0 or (left_native == 0 and right_native == 0):
+            left_degrees = degrees
+            right_degrees = degrees
+        elif abs(left_native) > abs(right_native):
+            left_degrees = degrees
+            right_degrees = abs(right_native / left_native) * degrees
+        else:
+            left_degrees = abs(left_native / right_native) * degrees
+            right_degrees = degrees
+
+        self.left_motor._set_rel_position_degrees_and_speed_sp(left_degrees, left_native)
+        self.right_motor._set_rel_position_degrees_and_speed_sp(right_degrees, right_native)
+        self.left_motor._set_brake(brake)
+        self.right_motor._set_brake(brake)
+        self.left_motor.run_to_rel_pos()
+        self.right_motor.run_to_rel_pos()
+
+        if block:
+            self._block()
+
+    def on_for_rotations(self, left_speed, right_speed, rotations, brake=True, block=True):
+        self.on_for_degrees(left_speed, right_speed, rotations * 360, brake, block)
+
+    def on_for_seconds(self, left_speed, right_speed, seconds, brake=True, block=True):
+        left_native, right_native = self._unpack_speeds_to_native_units(left_speed, right_speed)
+        for motor, speed in ((self.left_motor, left_native), (self.right_motor, right_native)):
+            motor.speed_sp = int(round(speed))
+            motor.time_sp = int(seconds * 1000)
+            motor._set_brake(brake)
+        self.left_motor.run_timed()
+        self.right_motor.run_timed()
+        if block:
+            self._block()
+
+    def on(self, left_speed, right_speed):
+        left_native, right_native = self._unpack_speeds_to_native_units(left_speed, right_speed)
+        self.left_motor.speed_sp = int(round(left_native))
+        self.right_motor.speed_sp = int(round(right_native))
+        self.left_motor.run_forever()
+        self.right_motor.run_forever()
+
+    def off(self, motors=None, brake=True):
+        motors = motors if motors is not None else self.motors.values()
+        for motor in motors:
+            motor._set_brake(brake)
+        for motor in motors:
+            motor.stop()
+
+    def stop(self, motors=None, brake=True):
+        self.off(motors, brake)
+
+    def reset(self, motors=None):
+        motors = motors if motors is not None else self.motors.values()
+        for motor in motors:
+            motor.reset()
+
+    def run_to_rel_pos(self, **kwargs):
+        for motor in self.motors.values():
+            motor.run_to_rel_pos(**kwargs)
+
+    def wait_until_not_moving(self, timeout=None):
+        return all(motor.wait_until_not_moving(timeout) for motor in self.motors.values())
+
+    @property
+    def is_running(self):
+        return any(motor.is_running for motor in self.motors.values())
+
+
+# ev3dev2.wheel
+
+class Wheel:
+    def __init__(self, diameter_mm, width_mm):
+        self.diameter_mm = float(diameter_mm)
+        self.width_mm = float(width_mm)
+        self.circumference_mm = self.diameter_mm * math.pi
+        self.radius_mm = float(self.diameter_mm / 2)
+
+
+class EV3Rim(Wheel):
+    def __init__(self):
+        Wheel.__init__(self, 30, 20)
+
+
+class EV3Tire(Wheel):
+    def __init__(self):
+        Wheel.__init__(self, 43.2, 21)
+
+
+class EV3EducationSetRim(Wheel):
+    def __init__(self):
+        Wheel.__init__(self, 43, 26)
+
+
+class EV3EducationSetTire(Wheel):
+    def __init__(self):
+        Wheel.__init__(self, 56, 28)
+
+
+# ev3dev2.sensor.lego
+
+class Sensor:
+    """
+    A sensor whose readings come from World.script_sensor() scripts, or
+    DEFAULTS when nothing is scripted
+    """
+    DEFAULTS = {}
+
+    def __init__(self, address=None, **kwargs):
+        self.address = address if address is not None else INPUT_1
+        self.created = _world().clock.now
+
+    def __getattr__(self, name):
+        defaults = type(self).DEFAULTS
+        if name in defaults:
+            return _world().sensor_value(self.address, name, defaults[name])
+        raise AttributeError(name)
+
+    def _wait(self, predicate, timeout_ms=None):
+        clock = _world().clock
+        return clock.wait_for(predicate, None if timeout_ms is None else timeout_ms / 1000.0, fine=True)
+
+
+class TouchSensor(Sensor):
+    """
+    Unscripted, the sensor reads pressed from PRESS_AFTER seconds after it
+    was created so missions that wait for it finish
+    """
+    PRESS_AFTER = 1.0
+
+    @property
+    def is_pressed(self):
+        default = _world().clock.now - self.created >= self.PRESS_AFTER
+        return bool(_world().sensor_value(self.address, 'is_pressed', default))
+
+    @property
+    def is_released(self):
+        return not self.is_pressed
+
+    def wait_for_pressed(self, timeout_ms=None, sleep_ms=10):
+        return self._wait(lambda: self.is_pressed, timeout_ms)
+
+    def wait_for_released(self, timeout_ms=None, sleep_ms=10):
+        return self._wait(lambda: self.is_released, timeout_ms)
+
+    def wait_for_bump(self, timeout_ms=None, sleep_ms=10):
+        return self.wait_for_pressed(timeout_ms) and self.wait_for_released(timeout_ms)
+
+
+class ColorSensor(Sensor):
+    COLORS = ('NoColor', 'Black', 'Blue', 'Green', 'Yellow', 'Red', 'White', 'Brown')
+    DEFAULTS = {
+        'color': 6,
+        'reflected_light_intensity': 50,
+        'ambient_light_intensity': 10,
+        'rgb': (255, 255, 255),
+    }
+
+    @property
+    def color_name(self):
+        return self.COLORS[self.color]
+
+
+class InfraredSensor(Sensor):
+    DEFAULTS = {
+        'proximity': 100,
+    }
+
+
+class UltrasonicSensor(Sensor):
+    DEFAULTS = {
+        'distance_centimeters': 255.0,
+        'distance_inches': 100.0,
+    }
+
+
+class GyroSensor(Sensor):
+    DEFAULTS = {
+        'angle': 0,
+        'rate': 0,
+    }
+
+
+# ev3dev2.sound, console and button
+
+class Sound:
+    """
+    Takes no time and plays nothing, every call is logged in World.sounds
+    """
+    def _log(self, kind, *args):
+        _world().sounds.append((_world().clock.now, kind, args))
+
+    def beep(self, args='', play_type=0):
+        self._log('beep', args)
+
+    def tone(self, *args, **kwargs):
+        self._log('tone', args)
+
+    def play_tone(self, frequency, duration, *args, **kwargs):
+        self._log('tone', frequency, duration)
+
+    def play_note(self, note, duration, *args, **kwargs):
+        self._log('note', note, duration)
+
+    def play_file(self, wav_file, *args, **kwargs):
+        self._log('file', wav_file)
+
+    def speak(self, text, *args, **kwargs):
+        self._log('speak', text)
+
+    def play_song(self, song, *args, **kwargs):
+        self._log('song', song)
+
+    def set_volume(self, pct, channel=None):
+        self.volume = pct
+
+    def get_volume(self, channel=None):
+        return getattr(self, 'volume', 100)
+
+
+class Console:
+    def __init__(self, font=None):
+        self.font = font
+
+    def text_at(self, text, column=1, row=1, reset_console=False, inverse=False, alignment='L'):
+        pass
+
+    def set_font(self, font=None, reset_console=True):
+        self.font = font
+
+    def reset_console(self):
+        pass
+
+
+class Button:
+    buttons_pressed = []
+
+    def process(self, new_state=None):
+        pass
+
+    def any(self):
+        return False
+
+
+class DeviceNotFound(Exception):
+    pass
+
+
+def _module(name, **attributes):
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    return module
+
+
+def modules():
+    """
+    The fake ev3dev2 modules by name
+    """
+    ports = dict(OUTPUT_A=OUTPUT_A, OUTPUT_B=OUTPUT_B, OUTPUT_C=OUTPUT_C, OUTPUT_D=OUTPUT_D)
+    inputs = dict(INPUT_1=INPUT_1, INPUT_2=INPUT_2, INPUT_3=INPUT_3, INPUT_4=INPUT_4)
+
+    motor = _module('ev3dev2.motor', Motor=Motor, LargeMotor=LargeMotor, MediumMotor=MediumMotor,
+                    MoveTank=MoveTank, SpeedValue=SpeedValue, SpeedPercent=SpeedPercent,
+                    SpeedNativeUnits=SpeedNativeUnits, SpeedRPS=SpeedRPS, SpeedRPM=SpeedRPM,
+                    SpeedDPS=SpeedDPS, SpeedDPM=SpeedDPM, speed_to_speedvalue=speed_to_speedvalue,
+                    WAIT_RUNNING_TIMEOUT=WAIT_RUNNING_TIMEOUT, **ports)
+    lego = _module('ev3dev2.sensor.lego', Sensor=Sensor, TouchSensor=TouchSensor, ColorSensor=ColorSensor,
+                   InfraredSensor=InfraredSensor, UltrasonicSensor=UltrasonicSensor, GyroSensor=GyroSensor)
+    sensor = _module('ev3dev2.sensor', Sensor=Sensor, lego=lego, **inputs)
+    wheel = _module('ev3dev2.wheel', Wheel=Wheel, EV3Rim=EV3Rim, EV3Tire=EV3Tire,
+                    EV3EducationSetRim=EV3EducationSetRim, EV3EducationSetTire=EV3EducationSetTire)
+    sound = _module('ev3dev2.sound', Sound=Sound)
+    console = _module('ev3dev2.console', Console=Console)
+    button = _module('ev3dev2.button', Button=Button)
+    package = _module('ev3dev2', DeviceNotFound=DeviceNotFound, motor=motor, sensor=sensor, wheel=wheel,
+                      sound=sound, console=console, button=button)
+    package.__path__ = []
+
+    return {
+        'ev3dev2': package,
+        'ev3dev2.motor': motor,
+        'ev3dev2.sensor': sensor,
+        'ev3dev2.sensor.lego': lego,
+        'ev3dev2.wheel': wheel,
+        'ev3dev2.sound': sound,
+        'ev3dev2.console': console,
+        'ev3dev2.button': button,
+    }
+
+
+def install(step=0.001, limit=3600.0):
+    """
+    Replace ev3dev2, time.sleep() and the clocks with the simulation and
+    return the new World. ``step`` is the motor time step and ``limit`` the
+    virtual seconds after which waiting threads raise SimTimeout.
+    """
+    global world
+    if world is not None:
+        raise RuntimeError("the simulation is already installed")
+
+    world = World(step, limit)
+    clock = world.clock
+
+    sys.modules.update(modules())
+
+    time.sleep = clock.sleep
+    time.time = clock.time
+    time.monotonic = clock.time
+    time.perf_counter = clock.time
+
+    _thread.start_new_thread = clock.start_new_thread
+    _thread.start_new = clock.start_new_thread
+    _thread.allocate_lock = lambda: SimLock(clock)
+    _thread.allocate = _thread.allocate_lock
+    threading._start_new_thread = clock._threading_start
+
+    return world
+
+
+def run(path, argv=()):
+    """
+    Run a mission script under the simulation, returns
+    ``(world, virtual seconds, wall seconds)``
+    """
+    if world is None:
+        install()
+    directory = os.path.dirname(os.path.abspath(path))
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    sys.argv = [path] + list(argv)
+
+    start = world.clock.now
+    wall = _real_perf_counter()
+    runpy.run_path(path, run_name='__main__')
+    return world, world.clock.now - start, _real_perf_counter() - wall
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("usage: Sim.py mission.py [args...]")
+        sys.exit(1)
+
+    world, virtual, wall = run(sys.argv[1], sys.argv[2:])
+    print("simulated {:.3f} s in {:.3f} s ({:.0f}x), {} steps".format(
+        virtual, wall, virtual / wall if wall else 0.0, world.clock.steps))
+    for port, position in sorted(world.positions().items()):
+        print("  {} at {}".format(port, position))
+    sys.stdout.flush()
+    world.close()
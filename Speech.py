@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+
+# Cached, non-blocking speech
+#
+# ev3.Sound.speak() runs espeak for every phrase, which takes seconds on the
+# brick, and .wait() then blocks until it has been played. SpeechCache keeps
+# the synthesized clips on disk, keyed by the text and the voice settings,
+# evicting the least recently used ones past a size limit, and plays them
+# one after another on a background thread:
+#
+#   speech = SpeechCache()
+#   speech.warm(marvin_quotes)                  # synthesize what is missing
+#   speech.say("Life? Don't talk to me about life!")
+#   speech.say("Now I've got a headache.").wait()
+#
+# The synthesizer and the player are arguments; silence() and a player that
+# does nothing stand in for espeak and aplay off the brick.
+
+import _thread
+import hashlib
+import os
+import subprocess
+import wave
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.speech')
+MAX_BYTES = 8 * 1024 * 1024
+
+# ev3.Sound.speak() defaults: amplitude and words per minute
+VOICE = '-a 200 -s 130'
+
+
+def espeak(text, voice, path):
+    """
+    Synthesize ``text`` into the wav file ``path``
+    """
+    subprocess.check_call(['espeak'] + voice.split() + ['-w', path, text])
+
+
+def aplay(path):
+    """
+    Play a wav file to the end
+    """
+    subprocess.check_call(['aplay', '-q', path])
+
+
+def silence(text, voice, path, seconds_per_char=0.0):
+    """
+    Stand-in synthesizer writing a silent clip
+    """
+    f = wave.open(path, 'wb')
+    try:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(8000)
+        f.writeframes(b'\0\0' * int(8000 * seconds_per_char * len(text)))
+    finally:
+        f.close()
+
+
+class Playback:
+    """
+    Handle of a phrase waiting for or being played
+    """
+    def __init__(self, text):
+        self.text = text
+        self.error = None
+        self._done = _thread.allocate_lock()
+        self._done.acquire()
+
+    def done(self):
+        return not self._done.locked()
+
+    def wait(self):
+        """
+        Block until the phrase has been played, raises what went wrong
+        """
+        self._done.acquire()
+        self._done.release()
+        if self.error is not None:
+            raise self.error
+        return self
+
+    def _finish(self, error=None):
+        self.error = error
+        self._done.release()
+
+
+class SpeechCache:
+    def __init__(self, directory=CACHE_DIR, max_bytes=MAX_BYTES, voice=VOICE, synthesize=espeak, play=aplay):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.voice = voice
+        self.synthesize = synthesize
+        self.play = play
+
+        self.hits = 0
+        self.misses = 0
+
+        self.lock = _thread.allocate_lock()
+        self._queue = []
+        self._wake = _thread.allocate_lock()
+        self._wake.acquire()
+        self._player = False
+
+    def path(self, text, voice=None):
+        key = '{}\0{}'.format(self.voice if voice is None else voice, text)
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.wav')
+
+    def clip(self, text, voice=None):
+        """
+        Path of the clip of ``text``, synthesized now if it is not cached
+        """
+        voice = self.voice if voice is None else voice
+        path = self.path(text, voice)
+        try:
+            # the modification time orders clips for eviction
+            os.utime(path, None)
+            self.hits += 1
+            return path
+        except OSError:
+            pass
+
+        self.misses += 1
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = '{}.{}.tmp'.format(path, _thread.get_ident())
+        try:
+            self.synthesize(text, voice, tmp)
+            os.rename(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep=None):
+        """
+        Remove the least recently used clips until the cache fits
+        ``max_bytes``
+        """
+        with self.lock:
+            clips = []
+            total = 0
+            for name in os.listdir(self.directory):
+                if not name.endswith('.wav'):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                clips.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+
+            clips.sort()
+            for mtime, size, path in clips:
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                total -= size
+
+    def warm(self, phrases, voice=None):
+        """
+        Synthesize every phrase not cached yet. ``phrases`` is a list of
+        strings or a dict of them, like marvin_quotes. Returns the number
+        synthesized.
+        """
+        if isinstance(phrases, dict):
+            phrases = [text for values in phrases.values() for text in values]
+        misses = self.misses
+        for text in phrases:
+            self.clip(text, voice)
+        return self.misses - misses
+
+    def say(self, text, voice=None):
+        """
+        Queue ``text`` to be spoken and return its Playback straight away,
+        phrases are played in the order they were queued
+        """
+        playback = Playback(text)
+        with self.lock:
+            self._queue.append((playback, voice))
+            if not self._player:
+                self._player = True
+                _thread.start_new_thread(self._play, ())
+            if self._wake.locked():
+                self._wake.release()
+        return playback
+
+    def _play(self):
+        while True:
+            self._wake.acquire()
+            while True:
+                with self.lock:
+                    if not self._queue:
+                        break
+                    playback, voice = self._queue.pop(0)
+                try:
+                    self.play(self.clip(playback.text, voice))
+                    playback._finish()
+                except Exception as e:
+                    playback._finish(e)
@@ -44,18 +44,19 @@ while en:
 sleep(0.5)
 position = []
 
+# Run every move and turn back to back, each starts as soon as the last one
+# settled
+commands = []
 for rand in [60, 120, 90]:
+    commands.append(('move', rand))
+    commands.append(('turn',))
+    commands.append(('move', rand))
+    commands.append(('turn',))
 
-    position.append(chassis.position())
-    chassis.move_dif(units=rand)
-    sleep(0.05)
-    chassis.turn_angle()
-    sleep(0.05)
-    position.append(chassis.position())
-    chassis.move_dif(units=rand)
-    sleep(0.05)
-    chassis.turn_angle()
-    sleep(0.05)       
+# Positions are logged after every move + turn pair, like before
+position.append(chassis.position())
+for timing in chassis.run_queue(commands)[1::2]:
+    position.append(timing['position'])
 
 
 f = open("subtask1b.log", "a")
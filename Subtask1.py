@@ -47,14 +47,15 @@ position = []
 
 rand = 80
 
+# Run every move back to back, each starts as soon as the last one settled
+commands = []
 for i in range(n):
+    commands.append(('move', rand))
+    commands.append(('move', rand, 15, True))
 
-    position.append(chassis.position())
-    chassis.move_dif(units=rand)
-    sleep(0.05)
-    position.append(chassis.position())
-    chassis.move_dif(units=rand, backwards=True)
-    sleep(0.05)      
+position.append(chassis.position())
+for timing in chassis.run_queue(commands):
+    position.append(timing['position'])
 
 
 
@@ -0,0 +1,181 @@
+#!/usr/bin/env micropython
+
+# Synchronized start of two motors
+#
+# MoveTank.on_for_degrees() sets up the left motor, then the right one, then
+# starts the left motor and the right one through the generic ev3dev2
+# attribute code, so the right wheel starts a good part of a millisecond
+# after the left and the robot pulls to one side on every straight move.
+#
+# SyncPair stages every setpoint of both motors first and then writes the
+# two run commands back to back to command files it opened up front. The
+# gap between the two writes returning, the start skew, is measured on
+# every start; skew_stats() has the last, largest and mean skew.
+#
+#   pair = SyncPair(tank.left_motor, tank.right_motor)
+#   pair.on_for_rotations(SpeedPercent(20), SpeedPercent(20), 3)
+#   print(pair.skew_stats())
+#
+# Motors without a sysfs command file (Sim.py) are started through their
+# command attribute.
+
+import os
+import time
+
+_clock = getattr(time, 'monotonic', None) or time.time
+
+# MoveTank waits this long for the motors to report running
+WAIT_RUNNING_TIMEOUT = 100
+
+RUN_TO_REL_POS = 'run-to-rel-pos'
+RUN_TO_ABS_POS = 'run-to-abs-pos'
+RUN_FOREVER = 'run-forever'
+STOP = 'stop'
+
+
+def _open_command(motor):
+    path = getattr(motor, '_path', None)
+    if path is None:
+        return None
+    try:
+        return os.open(path + '/command', os.O_WRONLY)
+    except OSError:
+        return None
+
+
+class SyncPair:
+    """
+    Two motors started as close together as Python allows. Stage the
+    setpoints with stage() (or any attribute writes), then start() them.
+    """
+    def __init__(self, left_motor, right_motor, clock=_clock):
+        self.left_motor = left_motor
+        self.right_motor = right_motor
+        self.clock = clock
+
+        self._left_fd = _open_command(left_motor)
+        self._right_fd = _open_command(right_motor)
+
+        self.samples = 0
+        self.skew_last = 0.0
+        self.skew_max = 0.0
+        self.skew_total = 0.0
+
+    def stage(self, left_speed, right_speed, left_position, right_position, brake=True):
+        """
+        Set speed_sp, position_sp and the stop action of both motors, speeds
+        in native units, positions in tacho counts
+        """
+        left = self.left_motor
+        right = self.right_motor
+        left.speed_sp = int(round(left_speed))
+        right.speed_sp = int(round(right_speed))
+        left.position_sp = int(round(left_position))
+        right.position_sp = int(round(right_position))
+        left._set_brake(brake)
+        right._set_brake(brake)
+
+    def start(self, command=RUN_TO_REL_POS):
+        """
+        Issue ``command`` to both motors back to back, returns the start
+        skew in seconds
+        """
+        left_fd = self._left_fd
+        right_fd = self._right_fd
+        clock = self.clock
+
+        if left_fd is not None and right_fd is not None:
+            data = command.encode()
+            write = os.write
+            write(left_fd, data)
+            left_started = clock()
+            write(right_fd, data)
+            right_started = clock()
+        else:
+            left = self.left_motor
+            right = self.right_motor
+            left.command = command
+            left_started = clock()
+            right.command = command
+            right_started = clock()
+
+        skew = right_started - left_started
+        self.samples += 1
+        self.skew_last = skew
+        self.skew_total += skew
+        if skew > self.skew_max:
+            self.skew_max = skew
+        return skew
+
+    def stop(self):
+        self.start(STOP)
+
+    def wait(self):
+        """
+        Block like MoveTank does: until both motors ran and stopped
+        """
+        self.left_motor.wait_until('running', timeout=WAIT_RUNNING_TIMEOUT)
+        self.right_motor.wait_until('running', timeout=WAIT_RUNNING_TIMEOUT)
+        self.left_motor.wait_until_not_moving()
+        self.right_motor.wait_until_not_moving()
+
+    def on_for_degrees(self, left_speed, right_speed, degrees, brake=True, block=True):
+        """
+        MoveTank.on_for_degrees() with a synchronized start: the faster
+        wheel turns ``degrees``, the other one in proportion
+        """
+        left = self.left_motor
+        right = self.right_motor
+        left_speed = left._speed_native_units(left_speed)
+        right_speed = right._speed_native_units(right_speed)
+
+        if degrees == 0 or (left_speed == 0 and right_speed == 0):
+            left_degrees = degrees
+            right_degrees = degrees
+        elif abs(left_speed) > abs(right_speed):
+            left_degrees = degrees
+            right_degrees = abs(right_speed / left_speed) * degrees
+        else:
+            left_degrees = abs(left_speed / right_speed) * degrees
+            right_degrees = degrees
+
+        # position_sp takes the direction from the speed, as in ev3dev2
+        if left_speed < 0:
+            left_degrees = -left_degrees
+        if right_speed < 0:
+            right_degrees = -right_degrees
+
+        self.stage(abs(left_speed), abs(right_speed),
+                   left_degrees * left.count_per_rot / 360.0, right_degrees * right.count_per_rot / 360.0,
+                   brake)
+        self.start(RUN_TO_REL_POS)
+        if block:
+            self.wait()
+
+    def on_for_rotations(self, left_speed, right_speed, rotations, brake=True, block=True):
+        self.on_for_degrees(left_speed, right_speed, rotations * 360, brake, block)
+
+    def skew_stats(self):
+        """
+        Start skew between the left and right motor in seconds
+        """
+        return {
+            'samples': self.samples,
+            'last': self.skew_last,
+            'max': self.skew_max,
+            'mean': self.skew_total / self.samples if self.samples else 0.0,
+        }
+
+    def reset_stats(self):
+        self.samples = 0
+        self.skew_last = 0.0
+        self.skew_max = 0.0
+        self.skew_total = 0.0
+
+    def close(self):
+        if self._left_fd is not None:
+            os.close(self._left_fd)
+            self._left_fd = None
+        if self._right_fd is not None:
+            os.close(self._right_fd)
+            self._right_fd = None
@@ -0,0 +1,181 @@
+#!/usr/bin/env micropython
+
+# Binary telemetry for the odometry loop
+#
+# Every sample is a fixed size little endian record packed straight into a
+# file that was sized for the whole run up front. Where mmap exists the
+# records go into the mapping and the record count in the header is
+# updated every batch, on MicroPython a batch sized buffer is packed and
+# written out instead. Either way nothing is synced to disk from the
+# sampling loop, an msync of the whole mapping takes milliseconds; that
+# only happens on flush() and close(), which odometry calls when it stops.
+# The counted records survive the program crashing, what was flushed also
+# survives the brick losing power.
+#
+# Convert a recording with:
+#
+#   python3 Telemetry.py run.bin run.csv
+#   python3 Telemetry.py run.bin run.npy
+
+import struct
+import sys
+
+try:
+    import mmap
+except ImportError:
+    mmap = None
+
+MAGIC = b'EV3T'
+VERSION = 1
+
+# magic, version, record size, capacity, records written
+HEADER = '<4sHHII'
+HEADER_SIZE = struct.calcsize(HEADER)
+
+# timestamp, left ticks, right ticks, x_mm, y_mm, theta
+RECORD = '<diifff'
+RECORD_SIZE = struct.calcsize(RECORD)
+
+FIELDS = ('time', 'left', 'right', 'x_mm', 'y_mm', 'theta')
+
+
+class TelemetryRecorder:
+    """
+    Append-only recorder of ``(timestamp, left, right, x_mm, y_mm, theta)``
+    samples into a preallocated file of ``capacity`` records.
+
+    Records are counted in the header every ``batch`` appends and synced to
+    disk by flush() or close(). Once the file is full further samples are counted in
+    ``dropped`` rather than growing the file.
+    """
+    def __init__(self, path, capacity=120000, batch=200):
+        self.path = path
+        self.capacity = capacity
+        self.batch = batch
+        self.count = 0
+        self.flushed = 0
+        self.dropped = 0
+
+        size = HEADER_SIZE + capacity * RECORD_SIZE
+        self.file = open(path, 'w+b')
+        self.file.seek(size - 1)
+        self.file.write(b'\0')
+        self.file.flush()
+
+        if mmap is not None:
+            self.map = mmap.mmap(self.file.fileno(), size)
+            self.buffer = None
+        else:
+            self.map = None
+            self.buffer = bytearray(batch * RECORD_SIZE)
+
+        self._write_header()
+
+    def _write_header(self):
+        header = struct.pack(HEADER, MAGIC, VERSION, RECORD_SIZE, self.capacity, self.flushed)
+        if self.map is not None:
+            self.map[0:HEADER_SIZE] = header
+        else:
+            self.file.seek(0)
+            self.file.write(header)
+
+    def append(self, timestamp, left, right, x_mm, y_mm, theta):
+        count = self.count
+        if count >= self.capacity:
+            self.dropped += 1
+            return
+
+        if self.map is not None:
+            struct.pack_into(RECORD, self.map, HEADER_SIZE + count * RECORD_SIZE,
+                             timestamp, left, right, x_mm, y_mm, theta)
+        else:
+            struct.pack_into(RECORD, self.buffer, (count - self.flushed) * RECORD_SIZE,
+                             timestamp, left, right, x_mm, y_mm, theta)
+
+        self.count = count + 1
+        if self.count - self.flushed >= self.batch:
+            self._commit()
+
+    def _commit(self):
+        """
+        Count the pending records in the header, writing them out first
+        without mmap, but do not sync
+        """
+        pending = self.count - self.flushed
+        if not pending:
+            return
+
+        if self.map is None:
+            self.file.seek(HEADER_SIZE + self.flushed * RECORD_SIZE)
+            self.file.write(memoryview(self.buffer)[:pending * RECORD_SIZE])
+
+        self.flushed = self.count
+        self._write_header()
+
+    def flush(self):
+        self._commit()
+        if self.map is not None:
+            self.map.flush()
+        else:
+            self.file.flush()
+
+    def close(self):
+        if self.file is None:
+            return
+        self.flush()
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+        self.file = None
+
+
+def _read_header(data):
+    magic, version, record_size, capacity, count = struct.unpack_from(HEADER, data, 0)
+    if magic != MAGIC:
+        raise ValueError("not a telemetry recording")
+    if version != VERSION or record_size != RECORD_SIZE:
+        raise ValueError("unsupported telemetry version {} record size {}".format(version, record_size))
+    return count
+
+
+def read(path):
+    """
+    Records of a recording as a list of tuples
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    count = _read_header(data)
+    return [struct.unpack_from(RECORD, data, HEADER_SIZE + i * RECORD_SIZE) for i in range(count)]
+
+
+def load(path):
+    """
+    Records of a recording as a NumPy structured array with the FIELDS
+    """
+    import numpy as np
+
+    with open(path, 'rb') as f:
+        count = _read_header(f.read(HEADER_SIZE))
+    dtype = np.dtype([('time', '<f8'), ('left', '<i4'), ('right', '<i4'),
+                      ('x_mm', '<f4'), ('y_mm', '<f4'), ('theta', '<f4')])
+    return np.fromfile(path, dtype=dtype, count=count, offset=HEADER_SIZE)
+
+
+def to_csv(path, out_path):
+    with open(out_path, 'w') as out:
+        out.write(','.join(FIELDS) + '\n')
+        for record in read(path):
+            out.write('{:.6f},{},{},{:.3f},{:.3f},{:.6f}\n'.format(*record))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print("usage: Telemetry.py recording.bin out.csv|out.npy")
+        sys.exit(1)
+
+    if sys.argv[2].endswith('.npy'):
+        import numpy as np
+        np.save(sys.argv[2], load(sys.argv[1]))
+    else:
+        to_csv(sys.argv[1], sys.argv[2])
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+
+# Visiting order for multi-target missions
+#
+# Each leg of a mission driven with on_to_coordinates() costs a turn on the
+# spot (turn_to_angle) plus a straight drive, so the cheapest order is not
+# just the shortest path. plan_order() builds a route with nearest neighbour
+# and improves it with 2-opt, both scored in seconds with the turn included.
+#
+# NumPy is used when it is available (the dev box) to score all candidates
+# of a step at once, the brick falls back to plain Python.
+
+import math
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+TWO_PI = 2 * math.pi
+
+# chassis drives and turns at 15% by default, with EV3EducationSetTire and
+# the chassis wheel well that is roughly 77 mm/s and 79 deg/s
+DRIVE_SPEED_MM_S = 77.0
+TURN_SPEED_DEG_S = 79.0
+
+
+def _turn(h_in, h_out):
+    """
+    Size of the turn in radians between two headings, the short way round
+    like turn_to_angle()
+    """
+    delta = (h_out - h_in + math.pi) % TWO_PI - math.pi
+    return abs(delta)
+
+
+class _Costs:
+    """
+    Distance and heading between every pair of points, plus the start heading
+    """
+    def __init__(self, points, theta, drive_speed_mm_s, turn_speed_deg_s, vectorize):
+        self.points = points
+        self.theta = theta
+        self.drive = 1.0 / drive_speed_mm_s
+        self.turn = 1.0 / math.radians(turn_speed_deg_s)
+        self.vectorize = vectorize
+
+        if vectorize:
+            xy = np.array(points, dtype=float)
+            dx = xy[None, :, 0] - xy[:, None, 0]
+            dy = xy[None, :, 1] - xy[:, None, 1]
+            self.D = np.hypot(dx, dy)
+            self.H = np.arctan2(dy, dx)
+        else:
+            n = len(points)
+            self.D = [[0.0] * n for i in range(n)]
+            self.H = [[0.0] * n for i in range(n)]
+            for i, (xa, ya) in enumerate(points):
+                for j, (xb, yb) in enumerate(points):
+                    self.D[i][j] = math.sqrt((xb - xa) ** 2 + (yb - ya) ** 2)
+                    self.H[i][j] = math.atan2(yb - ya, xb - xa)
+
+    def route(self, route):
+        """
+        Drive time in seconds of visiting ``route`` (point indexes) in order
+        """
+        D = self.D
+        H = self.H
+        heading = self.theta
+        total = 0.0
+        for k in range(len(route) - 1):
+            a = route[k]
+            b = route[k + 1]
+            total += _turn(heading, H[a][b]) * self.turn + D[a][b] * self.drive
+            heading = H[a][b]
+        return float(total)
+
+
+def _nearest_neighbour(costs, count, end):
+    """
+    Greedy route from point 0, always taking the cheapest next leg
+    """
+    D = costs.D
+    H = costs.H
+    heading = costs.theta
+    current = 0
+    route = [0]
+    remaining = [i for i in range(1, count) if i != end]
+
+    while remaining:
+        if costs.vectorize:
+            cand = np.array(remaining)
+            h_out = H[current, cand]
+            turn = np.abs((h_out - heading + math.pi) % TWO_PI - math.pi)
+            best = int(np.argmin(turn * costs.turn + D[current, cand] * costs.drive))
+        else:
+            best = 0
+            best_cost = None
+            for k, cand in enumerate(remaining):
+                cost = _turn(heading, H[current][cand]) * costs.turn + D[current][cand] * costs.drive
+                if best_cost is None or cost < best_cost:
+                    best = k
+                    best_cost = cost
+
+        nxt = remaining.pop(best)
+        heading = H[current][nxt]
+        current = nxt
+        route.append(nxt)
+
+    if end is not None:
+        route.append(end)
+    return route
+
+
+def _two_opt_deltas(costs, route, i, last):
+    """
+    Change in seconds for reversing route[i:j + 1], for every j in
+    i + 1 .. last. Only the two edges at the ends of the reversed stretch
+    and the turns at the four points around them change, everything inside
+    is driven backwards with the same distances and turn sizes.
+    """
+    D = costs.D
+    H = costs.H
+    length = len(route)
+    a = route[i - 1]
+    b = route[i]
+    after_b = route[i + 1]
+    h_in = H[route[i - 2]][a] if i >= 2 else costs.theta
+
+    if costs.vectorize:
+        r = np.asarray(route)
+        js = np.arange(i + 1, last + 1)
+        c = r[js]
+        before_c = r[js - 1]
+        has_d = js + 1 < length
+        has_dd = js + 2 < length
+        d = r[np.minimum(js + 1, length - 1)]
+        dd = r[np.minimum(js + 2, length - 1)]
+
+        def turn(h0, h1):
+            return np.abs((h1 - h0 + math.pi) % TWO_PI - math.pi)
+
+        old_dist = D[a, b] + np.where(has_d, D[c, d], 0.0)
+        new_dist = D[a, c] + np.where(has_d, D[b, d], 0.0)
+        old_turn = (turn(h_in, H[a, b]) + turn(H[a, b], H[b, after_b])
+                    + np.where(has_d, turn(H[before_c, c], H[c, d]), 0.0)
+                    + np.where(has_dd, turn(H[c, d], H[d, dd]), 0.0))
+        new_turn = (turn(h_in, H[a, c]) + turn(H[a, c], H[c, before_c])
+                    + np.where(has_d, turn(H[after_b, b], H[b, d]), 0.0)
+                    + np.where(has_dd, turn(H[b, d], H[d, dd]), 0.0))
+        return (new_dist - old_dist) * costs.drive + (new_turn - old_turn) * costs.turn
+
+    deltas = []
+    for j in range(i + 1, last + 1):
+        c = route[j]
+        before_c = route[j - 1]
+        old_dist = D[a][b]
+        new_dist = D[a][c]
+        old_turn = _turn(h_in, H[a][b]) + _turn(H[a][b], H[b][after_b])
+        new_turn = _turn(h_in, H[a][c]) + _turn(H[a][c], H[c][before_c])
+        if j + 1 < length:
+            d = route[j + 1]
+            old_dist += D[c][d]
+            new_dist += D[b][d]
+            old_turn += _turn(H[before_c][c], H[c][d])
+            new_turn += _turn(H[after_b][b], H[b][d])
+            if j + 2 < length:
+                dd = route[j + 2]
+                old_turn += _turn(H[c][d], H[d][dd])
+                new_turn += _turn(H[b][d], H[d][dd])
+        deltas.append((new_dist - old_dist) * costs.drive + (new_turn - old_turn) * costs.turn)
+    return deltas
+
+
+def _two_opt(costs, route, fixed_end, max_passes):
+    """
+    Reverse stretches of the route while that makes it cheaper
+    """
+    last = len(route) - 2 if fixed_end else len(route) - 1
+
+    for _ in range(max_passes):
+        improved = False
+        for i in range(1, last):
+            deltas = _two_opt_deltas(costs, route, i, last)
+            if costs.vectorize:
+                k = int(np.argmin(deltas))
+                best = float(deltas[k])
+            else:
+                best = min(deltas)
+                k = deltas.index(best)
+            if best < -1e-9:
+                j = i + 1 + k
+                route[i:j + 1] = route[i:j + 1][::-1]
+                improved = True
+        if not improved:
+            break
+    return route
+
+
+def plan_order(targets, start=(0.0, 0.0, 90.0), end=None,
+               drive_speed_mm_s=DRIVE_SPEED_MM_S, turn_speed_deg_s=TURN_SPEED_DEG_S,
+               improve=True, max_passes=50, vectorize=None):
+    """
+    Order in which to visit ``targets`` (list of ``(x_mm, y_mm)``) to keep the
+    estimated drive time low.
+
+    ``start`` is the robot pose ``(x_mm, y_mm, theta_degrees)``, the heading
+    uses the same convention as odometry_start(). ``end`` optionally fixes
+    the point the mission has to finish on.
+
+    Returns ``(order, seconds)`` where ``order`` is a list of indexes into
+    ``targets`` and ``seconds`` the estimated drive time of the route.
+    """
+    if vectorize is None:
+        vectorize = np is not None
+    elif vectorize and np is None:
+        raise ImportError("vectorize=True needs numpy")
+
+    points = [(float(start[0]), float(start[1]))] + [(float(x), float(y)) for (x, y) in targets]
+    end_index = None
+    if end is not None:
+        end_index = len(points)
+        points.append((float(end[0]), float(end[1])))
+
+    costs = _Costs(points, math.radians(start[2]), drive_speed_mm_s, turn_speed_deg_s, vectorize)
+    route = _nearest_neighbour(costs, len(points), end_index)
+
+    if improve and len(route) > 3:
+        route = _two_opt(costs, route, end_index is not None, max_passes)
+
+    order = [k - 1 for k in route[1:] if k != end_index]
+    return order, costs.route(route)
+
+
+def route_time(targets, start=(0.0, 0.0, 90.0), end=None,
+               drive_speed_mm_s=DRIVE_SPEED_MM_S, turn_speed_deg_s=TURN_SPEED_DEG_S):
+    """
+    Estimated drive time in seconds of visiting ``targets`` in the given order
+    """
+    points = [(float(start[0]), float(start[1]))] + [(float(x), float(y)) for (x, y) in targets]
+    if end is not None:
+        points.append((float(end[0]), float(end[1])))
+    costs = _Costs(points, math.radians(start[2]), drive_speed_mm_s, turn_speed_deg_s, False)
+    return costs.route(list(range(len(points))))
@@ -0,0 +1,302 @@
+#!/usr/bin/env micropython
+
+# Sensor triggers that stop motors
+#
+# motor.on(); touch.wait_for_pressed(); motor.off() watches one sensor, at
+# whatever rate the wait helper polls, and goes through the ev3dev2
+# attribute code both to read the sensor and to stop the motor.
+# TriggerEngine instead watches any number of conditions on touch, color,
+# infrared and ultrasonic sensors in one loop on a fixed period:
+#
+#   engine = TriggerEngine(period=0.002)
+#   engine.when(touch, 'is_pressed', '==', 1, stop=[motor], name='limit')
+#   engine.when(color, 'reflected_light_intensity', '<', 15, stop=[left, right], name='edge')
+#   left.on(20); right.on(20)
+#   engine.run(timeout=30)
+#   print(engine.latency.report())
+#
+# The sensor value files and the motor command files are opened when a
+# condition is added. A pass reads each sensor value once, compares it
+# against thresholds already converted to raw sysfs units and writes "stop"
+# straight to the command files of the motors of a condition that is met.
+#
+# Trigger to stop latency goes into a LatencyRecorder histogram under the
+# condition's name. A condition can have become true any time after the
+# sensors were read in the pass before, so that is where it is measured
+# from, in phases:
+#
+#   sleep    previous pass's reads to this pass's reads, the sampling delay
+#   setup    comparing, up to the first stop write
+#   write    the stop writes
+#   total    all of it, the worst case trigger to stop latency
+#
+# The loop's own timing goes into a RateScheduler.
+#
+# Conditions on one sensor must all use the same mode: a sensor reads one
+# mode at a time and switching it every pass gives garbage.
+#
+# Devices without sysfs files (Sim.py) are read and stopped through their
+# Python attributes instead.
+
+import os
+import time
+
+from Latency import LatencyRecorder, SETUP, SLEEP, WRITE
+from Scheduler import RateScheduler
+
+try:
+    _pread = os.pread
+except AttributeError:
+    _pread = None  # MicroPython, fall back to seek + read
+
+_clock = getattr(time, 'monotonic', None) or time.time
+
+PERIOD = 0.002
+
+# attribute -> (mode, value file, raw units per attribute unit)
+ATTRIBUTES = {
+    'is_pressed': ('TOUCH', 'value0', 1),
+    'reflected_light_intensity': ('COL-REFLECT', 'value0', 1),
+    'ambient_light_intensity': ('COL-AMBIENT', 'value0', 1),
+    'color': ('COL-COLOR', 'value0', 1),
+    'proximity': ('IR-PROX', 'value0', 1),
+    'distance_centimeters': ('US-DIST-CM', 'value0', 10),
+}
+
+LT, LE, GT, GE, EQ, NE = range(6)
+OPERATORS = {'<': LT, '<=': LE, '>': GT, '>=': GE, '==': EQ, '!=': NE}
+
+
+class _Source:
+    """
+    One sensor value, read once per pass whatever number of conditions
+    use it
+    """
+    def __init__(self, sensor, attribute):
+        self.sensor = sensor
+        self.attribute = attribute
+        self.value = 0
+        self.fd = None
+        self.file = None
+        self.scale = 1
+
+        entry = ATTRIBUTES.get(attribute)
+        self.mode = entry[0] if entry is not None else None
+        path = getattr(sensor, '_path', None)
+        if entry is None or path is None:
+            return
+        mode, name, self.scale = entry
+        try:
+            if sensor.mode != mode:
+                sensor.mode = mode
+            if _pread is not None:
+                self.fd = os.open(path + '/' + name, os.O_RDONLY)
+            else:
+                self.file = open(path + '/' + name, 'rb')
+        except (OSError, AttributeError):
+            self.fd = None
+            self.file = None
+            self.scale = 1
+
+    def read(self):
+        if self.fd is not None:
+            self.value = int(_pread(self.fd, 16, 0))
+        elif self.file is not None:
+            self.file.seek(0)
+            self.value = int(self.file.read(16))
+        else:
+            self.value = getattr(self.sensor, self.attribute)
+        return self.value
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class _Stop:
+    """
+    "stop" written to the command file of each motor, or motor.stop()
+    """
+    def __init__(self, motor, stop_action):
+        self.motor = motor
+        self.fd = None
+        motor.stop_action = stop_action
+        path = getattr(motor, '_path', None)
+        if path is not None:
+            try:
+                self.fd = os.open(path + '/command', os.O_WRONLY)
+            except OSError:
+                self.fd = None
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class Trigger:
+    def __init__(self, name, source, op, threshold, stops, action, once):
+        self.name = name
+        self.source = source
+        self.op = op
+        self.threshold = threshold
+        self.stops = stops
+        self.action = action
+        self.once = once
+        self.armed = True
+        self.active = False
+        self.fired = 0
+        self.fired_at = None
+
+
+class TriggerEngine:
+    """
+    Watch conditions on sensor values and stop motors when they are met
+    """
+    def __init__(self, period=PERIOD, latency=None, clock=_clock, sleep=time.sleep):
+        self.clock = clock
+        self.scheduler = RateScheduler(period, clock=clock, sleep=sleep)
+        self.latency = latency if latency is not None else LatencyRecorder((), clock)
+        self.sources = []
+        self.triggers = []
+        self.passes = 0
+        # clock reading after the reads of the previous pass
+        self.last_read = None
+
+    def _source(self, sensor, attribute):
+        mode = ATTRIBUTES[attribute][0] if attribute in ATTRIBUTES else None
+        for source in self.sources:
+            if source.sensor is not sensor:
+                continue
+            if source.attribute == attribute:
+                return source
+            if source.mode != mode:
+                raise ValueError("{} needs mode {}, the sensor is already read in mode {} for {}".format(
+                    attribute, mode, source.mode, source.attribute))
+        source = _Source(sensor, attribute)
+        self.sources.append(source)
+        return source
+
+    def when(self, sensor, attribute, op, value, stop=(), action=None, name=None, once=True,
+             stop_action='brake'):
+        """
+        Stop the motors in ``stop`` and then call ``action(trigger)`` when
+        ``sensor.<attribute> <op> value``, op being one of < <= > >= == !=.
+
+        A trigger fires when its condition becomes true; with once=False it
+        fires again every time the condition turns true after being false.
+        """
+        source = self._source(sensor, attribute)
+        if op not in OPERATORS:
+            raise ValueError("op {} is not one of {}".format(op, sorted(OPERATORS)))
+        if name is None:
+            name = '{} {} {}'.format(attribute, op, value)
+        trigger = Trigger(name, source, OPERATORS[op], value * source.scale,
+                          [_Stop(motor, stop_action) for motor in stop], action, once)
+        self.triggers.append(trigger)
+        return trigger
+
+    def poll(self):
+        """
+        One pass: read every sensor once and fire what is met. Returns the
+        triggers that fired.
+        """
+        started = self.clock()
+        for source in self.sources:
+            source.read()
+        read = self.clock()
+        previous = self.last_read if self.last_read is not None else started
+        self.last_read = read
+        self.passes += 1
+
+        fired = []
+        for trigger in self.triggers:
+            if not trigger.armed:
+                continue
+            value = trigger.source.value
+            op = trigger.op
+            threshold = trigger.threshold
+            if op == EQ:
+                met = value == threshold
+            elif op == LT:
+                met = value < threshold
+            elif op == GT:
+                met = value > threshold
+            elif op == LE:
+                met = value <= threshold
+            elif op == GE:
+                met = value >= threshold
+            else:
+                met = value != threshold
+
+            if not met:
+                trigger.active = False
+                continue
+            if trigger.active:
+                continue
+            trigger.active = True
+            self._fire(trigger, previous, read)
+            fired.append(trigger)
+        return fired
+
+    def _fire(self, trigger, previous, read):
+        latency = self.latency
+        latency.begin(trigger.name, previous)
+        latency.mark(SLEEP, read)
+        latency.mark(SETUP)
+        for stop in trigger.stops:
+            if stop.fd is not None:
+                os.write(stop.fd, b'stop')
+            else:
+                stop.motor.stop()
+        latency.mark(WRITE)
+        latency.end()
+
+        trigger.fired += 1
+        trigger.fired_at = self.clock()
+        if trigger.once:
+            trigger.armed = False
+        if trigger.action is not None:
+            trigger.action(trigger)
+
+    def armed(self):
+        return any(trigger.armed for trigger in self.triggers)
+
+    def run(self, until=None, timeout=None):
+        """
+        Poll until every once trigger has fired, ``until()`` returns true
+        or ``timeout`` seconds passed. Returns False on a timeout.
+        """
+        scheduler = self.scheduler
+        scheduler.start()
+        self.last_read = None
+        deadline = None if timeout is None else self.clock() + timeout
+        while self.armed():
+            self.poll()
+            if until is not None and until():
+                break
+            if deadline is not None and self.clock() > deadline:
+                return False
+            scheduler.wait()
+        return True
+
+    def stats(self):
+        """
+        Times each trigger fired, how many passes ran and the loop timing
+        from the RateScheduler
+        """
+        stats = self.scheduler.stats()
+        stats['passes'] = self.passes
+        stats['fired'] = dict((trigger.name, trigger.fired) for trigger in self.triggers)
+        return stats
+
+    def close(self):
+        for source in self.sources:
+            source.close()
+        for trigger in self.triggers:
+            for stop in trigger.stops:
+                stop.close()
@@ -1,30 +1,50 @@
 #!/usr/bin/env python3
 
-import time, random
-import ev3dev-lang-python.ev3 as ev3
+import sys, time, random, _thread
+
+# Start of the startup phases, see ev3rstorm.startup
+_loaded = time.time()
+
+import ev3dev.ev3 as ev3
+
+from Frames import FrameCache
+from Futures import MotorMonitor
+from Remote import RemoteDispatcher
+from Speech import SpeechCache
+
+# Name of the cached face frame, change it when draw_face() changes
+FACE = 'face-1'
 
 random.seed( time.time() )
 
-def quote(topic):
+marvin_quotes = {
+        'initiating' : (
+            "Life? Don't talk to me about life!",
+            "Now I've got a headache.",
+            "This will all end in tears.",
+            ),
+        'depressed' : (
+            "I think you ought to know I'm feeling very depressed.",
+            "Incredible... it's even worse than I thought it would be.",
+            "I'd make a suggestion, but you wouldn't listen.",
+            ),
+        }
+
+# Synthesized clips are kept on disk, run with --warm-speech once to have
+# every quote ready
+speech = SpeechCache()
+
+def quote(topic, wait=True):
     """
     Recite a random Marvin the Paranoid Android quote on the specified topic.
     See https://en.wikipedia.org/wiki/Marvin_(character)
+    With wait=False return while Marvin is still talking, the returned
+    Playback's wait() waits for him to finish.
     """
-
-    marvin_quotes = {
-            'initiating' : (
-                "Life? Don't talk to me about life!",
-                "Now I've got a headache.",
-                "This will all end in tears.",
-                ),
-            'depressed' : (
-                "I think you ought to know I'm feeling very depressed.",
-                "Incredible... it's even worse than I thought it would be.",
-                "I'd make a suggestion, but you wouldn't listen.",
-                ),
-            }
-
-    ev3.Sound.speak(random.choice(marvin_quotes[topic])).wait()
+    playback = speech.say(random.choice(marvin_quotes[topic]))
+    if wait:
+        playback.wait()
+    return playback
 
 def check(condition, message):
     """
@@ -32,32 +52,117 @@ def check(condition, message):
     loudly complain and throw an exception otherwise.
     """
     if not condition:
-        ev3.Sound.speak(message).wait()
+        speech.say(message)
         quote('depressed')
         raise Exception(message)
 
+# Devices are connected from rc_loop() and from the warm-up thread
+_connect_lock = _thread.allocate_lock()
+
+def _lazy(connect):
+    """
+    Property that connects a device the first time it is used
+    """
+    name = '_' + connect.__name__
+    def get(self):
+        device = self.__dict__.get(name)
+        if device is None:
+            with _connect_lock:
+                device = self.__dict__.get(name)
+                if device is None:
+                    device = self.__dict__[name] = connect(self)
+        return device
+    return property(get)
+
+def _reset(motor):
+    # reset also zeroes the position
+    motor.reset()
+    motor.stop_action = 'brake'
+    return motor
+
 class ev3rstorm:
-    def __init__(self):
-        # Connect the required equipement
-        self.lm = ev3.LargeMotor('outB')
-        self.rm = ev3.LargeMotor('outC')
-        self.mm = ev3.MediumMotor()
+    def __init__(self, fast=False):
+        """
+        With fast=True only what rc_loop() needs straight away is
+        connected, the face is shown from a cached frame and Marvin talks
+        while the robot is already under control. The medium motor is
+        then connected on a background thread, so the first shot does not
+        pay for it.
+        """
+        self.startup = []
+        self._phase_start = _loaded
+        self._phase('import')
+
+        # Completes the futures of medium motor actions in the background
+        self.monitor = MotorMonitor()
+        self.shots = []
+
+        # Connect the required equipement, the rest as it is used
+        for device in (('lm', 'rm', 'ir', 'ts') if fast else ('lm', 'rm', 'mm', 'ir', 'ts', 'cs')):
+            getattr(self, device)
+        self._phase('connect')
 
-        self.ir = ev3.InfraredSensor()
-        self.ts = ev3.TouchSensor()
-        self.cs = ev3.ColorSensor()
+        if fast:
+            FrameCache().show(FACE, self.draw_face)
+        else:
+            self.draw_face()
+        self._phase('face')
 
-        self.screen = ev3.Screen()
+        quote('initiating', wait=not fast)
+        self._phase('quote')
 
-        # Reset the motors
-        for m in (self.lm, self.rm, self.mm):
-            m.reset()
-            m.position = 0
-            m.stop_action = 'brake'
+        if fast:
+            _thread.start_new_thread(self._warm, (('mm',),))
 
-        self.draw_face()
+    def _warm(self, devices):
+        for device in devices:
+            try:
+                getattr(self, device)
+            except Exception:
+                # left unconnected, the error comes back when it is used
+                pass
 
-        quote('initiating')
+    @_lazy
+    def lm(self):
+        return _reset(ev3.LargeMotor('outB'))
+
+    @_lazy
+    def rm(self):
+        return _reset(ev3.LargeMotor('outC'))
+
+    @_lazy
+    def mm(self):
+        return _reset(ev3.MediumMotor())
+
+    @_lazy
+    def ir(self):
+        return ev3.InfraredSensor()
+
+    @_lazy
+    def ts(self):
+        return ev3.TouchSensor()
+
+    @_lazy
+    def cs(self):
+        return ev3.ColorSensor()
+
+    @_lazy
+    def screen(self):
+        return ev3.Screen()
+
+    def _phase(self, name):
+        now = time.time()
+        self.startup.append((name, now - self._phase_start))
+        self._phase_start = now
+
+    def startup_report(self):
+        """
+        Seconds spent in each startup phase, from loading this module until
+        the robot was ready
+        """
+        lines = ["{:10} {:8.3f} s".format(name, seconds) for (name, seconds) in self.startup]
+        lines.append("{:10} {:8.3f} s".format('ready', sum(seconds for (name, seconds) in self.startup)))
+        return "\n".join(lines)
 
     def draw_face(self):
         w,h = self.screen.shape
@@ -80,11 +185,33 @@ class ev3rstorm:
 
     def shoot(self, direction='up'):
         """
-        Shot a ball in the specified direction (valid choices are 'up' and 'down')
+        Shot a ball in the specified direction (valid choices are 'up' and 'down').
+        Returns a MotorFuture that is done once the launcher is back in
+        position; shots asked for meanwhile are fired one after another.
         """
-        self.mm.run_to_rel_pos(speed_sp=900, position_sp=(-1080 if direction == 'up' else 1080))
-        while 'running' in self.mm.state:
-            time.sleep(0.1)
+        position = -1080 if direction == 'up' else 1080
+        future = self.monitor.submit(self.mm, lambda: self.mm.run_to_rel_pos(speed_sp=900, position_sp=position))
+        future.add_done_callback(self.shots.append)
+        return future
+
+    def shot_stats(self):
+        """
+        Shots fired, shots per minute and the reload latency in seconds:
+        from the shot being asked for until the launcher could fire again
+        (``reload``) and the part of that the motor was turning (``turn``)
+        """
+        shots = list(self.shots)
+        if not shots:
+            return {'shots': 0, 'per_minute': 0.0, 'reload_mean': 0.0, 'reload_max': 0.0, 'turn_mean': 0.0}
+        elapsed = shots[-1].finished - shots[0].submitted
+        reloads = [shot.latency for shot in shots]
+        return {
+            'shots': len(shots),
+            'per_minute': len(shots) * 60.0 / elapsed if elapsed > 0 else 0.0,
+            'reload_mean': sum(reloads) / len(reloads),
+            'reload_max': max(reloads),
+            'turn_mean': sum(shot.duration for shot in shots) / len(shots),
+        }
 
     def rc_loop(self):
         """
@@ -116,11 +243,12 @@ class ev3rstorm:
 
             return on_press
 
-        rc1 = ev3.RemoteControl(self.ir, 1)
-        rc1.on_red_up    = roll(self.lm, ev3.Leds.LEFT,   900)
-        rc1.on_red_down  = roll(self.lm, ev3.Leds.LEFT,  -900)
-        rc1.on_blue_up   = roll(self.rm, ev3.Leds.RIGHT,  900)
-        rc1.on_blue_down = roll(self.rm, ev3.Leds.RIGHT, -900)
+        # One IR read per cycle covers both channels, see Remote.py
+        remote = RemoteDispatcher(self.ir)
+        remote.on(1, 'red_up',    roll(self.lm, ev3.Leds.LEFT,   900))
+        remote.on(1, 'red_down',  roll(self.lm, ev3.Leds.LEFT,  -900))
+        remote.on(1, 'blue_up',   roll(self.rm, ev3.Leds.RIGHT,  900))
+        remote.on(1, 'blue_down', roll(self.rm, ev3.Leds.RIGHT, -900))
 
 
         def shoot(direction):
@@ -128,20 +256,29 @@ class ev3rstorm:
                 if state: self.shoot(direction)
             return on_press
 
-        rc2 = ev3.RemoteControl(self.ir, 2)
-        rc2.on_red_up    = shoot('up')
-        rc2.on_blue_up   = shoot('up')
-        rc2.on_red_down  = shoot('down')
-        rc2.on_blue_down = shoot('down')
+        # shoot() returns as soon as the motor is started, driving goes on
+        # while the ball is fired
+        remote.on(2, 'red_up',    shoot('up'))
+        remote.on(2, 'blue_up',   shoot('up'))
+        remote.on(2, 'red_down',  shoot('down'))
+        remote.on(2, 'blue_down', shoot('down'))
 
         # Now that the event handlers are assigned,
         # lets enter the processing loop:
-        while not self.ts.is_pressed:
-            rc1.process()
-            rc2.process()
-            time.sleep(0.1)
+        remote.run(lambda: self.ts.is_pressed)
+
+        self.remote_stats = remote.stats()
+        print("remote: {cycles} reads, {events} events, input to motor p50 {dispatch_p50:.4f} s "
+              "max {dispatch_max:.4f} s, unseen for up to {sample_max:.4f} s".format(**self.remote_stats))
+        print("shots: {shots}, {per_minute:.1f} per minute, reload mean {reload_mean:.2f} s "
+              "max {reload_max:.2f} s".format(**self.shot_stats()))
 
 
 if __name__ == '__main__':
-    Marvin = ev3rstorm()
-    Marvin.rc_loop()
\ No newline at end of file
+    if '--warm-speech' in sys.argv:
+        print("synthesized {} quotes".format(speech.warm(marvin_quotes)))
+        sys.exit(0)
+
+    Marvin = ev3rstorm(fast='--slow-start' not in sys.argv)
+    print(Marvin.startup_report())
+    Marvin.rc_loop()
@@ -0,0 +1,75 @@
+from Encoders import EncoderPair
+
+
+class FakeClock:
+    """
+    Advances by ``step`` seconds on every reading
+    """
+    def __init__(self, step=0.001):
+        self.now = 0.0
+        self.step = step
+
+    def __call__(self):
+        self.now += self.step
+        return self.now
+
+
+def write_position(path, value):
+    with open(path, 'w') as f:
+        f.write('%-15d\n' % value)
+
+
+def make_pair(tmp_path, left, right, clock=None):
+    for name, value in (('motor0', left), ('motor1', right)):
+        (tmp_path / name).mkdir()
+        write_position(str(tmp_path / name / 'position'), value)
+    kwargs = {} if clock is None else {'clock': clock}
+    return EncoderPair(str(tmp_path / 'motor0' / 'position'), str(tmp_path / 'motor1' / 'position'), **kwargs)
+
+
+def test_read_returns_both_counts(tmp_path):
+    pair = make_pair(tmp_path, 120, -45)
+    try:
+        t, left, right = pair.read()
+        assert (left, right) == (120, -45)
+    finally:
+        pair.close()
+
+
+def test_read_sees_updates_without_reopening(tmp_path):
+    pair = make_pair(tmp_path, 0, 0)
+    try:
+        pair.read()
+        write_position(str(tmp_path / 'motor0' / 'position'), 361)
+        write_position(str(tmp_path / 'motor1' / 'position'), -7)
+        assert pair.read()[1:] == (361, -7)
+    finally:
+        pair.close()
+
+
+def test_timestamp_is_middle_of_read_window(tmp_path):
+    pair = make_pair(tmp_path, 1, 2, clock=FakeClock(0.001))
+    try:
+        t, left, right = pair.read()
+        # start and end readings are 0.001 and 0.002
+        assert abs(t - 0.0015) < 1e-9
+    finally:
+        pair.close()
+
+
+def test_skew_stats(tmp_path):
+    pair = make_pair(tmp_path, 1, 2, clock=FakeClock(0.002))
+    try:
+        assert pair.skew_stats() == {'samples': 0, 'last': 0.0, 'max': 0.0, 'mean': 0.0}
+        for i in range(3):
+            pair.read()
+        stats = pair.skew_stats()
+        assert stats['samples'] == 3
+        assert abs(stats['last'] - 0.002) < 1e-9
+        assert abs(stats['max'] - 0.002) < 1e-9
+        assert abs(stats['mean'] - 0.002) < 1e-9
+
+        pair.reset_stats()
+        assert pair.skew_stats()['samples'] == 0
+    finally:
+        pair.close()
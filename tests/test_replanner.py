@@ -0,0 +1,53 @@
+import random
+
+from Field import Field, FREE
+from Replanner import DStarLite
+
+START = (200, 100)
+GOAL = (200, 500)
+
+
+def make_field():
+    return Field(height=60, robot_radius_mm=60)
+
+
+def test_inflated_start_cell_can_be_left():
+    field = make_field()
+    route = DStarLite(field, START, GOAL)
+    assert route.plan() is not None
+
+    # close enough to inflate the robot's own cell, not to block it
+    waypoints = route.add_hits([(START[0] + 58, START[1])])
+    start = field.cell(*START)
+    assert field.grid[start[1] * field.cols + start[0]] != FREE
+    assert field.plan_cells(start, field.cell(*GOAL)) is not None
+    assert waypoints is not None
+
+    assert DStarLite(field, START, GOAL).plan() is not None
+
+
+def test_moving_onto_an_inflated_cell():
+    field = make_field()
+    route = DStarLite(field, START, GOAL)
+    route.plan()
+    field.mark_hits([(START[0] + 58, START[1] + 200)])
+    route.update()
+
+    pose = (START[0], START[1] + 200)
+    route.move_to(*pose)
+    assert route.plan() is not None
+
+
+def test_agrees_with_plan_cells_near_the_pose():
+    rng = random.Random(1)
+    for trial in range(50):
+        field = make_field()
+        route = DStarLite(field, START, GOAL)
+        route.plan()
+        pose = START
+        for step in range(5):
+            hit = (pose[0] + rng.uniform(-120, 120), pose[1] + rng.uniform(-120, 120))
+            waypoints = route.add_hits([hit], pose=pose)
+            expected = field.plan_cells(field.cell(*pose), field.cell(*GOAL))
+            assert (waypoints is None) == (expected is None), (trial, step, hit)
+            pose = (pose[0], pose[1] + 40)
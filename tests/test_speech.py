@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+from Speech import SpeechCache, silence
+
+# silence() clips are a bare 44 byte wav header, this fits two of them
+TWO_CLIPS = 100
+
+
+def make_cache(tmp_path, played=None, synthesize=silence, max_bytes=1024 * 1024):
+    play = played.append if played is not None else (lambda path: None)
+    return SpeechCache(str(tmp_path / 'speech'), max_bytes, synthesize=synthesize, play=play)
+
+
+def test_hits_and_misses(tmp_path):
+    cache = make_cache(tmp_path)
+    assert cache.warm({'initiating': ("Life?", "Headache.")}) == 2
+    assert (cache.hits, cache.misses) == (0, 2)
+
+    assert cache.warm(["Life?", "Headache."]) == 0
+    assert (cache.hits, cache.misses) == (2, 2)
+
+    # the voice is part of the key
+    cache.clip("Life?", voice='-s 100')
+    assert cache.misses == 3
+
+
+def test_least_recently_used_clip_is_evicted(tmp_path):
+    cache = make_cache(tmp_path, max_bytes=TWO_CLIPS)
+    first = cache.clip("first")
+    second = cache.clip("second")
+    os.utime(first, (1000, 1000))
+    os.utime(second, (2000, 2000))
+
+    # using the first clip makes the second the oldest
+    assert cache.clip("first") == first
+    third = cache.clip("third")
+
+    assert os.path.exists(first)
+    assert not os.path.exists(second)
+    assert os.path.exists(third)
+
+
+def test_say_plays_in_order(tmp_path):
+    played = []
+    cache = make_cache(tmp_path, played)
+    texts = ["one", "two", "three", "four"]
+    playbacks = [cache.say(text) for text in texts]
+    playbacks[-1].wait()
+
+    assert all(playback.done() for playback in playbacks)
+    assert played == [cache.path(text) for text in texts]
+
+
+def test_wait_raises_synthesis_errors(tmp_path):
+    def synthesize(text, voice, path):
+        if text == "bad":
+            raise RuntimeError("no voice")
+        silence(text, voice, path)
+
+    played = []
+    cache = make_cache(tmp_path, played, synthesize)
+    bad = cache.say("bad")
+    good = cache.say("good")
+
+    with pytest.raises(RuntimeError):
+        bad.wait()
+    good.wait()
+    assert played == [cache.path("good")]
+    assert not os.path.exists(cache.path("bad"))